@@ -1,8 +1,18 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import asyncio
 import httpx
+import json
 import logging
-from typing import Optional, Any, List, Tuple
+from hashlib import sha256
+from typing import Optional, Any, Dict, List, Tuple
+from urllib.parse import urlencode
+
+from app.core.config import settings
+from app.core.token_cache import TokenCache
+from app.services.base_external_service import ExternalService
+from app.services.abtasty_mirror import abtasty_mirror, FetchResult
 
 # Configuration du logger
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +30,16 @@ test_details_url = "https://api.abtasty.com/api/v1/accounts/{account_id}/tests/{
 # URL pour récupérer les variations d'un test
 test_variations_url = "https://api.abtasty.com/api/core/accounts/{account_id}/tests/{test_id}/variations"
 
+# Appels AB Tasty: pool partagé, nouvelles tentatives des GET, disjoncteur et éventuelles requêtes de couverture
+abtasty_client = ExternalService(
+    "abtasty",
+    timeout=settings.ABTASTY_REQUEST_TIMEOUT,
+    hedge_delay=settings.ABTASTY_HEDGE_DELAY
+)
+
+# Tokens OAuth réutilisés jusqu'à leur expiration (un aller-retour d'authentification évité par appel)
+token_cache = TokenCache("abtasty")
+
 class ABTastyCredentials(BaseModel):
     client_id: str
     client_secret: str
@@ -30,10 +50,11 @@ class ABTastyTestRequest(ABTastyCredentials):
     page: Optional[int] = 1
     per_page: Optional[int] = 50
 
-async def get_auth_token(client_id: str, client_secret: str) -> Optional[str]:
+async def fetch_auth_token(client_id: str, client_secret: str) -> Optional[Tuple[str, Optional[float]]]:
     """
-    Récupère un token OAuth2 (grant_type=client_credentials).
+    Demande un token OAuth2 (grant_type=client_credentials).
     Envoie un JSON avec grant_type, client_id et client_secret.
+    Retourne (access_token, expires_in) ou None.
     """
     headers = {
         "Content-Type": "application/json",
@@ -47,18 +68,107 @@ async def get_auth_token(client_id: str, client_secret: str) -> Optional[str]:
     }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(auth_url, json=json_body, headers=headers)
+        # Demande de token sans effet de bord: relancée comme un appel idempotent
+        resp = await abtasty_client.request("POST", auth_url, idempotent=True, json=json_body, headers=headers)
 
         logger.info(f"[Auth] {resp.status_code} / Req CT: {resp.request.headers.get('Content-Type')}")
         if resp.status_code != 200:
             logger.error(f"[Auth] échec {resp.status_code}: {resp.text}")
             return None
-        return resp.json().get("access_token")
+        data = resp.json()
+        if not data.get("access_token"):
+            return None
+        return data["access_token"], data.get("expires_in")
     except Exception as e:
         logger.exception(f"[Auth] exception: {e}")
         return None
 
+async def get_auth_token(client_id: str, client_secret: str) -> Optional[str]:
+    """
+    Retourne un token OAuth2 valide pour ces credentials (cache, sinon nouvelle demande).
+    """
+    return await token_cache.get(client_id, client_secret, lambda: fetch_auth_token(client_id, client_secret))
+
+async def get_with_token(
+    url: str,
+    headers: Dict[str, str],
+    client_id: str,
+    client_secret: str,
+    params: Optional[Dict[str, str]] = None
+) -> httpx.Response:
+    """
+    GET authentifié via le client partagé. Si le token en cache est refusé (401),
+    il est oublié et la requête est relancée une fois avec un nouveau token.
+    """
+    resp = await abtasty_client.request("GET", url, headers=headers, params=params)
+    if resp.status_code == 401:
+        logger.info("[Auth] token refusé, renouvellement")
+        await token_cache.invalidate(client_id, client_secret)
+        token = await get_auth_token(client_id, client_secret)
+        if token:
+            resp = await abtasty_client.request("GET", url, headers={**headers, "Authorization": f"Bearer {token}"}, params=params)
+    return resp
+
+def mirror_key(client_id: str, client_secret: str, url: str, params: Optional[Dict[str, str]] = None) -> str:
+    """
+    Clé d'une réponse dans le miroir: empreinte des credentials (jamais les credentials), URL et paramètres
+    """
+    credentials = sha256(f"{client_id}:{client_secret}".encode()).hexdigest()[:16]
+    return f"{credentials}:{url}?{urlencode(sorted((params or {}).items()))}"
+
+async def fetch_json(
+    url: str,
+    headers: Dict[str, str],
+    client_id: str,
+    client_secret: str,
+    params: Optional[Dict[str, str]] = None,
+    version: Optional[str] = None,
+    max_age: Optional[float] = None,
+    background: bool = True
+) -> Any:
+    """
+    GET authentifié retournant le JSON; lève HTTPException si AB Tasty répond une erreur.
+    Avec ABTASTY_MIRROR_ENABLED, la réponse est servie par le miroir local et revalidée
+    par une requête conditionnelle (If-None-Match / If-Modified-Since) à l'expiration.
+    """
+    async def conditional_fetch(etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        request_headers = dict(headers)
+        # Token courant du cache: une requête relancée plus tard (revalidation, rafraîchissement) n'utilise pas un token expiré
+        token = await get_auth_token(client_id, client_secret)
+        if token:
+            request_headers["Authorization"] = f"Bearer {token}"
+        if etag:
+            request_headers["If-None-Match"] = etag
+        if last_modified:
+            request_headers["If-Modified-Since"] = last_modified
+        resp = await get_with_token(url, request_headers, client_id, client_secret, params=params)
+        logger.info(f"[AB Tasty] GET {resp.url} -> {resp.status_code}")
+        if resp.status_code == 304:
+            return FetchResult(status=304)
+        if resp.status_code != 200:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return FetchResult(200, resp.json(), resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+
+    if not settings.ABTASTY_MIRROR_ENABLED:
+        return (await conditional_fetch()).data
+    return await abtasty_mirror.get(
+        mirror_key(client_id, client_secret, url, params),
+        conditional_fetch,
+        version=version,
+        max_age=max_age,
+        background=background
+    )
+
+def _test_version(test: dict) -> Optional[str]:
+    """
+    Date de modification d'un test dans la liste (None si l'API ne la fournit pas):
+    tant qu'elle ne change pas, ses détails et variations du miroir restent valables
+    """
+    for field in ("last_update", "modification_date", "updated_at", "last_modified"):
+        if test.get(field):
+            return str(test[field])
+    return None
+
 @router.post("/verify", summary="Vérifie les credentials AB Tasty")
 async def verify(credentials: ABTastyCredentials) -> dict:
     """
@@ -127,22 +237,23 @@ async def list_tests(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(url, headers=headers, params=filter_params)
-
-        logger.info(f"[Tests] GET {resp.url} -> {resp.status_code}")
-        if resp.status_code != 200:
-            error_detail = f"Failed to fetch tests: {resp.text}"
-            logger.error(f"[Tests] échec {resp.status_code}: {resp.text}")
-            raise HTTPException(status_code=resp.status_code, detail=error_detail)
-
-        response_data = resp.json()
+        response_data = await fetch_json(url, headers, client_id, client_secret, params=filter_params)
         items = response_data.get("_embedded", {}).get("items", [])
         items_count = len(items)
             
         logger.info(f"[Tests] {items_count} tests récupérés")
+
+        if settings.ABTASTY_MIRROR_ENABLED:
+            # Page consultée: tenue à jour en arrière-plan tant que le compte reste actif
+            abtasty_mirror.register_refresher(
+                mirror_key(client_id, client_secret, url, filter_params),
+                lambda: fetch_json(url, headers, client_id, client_secret, params=filter_params, max_age=0, background=False)
+            )
         
         return response_data
+    except HTTPException as e:
+        logger.error(f"[Tests] échec {e.status_code}: {e.detail}")
+        raise
     except Exception as e:
         logger.exception(f"[Tests] exception: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -183,19 +294,13 @@ async def test_details(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(url, headers=headers)
-
-        logger.info(f"[Test Details] GET {resp.url} -> {resp.status_code}")
-        if resp.status_code != 200:
-            error_detail = f"Failed to fetch test details: {resp.text}"
-            logger.error(f"[Test Details] échec {resp.status_code}: {resp.text}")
-            raise HTTPException(status_code=resp.status_code, detail=error_detail)
-
-        response_data = resp.json()
+        response_data = await fetch_json(url, headers, client_id, client_secret)
         logger.info(f"[Test Details] Détails récupérés pour le test {test_id}")
         
         return response_data
+    except HTTPException as e:
+        logger.error(f"[Test Details] échec {e.status_code}: {e.detail}")
+        raise
     except Exception as e:
         logger.exception(f"[Test Details] exception: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -236,19 +341,173 @@ async def test_variations(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(url, headers=headers)
-
-        logger.info(f"[Test Variations] GET {resp.url} -> {resp.status_code}")
-        if resp.status_code != 200:
-            error_detail = f"Failed to fetch test variations: {resp.text}"
-            logger.error(f"[Test Variations] échec {resp.status_code}: {resp.text}")
-            raise HTTPException(status_code=resp.status_code, detail=error_detail)
-
-        response_data = resp.json()
+        response_data = await fetch_json(url, headers, client_id, client_secret)
         logger.info(f"[Test Variations] Variations récupérées pour le test {test_id}")
         
         return response_data
+    except HTTPException as e:
+        logger.error(f"[Test Variations] échec {e.status_code}: {e.detail}")
+        raise
     except Exception as e:
         logger.exception(f"[Test Variations] exception: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def fetch_all_tests(client_id: str, client_secret: str, account_id: str, status_int: int, per_page: int, headers: Dict[str, str], refresh: bool = False) -> List[dict]:
+    """
+    Récupère tous les tests du compte en suivant la pagination (_page), dans la limite de ABTASTY_SNAPSHOT_MAX_PAGES pages.
+    refresh: pages revalidées auprès d'AB Tasty même si le miroir les a encore en fraîcheur.
+    """
+    url = core_tests_url.format(account_id=account_id)
+    items: List[dict] = []
+    for page in range(1, settings.ABTASTY_SNAPSHOT_MAX_PAGES + 1):
+        params = {
+            "filter[active]": str(status_int),
+            "_page": str(page),
+            "_max_per_page": str(per_page)
+        }
+        if refresh:
+            data = await fetch_json(url, headers, client_id, client_secret, params=params, max_age=0, background=False)
+        else:
+            data = await fetch_json(url, headers, client_id, client_secret, params=params)
+        page_items = data.get("_embedded", {}).get("items", [])
+        items.extend(page_items)
+        # Dernière page: incomplète, ou sans lien "next" quand l'API en fournit
+        links = data.get("_links")
+        if len(page_items) < per_page or (isinstance(links, dict) and "next" not in links):
+            break
+    else:
+        logger.warning(f"[Snapshot] pagination arrêtée après {settings.ABTASTY_SNAPSHOT_MAX_PAGES} pages")
+    return items
+
+async def fetch_test_snapshot(test: dict, account_id: str, client_id: str, client_secret: str, headers: Dict[str, str], semaphore: asyncio.Semaphore, refresh: bool = False) -> dict:
+    """
+    Détails et variations d'un test, récupérés en parallèle. Une erreur sur un test
+    est reportée dans son entrée ("errors") sans interrompre le reste du snapshot.
+    Avec le miroir, un test dont la date de modification n'a pas changé n'est pas retéléchargé.
+    """
+    test_id = test.get("id")
+    version = _test_version(test)
+    details_headers = {**headers, "Accept-Language": "false"}
+
+    async def fetch(label: str, url: str, request_headers: Dict[str, str]):
+        async with semaphore:
+            try:
+                data = await fetch_json(url, request_headers, client_id, client_secret, version=version, background=not refresh)
+                return label, data, None
+            except HTTPException as e:
+                return label, None, f"{e.status_code}: {e.detail}"
+            except Exception as e:
+                return label, None, str(e)
+
+    results = await asyncio.gather(
+        fetch("details", test_details_url.format(account_id=account_id, test_id=test_id), details_headers),
+        fetch("variations", test_variations_url.format(account_id=account_id, test_id=test_id), headers)
+    )
+    snapshot = {"id": test_id, "test": test}
+    errors = {}
+    for label, data, error in results:
+        snapshot[label] = data
+        if error:
+            errors[label] = error
+    if errors:
+        snapshot["errors"] = errors
+    return snapshot
+
+@router.get("/tests/snapshot", summary="Tests AB Tasty avec détails et variations en un seul appel")
+async def tests_snapshot(
+    client_id: str,
+    client_secret: str,
+    account_id: str,
+    status: Optional[str] = "1",
+    per_page: Optional[int] = 50,
+    format: Optional[str] = "json"
+) -> Any:
+    """
+    Liste les tests du compte (toutes les pages), puis récupère les détails et les
+    variations de chaque test en parallèle (au plus ABTASTY_SNAPSHOT_CONCURRENCY
+    requêtes simultanées, un seul token et un client partagé).
+
+    Query params:
+      - client_id, client_secret, account_id: comme /tests
+      - status: 1 pour actifs, 0 pour inactifs
+      - per_page: éléments par page lors de la pagination
+      - format: "json" (document fusionné) ou "ndjson" (une ligne par test, dès qu'il est prêt)
+    """
+    try:
+        status_int = int(status) if status is not None else 1
+    except ValueError:
+        status_int = 1
+
+    token = await get_auth_token(client_id, client_secret)
+    if not token:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "User-Agent": "EasyABTest/1.0"
+    }
+
+    try:
+        tests = await fetch_all_tests(client_id, client_secret, account_id, status_int, per_page, headers)
+    except HTTPException as e:
+        logger.error(f"[Snapshot] échec de la liste des tests {e.status_code}: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=f"Failed to fetch tests: {e.detail}")
+    logger.info(f"[Snapshot] {len(tests)} tests, récupération des détails et variations")
+
+    semaphore = asyncio.Semaphore(settings.ABTASTY_SNAPSHOT_CONCURRENCY)
+    jobs = [fetch_test_snapshot(test, account_id, client_id, client_secret, headers, semaphore) for test in tests]
+
+    if settings.ABTASTY_MIRROR_ENABLED:
+        async def refresh_snapshot():
+            # Liste revalidée, puis seulement les tests dont la date de modification a changé
+            fresh_tests = await fetch_all_tests(client_id, client_secret, account_id, status_int, per_page, headers, refresh=True)
+            refresh_semaphore = asyncio.Semaphore(settings.ABTASTY_SNAPSHOT_CONCURRENCY)
+            await asyncio.gather(*(
+                fetch_test_snapshot(test, account_id, client_id, client_secret, headers, refresh_semaphore, refresh=True)
+                for test in fresh_tests
+            ))
+
+        snapshot_params = {"filter[active]": str(status_int), "_max_per_page": str(per_page), "snapshot": "1"}
+        abtasty_mirror.register_refresher(
+            mirror_key(client_id, client_secret, core_tests_url.format(account_id=account_id), snapshot_params),
+            refresh_snapshot
+        )
+
+    if format == "ndjson":
+        async def line_generator():
+            tasks = [asyncio.ensure_future(job) for job in jobs]
+            try:
+                yield json.dumps({"type": "summary", "account_id": account_id, "count": len(tests)}) + "\n"
+                for task in asyncio.as_completed(tasks):
+                    yield json.dumps({"type": "test", **(await task)}) + "\n"
+                yield json.dumps({"type": "done"}) + "\n"
+            finally:
+                # Client déconnecté: les requêtes restantes sont abandonnées
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(line_generator(), media_type="application/x-ndjson")
+
+    snapshots = await asyncio.gather(*jobs)
+    return {
+        "account_id": account_id,
+        "count": len(snapshots),
+        "errors": sum(1 for snapshot in snapshots if "errors" in snapshot),
+        "tests": snapshots
+    }
+
+@router.get("/mirror-stats", summary="Statistiques du miroir local AB Tasty")
+async def mirror_stats() -> dict:
+    """
+    Retourne les statistiques du miroir (réponses servies localement, revalidations, 304, comptes rafraîchis).
+    """
+    return abtasty_mirror.get_stats()
+
+@router.get("/token-stats", summary="Statistiques du cache des tokens AB Tasty")
+async def token_stats() -> dict:
+    """
+    Retourne les statistiques du cache des tokens OAuth (hits, renouvellements, échecs).
+    """
+    return token_cache.get_stats()
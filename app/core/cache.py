@@ -1,27 +1,42 @@
 from cachetools import TTLCache
 from hashlib import sha256
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import timedelta
-import redis
 import time
 
-from app.core.config import settings
+from loguru import logger
+
+from app.core.redis_client import redis_async, redis_breaker
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.metrics import registry, CACHE_EVENTS, CACHE_LOOKUP_SECONDS, CACHE_TIME_SAVED
 from app.routers.hypothesis.models import HypothesisResponse
 
+try:
+    import orjson
+    
+    def encode_response(response: HypothesisResponse) -> bytes:
+        return orjson.dumps(response.model_dump())
+    
+    decode_payload = orjson.loads
+except ImportError:  # orjson absent: JSON compact de la bibliothèque standard
+    def encode_response(response: HypothesisResponse) -> bytes:
+        return json.dumps(response.model_dump(), separators=(",", ":")).encode()
+    
+    decode_payload = json.loads
+
 # Cache mémoire pour requêtes fréquentes (max 1000 entrées, 15 min)
 memory_cache = TTLCache(maxsize=1000, ttl=900)
 
-# Cache persistant Redis pour stockage long terme
-redis_cache = redis.Redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
-
-# Statistiques sur le cache
-cache_stats = {
-    "memory_hits": 0,
-    "redis_hits": 0,
-    "misses": 0,
-    "stores": 0,
-    "request_time_saved": 0  # en secondes
+# Événements comptés (métrique cache_events_total, cache="hypothesis")
+CACHE_NAME = "hypothesis"
+CACHE_STAT_EVENTS = {
+    "memory_hits": "memory_hit",
+    "redis_hits": "redis_hit",
+    "misses": "miss",
+    "stores": "store",
+    "redis_errors": "redis_error",
+    "redis_skipped": "redis_skipped"  # accès Redis évités (circuit ouvert)
 }
 
 def generate_cache_key(messages: list, model: str, max_tokens: int = 1024, temperature: float = 0.7) -> str:
@@ -36,70 +51,121 @@ def generate_cache_key(messages: list, model: str, max_tokens: int = 1024, tempe
     }
     return sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
 
-def get_cached_response(cache_key: str) -> Optional[HypothesisResponse]:
+def _decode_response(cache_key: str, redis_data: bytes) -> Optional[HypothesisResponse]:
     """
-    Récupère une réponse du cache (mémoire puis Redis)
+    Désérialise une réponse lue dans Redis et la place dans le cache mémoire
     """
-    global cache_stats
+    try:
+        response_dict = decode_payload(redis_data)
     
-    # Vérifier le cache mémoire
-    if cache_key in memory_cache:
-        cache_stats["memory_hits"] += 1
-        print(f"Cache hit (memory): {cache_key[:8]}... | Stats: {cache_stats}")
-        return memory_cache[cache_key]
+        # Calculer le temps économisé (différence entre maintenant et timestamp de création)
+        if "timestamp" in response_dict:
+            time_saved = time.time() - response_dict["timestamp"]
+            CACHE_TIME_SAVED.inc(time_saved, cache=CACHE_NAME)
     
-    # Vérifier le cache Redis
-    if redis_cache:
-        redis_data = redis_cache.get(cache_key)
+        response = HypothesisResponse(**response_dict)
+        memory_cache[cache_key] = response  # Mise à jour cache mémoire
+        return response
+    except Exception as e:
+        logger.warning(f"Error deserializing Redis cache: {e}")
+        return None
+
+async def _redis_call(fn, *args, **kwargs):
+    """
+    Appel Redis à travers le disjoncteur; None si Redis est indisponible ou en erreur
+    """
+    try:
+        return await redis_breaker.call(fn, *args, **kwargs)
+    except CircuitOpenError:
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="redis_skipped")
+    except Exception as e:
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="redis_error")
+        logger.warning(f"Redis error: {e}")
+    return None
+
+async def get_cached_response(cache_key: str) -> Optional[HypothesisResponse]:
+    """
+    Récupère une réponse du cache (mémoire puis Redis)
+    """
+    with CACHE_LOOKUP_SECONDS.time(cache=CACHE_NAME):
+        # Vérifier le cache mémoire
+        if cache_key in memory_cache:
+            CACHE_EVENTS.inc(cache=CACHE_NAME, event="memory_hit")
+            return memory_cache[cache_key]
+        
+        # Vérifier le cache Redis (non bloquant, limité par le délai du socket)
+        redis_data = await _redis_call(redis_async.get, cache_key) if redis_async else None
         if redis_data:
-            cache_stats["redis_hits"] += 1
-            print(f"Cache hit (Redis): {cache_key[:8]}... | Stats: {cache_stats}")
-            try:
-                response_dict = json.loads(redis_data)
-                
-                # Calculer le temps économisé (différence entre maintenant et timestamp de création)
-                if "timestamp" in response_dict:
-                    time_saved = time.time() - response_dict["timestamp"]
-                    cache_stats["request_time_saved"] += time_saved
-                
-                response = HypothesisResponse(**response_dict)
-                memory_cache[cache_key] = response  # Mise à jour cache mémoire
+            response = _decode_response(cache_key, redis_data)
+            if response:
+                CACHE_EVENTS.inc(cache=CACHE_NAME, event="redis_hit")
                 return response
-            except Exception as e:
-                print(f"Error deserializing Redis cache: {e}")
-    
-    cache_stats["misses"] += 1
-    print(f"Cache miss: {cache_key[:8]}... | Stats: {cache_stats}")
-    return None
+        
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="miss")
+        return None
+
+async def get_cached_responses(cache_keys: List[str], count_stats: bool = True) -> Dict[str, HypothesisResponse]:
+    """
+    Récupère plusieurs réponses: cache mémoire, puis un seul MGET Redis pour les clés manquantes.
+    count_stats=False pour les lectures internes (préchauffage) qui ne doivent pas fausser le taux de hits.
+    """
+    with CACHE_LOOKUP_SECONDS.time(cache=CACHE_NAME):
+        found = {key: memory_cache[key] for key in cache_keys if key in memory_cache}
+        if count_stats:
+            CACHE_EVENTS.inc(len(found), cache=CACHE_NAME, event="memory_hit")
+        
+        missing = [key for key in cache_keys if key not in found]
+        if missing and redis_async:
+            values = await _redis_call(redis_async.mget, missing) or []
+            for key, redis_data in zip(missing, values):
+                if redis_data:
+                    response = _decode_response(key, redis_data)
+                    if response:
+                        if count_stats:
+                            CACHE_EVENTS.inc(cache=CACHE_NAME, event="redis_hit")
+                        found[key] = response
+        
+        if count_stats:
+            CACHE_EVENTS.inc(len(cache_keys) - len(found), cache=CACHE_NAME, event="miss")
+        return found
 
-def cache_response(cache_key: str, response: HypothesisResponse, ttl_hours: int = 24):
+async def cache_response(cache_key: str, response: HypothesisResponse, ttl_hours: int = 24):
     """
     Stocke une réponse dans le cache (mémoire et Redis)
     """
-    global cache_stats
-    cache_stats["stores"] += 1
+    await cache_responses({cache_key: response}, ttl_hours)
+
+async def cache_responses(responses: Dict[str, HypothesisResponse], ttl_hours: int = 24):
+    """
+    Stocke plusieurs réponses: écritures Redis regroupées en un seul aller-retour (pipeline)
+    """
+    CACHE_EVENTS.inc(len(responses), cache=CACHE_NAME, event="store")
     
     # Cache mémoire
-    memory_cache[cache_key] = response
+    memory_cache.update(responses)
     
     # Cache Redis (si disponible)
-    if redis_cache:
-        try:
-            # Convertir Pydantic model en dictionnaire
-            response_dict = response.dict()
-            redis_cache.setex(
-                cache_key,
-                timedelta(hours=ttl_hours),
-                json.dumps(response_dict)
-            )
-            print(f"Response cached with key: {cache_key[:8]}... | Stats: {cache_stats}")
-        except Exception as e:
-            print(f"Error caching response in Redis: {e}")
+    if redis_async and responses:
+        async def write_pipeline():
+            async with redis_async.pipeline(transaction=False) as pipe:
+                for cache_key, response in responses.items():
+                    pipe.setex(cache_key, timedelta(hours=ttl_hours), encode_response(response))
+                return await pipe.execute()
+        
+        await _redis_call(write_pipeline)
 
 def get_cache_stats() -> Dict[str, Any]:
     """
-    Retourne les statistiques d'utilisation du cache
+    Retourne les statistiques d'utilisation du cache (tous workers, d'après les métriques)
     """
+    values = registry.aggregate()
+    counts = values[CACHE_EVENTS.name]
+    cache_stats = {
+        stat: counts.get((CACHE_NAME, event), 0)
+        for stat, event in CACHE_STAT_EVENTS.items()
+    }
+    cache_stats["request_time_saved"] = values[CACHE_TIME_SAVED.name].get((CACHE_NAME,), 0)  # en secondes
+    
     total_hits = cache_stats["memory_hits"] + cache_stats["redis_hits"]
     total_requests = total_hits + cache_stats["misses"]
     
@@ -115,5 +181,6 @@ def get_cache_stats() -> Dict[str, Any]:
         "hit_rate_percent": round(hit_rate, 2),
         "memory_cache_size": len(memory_cache),
         "memory_cache_maxsize": memory_cache.maxsize,
-        "redis_available": redis_cache is not None
-    } 
\ No newline at end of file
+        "redis_available": redis_async is not None,
+        "redis_circuit": redis_breaker.get_stats()
+    }
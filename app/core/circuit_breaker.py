@@ -0,0 +1,103 @@
+"""
+Disjoncteur (circuit breaker) pour les dépendances réseau.
+
+Après un nombre d'échecs consécutifs, le circuit s'ouvre : les appels sont
+refusés immédiatement pendant reset_timeout secondes au lieu d'attendre un
+service lent ou indisponible. Un seul appel d'essai est ensuite autorisé
+(demi-ouvert) : s'il réussit le circuit se referme, sinon il se rouvre.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from loguru import logger
+
+
+class CircuitOpenError(Exception):
+    """Appel refusé: le circuit est ouvert"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur à trois états: closed, open, half_open
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {
+            "failures": 0,
+            "rejections": 0,
+            "opens": 0
+        }
+
+    def allow(self) -> bool:
+        """Indique si un appel peut être tenté maintenant"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.stats["rejections"] += 1
+                return False
+            self.state = "half_open"
+
+        if self.state == "half_open":
+            # Un seul appel d'essai à la fois
+            if self._probe_in_flight:
+                self.stats["rejections"] += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit {self.name} closed")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """Appel abandonné (annulé): ni échec ni succès, mais l'essai éventuel est libéré"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opens"] += 1
+                logger.warning(f"Circuit {self.name} open for {self.reset_timeout}s after {self.consecutive_failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Exécute fn(*args, **kwargs) à travers le disjoncteur.
+        Lève CircuitOpenError si le circuit est ouvert.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Annulation (client déconnecté)
+            self.release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures
+        }
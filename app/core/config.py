@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import Dict, List
 from functools import lru_cache
 import os
 from dotenv import load_dotenv
@@ -31,6 +31,29 @@ class Settings(BaseSettings):
     DEFAULT_PRIOR_ALPHA: float = 0.5  # Jeffreys prior
     DEFAULT_PRIOR_BETA: float = 0.5  # Jeffreys prior
 
+    # Pool de processus pour les calculs lourds (0 worker = calcul dans la boucle d'événements)
+    ESTIMATE_POOL_WORKERS: int = int(os.getenv("ESTIMATE_POOL_WORKERS", "2"))
+    ESTIMATE_POOL_MAX_QUEUE: int = int(os.getenv("ESTIMATE_POOL_MAX_QUEUE", "8"))
+    ESTIMATE_JOB_TIMEOUT: float = float(os.getenv("ESTIMATE_JOB_TIMEOUT", "30"))
+
+    # Threads des simulations Monte Carlo parallèles (1 = séquentiel)
+    MONTECARLO_THREADS: int = int(os.getenv("MONTECARLO_THREADS", str(min(4, os.cpu_count() or 1))))
+
+    # Nombre maximal de scénarios par appel à /estimate/batch
+    ESTIMATE_BATCH_MAX_SCENARIOS: int = int(os.getenv("ESTIMATE_BATCH_MAX_SCENARIOS", "20000"))
+
+    # Tables précalculées de tailles d'échantillon (générées par python -m app.services.lookup_tables)
+    LOOKUP_TABLES_DIR: str = os.getenv(
+        "LOOKUP_TABLES_DIR",
+        os.path.join(os.path.dirname(__file__), os.pardir, "data", "lookup")
+    )
+
+    # Import CSV: taille des blocs lus, jeux de données agrégés conservés en mémoire (nombre, durée en secondes)
+    IMPORT_CHUNK_SIZE: int = int(os.getenv("IMPORT_CHUNK_SIZE", str(1024 * 1024)))
+    IMPORT_MAX_RECORD_SIZE: int = int(os.getenv("IMPORT_MAX_RECORD_SIZE", str(1024 * 1024)))  # caractères, au-delà: CSV mal formé
+    IMPORT_MAX_DATASETS: int = int(os.getenv("IMPORT_MAX_DATASETS", "100"))
+    IMPORT_DATASET_TTL: float = float(os.getenv("IMPORT_DATASET_TTL", "3600"))
+
     # Database settings (can be expanded as needed)
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
 
@@ -66,9 +89,99 @@ class Settings(BaseSettings):
 
     # Cache settings
     CACHE_TTL: int = int(os.getenv("CACHE_TTL", "3600"))  # Default: 1 hour cache
+    ESTIMATE_CACHE_SIZE: int = int(os.getenv("ESTIMATE_CACHE_SIZE", "2048"))  # Entrées du cache des estimations
+
+    # Clients HTTP partagés vers les fournisseurs LLM (HTTP/2 nécessite le paquet h2)
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP2_ENABLED: bool = bool(os.getenv("HTTP2_ENABLED", "False") == "True")
+
+    # Services externes (AB Tasty, LLM): délais, nouvelles tentatives des appels idempotents, disjoncteur par fournisseur
+    EXTERNAL_CONNECT_TIMEOUT: float = float(os.getenv("EXTERNAL_CONNECT_TIMEOUT", "5"))
+    EXTERNAL_RETRIES: int = int(os.getenv("EXTERNAL_RETRIES", "2"))
+    EXTERNAL_RETRY_BASE_DELAY: float = float(os.getenv("EXTERNAL_RETRY_BASE_DELAY", "0.2"))  # secondes, doublé à chaque tentative
+    EXTERNAL_RETRY_MAX_DELAY: float = float(os.getenv("EXTERNAL_RETRY_MAX_DELAY", "2"))
+    EXTERNAL_BREAKER_FAILURES: int = int(os.getenv("EXTERNAL_BREAKER_FAILURES", "5"))
+    EXTERNAL_BREAKER_RESET_TIMEOUT: float = float(os.getenv("EXTERNAL_BREAKER_RESET_TIMEOUT", "30"))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "90"))
+    ABTASTY_REQUEST_TIMEOUT: float = float(os.getenv("ABTASTY_REQUEST_TIMEOUT", "10"))
+    ABTASTY_HEDGE_DELAY: float = float(os.getenv("ABTASTY_HEDGE_DELAY", "0"))  # secondes avant une requête de couverture, 0 = désactivé
+
+    # Métriques: répertoire partagé des instantanés par worker (vide = worker courant seulement)
+    METRICS_DIR: str = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_INTERVAL: float = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+    # Instantané non mis à jour depuis N secondes: worker arrêté, ses totaux sont regroupés dans retired.json
+    METRICS_STALE_AFTER: float = float(os.getenv("METRICS_STALE_AFTER", "600"))
 
     # Redis settings (if used for caching)
     REDIS_URL: str = os.getenv("REDIS_URL", "")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+    REDIS_SOCKET_TIMEOUT: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.25"))  # secondes
+    REDIS_CONNECT_TIMEOUT: float = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+    # Disjoncteur: cache mémoire seul après N échecs consécutifs, pendant RESET secondes
+    REDIS_BREAKER_FAILURES: int = int(os.getenv("REDIS_BREAKER_FAILURES", "3"))
+    REDIS_BREAKER_RESET_TIMEOUT: float = float(os.getenv("REDIS_BREAKER_RESET_TIMEOUT", "30"))
+
+    # Cache sémantique des premiers messages (reformulations proches d'une question déjà posée)
+    SEMANTIC_CACHE_ENABLED: bool = bool(os.getenv("SEMANTIC_CACHE_ENABLED", "False") == "True")
+    SEMANTIC_CACHE_DIR: str = os.getenv(
+        "SEMANTIC_CACHE_DIR",
+        os.path.join(os.path.dirname(__file__), os.pardir, "data", "semantic_cache")
+    )
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))  # similarité cosinus minimale
+    # Modèle sentence-transformers (ex: "paraphrase-multilingual-MiniLM-L12-v2"), vide = hachage
+    SEMANTIC_CACHE_MODEL: str = os.getenv("SEMANTIC_CACHE_MODEL", "")
+
+    # Seuils par langue, ex: "fr:0.92,en:0.9" (SEMANTIC_CACHE_THRESHOLD pour les autres)
+    @property
+    def SEMANTIC_CACHE_THRESHOLDS(self) -> Dict[str, float]:
+        thresholds = {}
+        for item in os.getenv("SEMANTIC_CACHE_THRESHOLDS", "").split(","):
+            if ":" in item:
+                language, value = item.split(":", 1)
+                thresholds[language.strip()] = float(value)
+        return thresholds
+
+    # Regroupement des appels LLM identiques en cours (verrou Redis entre workers)
+    SINGLE_FLIGHT_LOCK_TTL: float = float(os.getenv("SINGLE_FLIGHT_LOCK_TTL", "130"))  # > délai des appels LLM
+    SINGLE_FLIGHT_POLL_INTERVAL: float = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", "0.1"))
+
+    # Tokens OAuth des API externes: renouvelés OAUTH_TOKEN_REFRESH_MARGIN secondes avant expiration, partagés via Redis si configuré
+    OAUTH_TOKEN_REFRESH_MARGIN: float = float(os.getenv("OAUTH_TOKEN_REFRESH_MARGIN", "60"))
+    OAUTH_TOKEN_REDIS: bool = bool(os.getenv("OAUTH_TOKEN_REDIS", "True") == "True")
+
+    # Snapshot AB Tasty (/api/tests/snapshot): requêtes simultanées et nombre maximal de pages de tests
+    ABTASTY_SNAPSHOT_CONCURRENCY: int = int(os.getenv("ABTASTY_SNAPSHOT_CONCURRENCY", "8"))
+    ABTASTY_SNAPSHOT_MAX_PAGES: int = int(os.getenv("ABTASTY_SNAPSHOT_MAX_PAGES", "20"))
+
+    # Miroir local des réponses AB Tasty (SQLite): fraîcheur, durée de service des réponses expirées, rafraîchissement
+    ABTASTY_MIRROR_ENABLED: bool = bool(os.getenv("ABTASTY_MIRROR_ENABLED", "False") == "True")
+    ABTASTY_MIRROR_PATH: str = os.getenv(
+        "ABTASTY_MIRROR_PATH",
+        os.path.join(os.path.dirname(__file__), os.pardir, "data", "abtasty_mirror.sqlite3")
+    )
+    ABTASTY_MIRROR_TTL: float = float(os.getenv("ABTASTY_MIRROR_TTL", "300"))
+    ABTASTY_MIRROR_MAX_STALE: float = float(os.getenv("ABTASTY_MIRROR_MAX_STALE", "86400"))
+    ABTASTY_MIRROR_REFRESH_INTERVAL: float = float(os.getenv("ABTASTY_MIRROR_REFRESH_INTERVAL", "300"))
+
+    # Limitation du débit: "memory" (par worker) ou "redis" (partagée entre workers, nécessite REDIS_URL)
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_SHARDS: int = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+
+    # Préchauffage du cache: premiers messages les plus fréquents (fichier JSON et/ou statistiques Redis)
+    CACHE_WARM_ENABLED: bool = bool(os.getenv("CACHE_WARM_ENABLED", "False") == "True")
+    CACHE_WARM_FILE: str = os.getenv("CACHE_WARM_FILE", "")
+    CACHE_WARM_TOP_N: int = int(os.getenv("CACHE_WARM_TOP_N", "20"))  # par langue
+    CACHE_WARM_CONCURRENCY: int = int(os.getenv("CACHE_WARM_CONCURRENCY", "2"))
+    CACHE_WARM_INTERVAL: float = float(os.getenv("CACHE_WARM_INTERVAL", "0"))  # secondes, 0 = au démarrage seulement
+    # Conservation du classement des premiers messages (texte brut des utilisateurs) sans nouveau message, en secondes
+    CACHE_WARM_PROMPTS_TTL: int = int(os.getenv("CACHE_WARM_PROMPTS_TTL", str(7 * 24 * 3600)))
+
+    @property
+    def CACHE_WARM_MODELS(self) -> List[str]:
+        return [model.strip() for model in os.getenv("CACHE_WARM_MODELS", "deepseek").split(",") if model.strip()]
 
     # Nouvelle syntaxe de configuration pour Pydantic v2
     model_config = SettingsConfigDict(
@@ -0,0 +1,151 @@
+from cachetools import TTLCache
+from hashlib import sha256
+import json
+from typing import Optional, Dict, Any
+from loguru import logger
+
+from app.core.config import settings
+from app.core.redis_client import redis_async, redis_breaker
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.metrics import registry, CACHE_EVENTS, CACHE_LOOKUP_SECONDS, ESTIMATE_COMPUTE_SECONDS
+from app.services.statistics import estimate_test_duration, DEFAULT_BAYESIAN_ENGINE
+
+# Cache mémoire LRU des estimations (expiration après CACHE_TTL secondes)
+estimate_memory_cache = TTLCache(maxsize=settings.ESTIMATE_CACHE_SIZE, ttl=settings.CACHE_TTL)
+
+# Préfixe des clés d'estimation dans Redis
+ESTIMATE_KEY_PREFIX = "estimate:"
+
+# Chiffres significatifs conservés pour les paramètres flottants de la clé
+ESTIMATE_KEY_SIGNIFICANT_DIGITS = 6
+
+# Événements comptés (métrique cache_events_total, cache="estimate")
+CACHE_NAME = "estimate"
+ESTIMATE_STAT_EVENTS = {
+    "memory_hits": "memory_hit",
+    "redis_hits": "redis_hit",
+    "misses": "miss",
+    "stores": "store",
+    "redis_errors": "redis_error",
+    "redis_skipped": "redis_skipped"  # accès Redis évités (circuit ouvert)
+}
+
+def _quantize(value: Optional[float]) -> Optional[float]:
+    """
+    Arrondit un flottant à la précision qui influence réellement le résultat
+    """
+    if value is None:
+        return None
+    return float(f"{value:.{ESTIMATE_KEY_SIGNIFICANT_DIGITS}g}")
+
+def generate_estimate_key(params: Dict[str, Any]) -> str:
+    """
+    Génère une clé canonique pour les paramètres d'une EstimateRequest.
+    Les paramètres propres à l'autre méthode statistique sont ignorés.
+    """
+    method = params["statistical_method"]
+    key_data = {
+        "daily_visits": int(params["daily_visits"]),
+        "daily_conversions": int(params["daily_conversions"]),
+        "traffic_allocation": _quantize(params["traffic_allocation"]),
+        "expected_improvement": _quantize(params["expected_improvement"]),
+        "variations": int(params["variations"]),
+        "confidence": _quantize(params["confidence"]),
+        "statistical_method": method,
+        "test_type": params["test_type"]
+    }
+    if method == "frequentist":
+        key_data["power"] = _quantize(params.get("power"))
+    else:
+        key_data["prior_alpha"] = _quantize(params.get("prior_alpha"))
+        key_data["prior_beta"] = _quantize(params.get("prior_beta"))
+        key_data["engine"] = params.get("engine") or DEFAULT_BAYESIAN_ENGINE
+        if key_data["engine"] == "montecarlo":
+            key_data["search"] = params.get("search") or "bisection"
+            key_data["seed"] = params.get("seed")
+    digest = sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+    return f"{ESTIMATE_KEY_PREFIX}{digest}"
+
+async def _redis_call(fn, *args, **kwargs):
+    """
+    Appel Redis à travers le disjoncteur; None si Redis est indisponible ou en erreur
+    """
+    try:
+        return await redis_breaker.call(fn, *args, **kwargs)
+    except CircuitOpenError:
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="redis_skipped")
+    except Exception as e:
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="redis_error")
+        logger.warning(f"Redis error on estimate cache: {e}")
+    return None
+
+async def get_cached_estimate(cache_key: str) -> Optional[Dict[str, int]]:
+    """
+    Récupère une estimation du cache (mémoire puis Redis)
+    """
+    with CACHE_LOOKUP_SECONDS.time(cache=CACHE_NAME):
+        if cache_key in estimate_memory_cache:
+            CACHE_EVENTS.inc(cache=CACHE_NAME, event="memory_hit")
+            return dict(estimate_memory_cache[cache_key])
+
+        # Client asynchrone: la boucle d'événements n'attend pas Redis
+        redis_data = await _redis_call(redis_async.get, cache_key) if redis_async else None
+        if redis_data:
+            try:
+                result = json.loads(redis_data)
+                CACHE_EVENTS.inc(cache=CACHE_NAME, event="redis_hit")
+                estimate_memory_cache[cache_key] = result  # Mise à jour cache mémoire
+                return dict(result)
+            except ValueError as e:
+                logger.warning(f"Error deserializing estimate from Redis: {e}")
+
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="miss")
+        return None
+
+async def cache_estimate(cache_key: str, result: Dict[str, int]):
+    """
+    Stocke une estimation dans le cache (mémoire et Redis)
+    """
+    CACHE_EVENTS.inc(cache=CACHE_NAME, event="store")
+    estimate_memory_cache[cache_key] = dict(result)
+
+    if redis_async:
+        await _redis_call(redis_async.setex, cache_key, settings.CACHE_TTL, json.dumps(result))
+
+async def cached_estimate_test_duration(params: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Version mémoïsée de estimate_test_duration
+    """
+    cache_key = generate_estimate_key(params)
+    cached_result = await get_cached_estimate(cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    with ESTIMATE_COMPUTE_SECONDS.time(method=params["statistical_method"]):
+        result = await estimate_test_duration(params)
+    await cache_estimate(cache_key, result)
+    return result
+
+def get_estimate_cache_stats() -> Dict[str, Any]:
+    """
+    Retourne les statistiques d'utilisation du cache des estimations (tous workers)
+    """
+    counts = registry.aggregate()[CACHE_EVENTS.name]
+    estimate_cache_stats = {
+        stat: counts.get((CACHE_NAME, event), 0)
+        for stat, event in ESTIMATE_STAT_EVENTS.items()
+    }
+    total_hits = estimate_cache_stats["memory_hits"] + estimate_cache_stats["redis_hits"]
+    total_requests = total_hits + estimate_cache_stats["misses"]
+    hit_rate = (total_hits / total_requests) * 100 if total_requests > 0 else 0
+
+    return {
+        **estimate_cache_stats,
+        "total_hits": total_hits,
+        "total_requests": total_requests,
+        "hit_rate_percent": round(hit_rate, 2),
+        "memory_cache_size": len(estimate_memory_cache),
+        "memory_cache_maxsize": estimate_memory_cache.maxsize,
+        "redis_available": redis_async is not None,
+        "redis_circuit": redis_breaker.get_stats()
+    }
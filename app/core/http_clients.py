@@ -0,0 +1,148 @@
+"""
+Clients HTTP partagés pour toute la durée de vie de l'application.
+
+Chaque fournisseur (huggingface, deepseek...) dispose de son propre pool de
+connexions keep-alive : les appels successifs réutilisent les connexions TCP/TLS
+déjà ouvertes au lieu de refaire une poignée de main à chaque requête.
+"""
+
+import time
+from typing import Any, Dict
+
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import PROVIDER_REQUEST_SECONDS
+
+try:
+    import h2  # noqa: F401  (nécessaire à httpx pour HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Délai par défaut des requêtes (chaque appel peut passer son propre timeout)
+DEFAULT_TIMEOUT = 120.0
+
+
+class HTTPClientRegistry:
+    """
+    Registre des clients httpx partagés, un par fournisseur
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def _provider_stats(self, provider: str) -> Dict[str, Any]:
+        if provider not in self.stats:
+            self.stats[provider] = {
+                "requests": 0,
+                "new_connections": 0,
+                "tls_handshakes": 0,
+                "handshake_time": 0.0  # en secondes
+            }
+        return self.stats[provider]
+
+    def _make_request_hook(self, provider: str):
+        stats = self._provider_stats(provider)
+
+        async def on_request(request: httpx.Request):
+            # Trace httpcore: seules les nouvelles connexions émettent connect_tcp/start_tls
+            stats["requests"] += 1
+            request.extensions["start_time"] = time.perf_counter()
+            started_at: Dict[str, float] = {}
+
+            async def trace(event_name: str, info: Dict[str, Any]):
+                if event_name == "connection.connect_tcp.started":
+                    started_at["connect"] = time.perf_counter()
+                elif event_name == "connection.connect_tcp.complete":
+                    stats["new_connections"] += 1
+                elif event_name == "connection.start_tls.complete":
+                    stats["tls_handshakes"] += 1
+                    if "connect" in started_at:
+                        stats["handshake_time"] += time.perf_counter() - started_at["connect"]
+
+            request.extensions["trace"] = trace
+
+        return on_request
+
+    def _make_response_hook(self, provider: str):
+        async def on_response(response: httpx.Response):
+            # Durée jusqu'à la réception des en-têtes (le corps n'est pas encore lu)
+            start_time = response.request.extensions.get("start_time")
+            if start_time is not None:
+                PROVIDER_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start_time, provider=provider, status=str(response.status_code)
+                )
+
+        return on_response
+
+    def _create_client(self, provider: str) -> httpx.AsyncClient:
+        http2 = settings.HTTP2_ENABLED
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+
+        client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+            ),
+            event_hooks={
+                "request": [self._make_request_hook(provider)],
+                "response": [self._make_response_hook(provider)]
+            }
+        )
+        logger.info(f"HTTP client for {provider} created (http2={http2})")
+        return client
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        """
+        Retourne le client partagé du fournisseur (créé à la première utilisation)
+        """
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._clients[provider] = self._create_client(provider)
+        return client
+
+    def start(self, *providers: str):
+        """Crée à l'avance les clients des fournisseurs connus"""
+        for provider in providers:
+            self.get(provider)
+
+    async def aclose(self):
+        """Ferme toutes les connexions (arrêt de l'application)"""
+        for provider, client in list(self._clients.items()):
+            await client.aclose()
+            logger.info(f"HTTP client for {provider} closed")
+        self._clients.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Statistiques par fournisseur; chaque requête servie par une connexion
+        réutilisée est une poignée de main TCP/TLS économisée
+        """
+        providers = {}
+        for provider, stats in self.stats.items():
+            handshakes_saved = max(0, stats["requests"] - stats["new_connections"])
+            providers[provider] = {
+                **stats,
+                "handshake_time": round(stats["handshake_time"], 4),
+                "handshakes_saved": handshakes_saved,
+                "reuse_rate_percent": round(handshakes_saved / stats["requests"] * 100, 2) if stats["requests"] else 0,
+                "open": provider in self._clients and not self._clients[provider].is_closed
+            }
+        return {
+            "providers": providers,
+            "http2": settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            "max_connections": settings.HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry": settings.HTTP_KEEPALIVE_EXPIRY
+        }
+
+
+http_clients = HTTPClientRegistry()
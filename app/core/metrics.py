@@ -0,0 +1,355 @@
+"""
+Métriques de l'application (compteurs et histogrammes) au format Prometheus.
+
+Les écritures sont sans verrou : chaque thread incrémente sa propre copie
+(shard) des valeurs, et les shards sont additionnés à la lecture. Avec
+plusieurs workers (processus), chaque worker publie périodiquement un
+instantané de ses métriques dans METRICS_DIR, sous un identifiant unique (un
+worker redémarré avec le même PID n'écrase pas les totaux du précédent), et
+relit au même moment ceux des autres workers. /metrics et les endpoints de
+statistiques additionnent les valeurs vivantes du worker et ces instantanés
+déjà lus, sans accès disque. Les instantanés des workers arrêtés sont
+regroupés dans retired.json, ce qui borne le nombre de fichiers en gardant les
+compteurs croissants.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # sans verrou de fichier (Windows), les instantanés arrêtés ne sont pas regroupés
+    fcntl = None
+
+# Bornes des histogrammes de durée (secondes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+SNAPSHOT_PREFIX = "worker_"
+RETIRED_FILE = "retired.json"
+LOCK_FILE = ".lock"
+
+
+class _Metric:
+    """
+    Base des métriques: valeurs par combinaison de labels, réparties en shards par thread
+    """
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], Any]] = []
+        self._shards_lock = threading.Lock()
+        registry.register(self)
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # Seule la première écriture de chaque thread prend le verrou
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _merge(self, total, value):
+        raise NotImplementedError
+
+    def collect(self) -> Dict[Tuple[str, ...], Any]:
+        """Valeurs de ce worker, shards additionnés"""
+        merged: Dict[Tuple[str, ...], Any] = {}
+        for shard in list(self._shards):
+            for key, value in shard.copy().items():
+                merged[key] = self._merge(merged.get(key), value)
+        return merged
+
+
+class Counter(_Metric):
+    """Compteur croissant"""
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, total, value):
+        return (total or 0) + value
+
+    def value(self, aggregate: bool = False, **labels) -> float:
+        """Valeur pour les labels donnés (tous workers si aggregate)"""
+        values = registry.aggregate()[self.name] if aggregate else self.collect()
+        return values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Histogramme cumulatif (buckets, somme et nombre d'observations)"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        entry = shard.get(key)
+        if entry is None:
+            # [compte par bucket (+Inf en dernier), somme]
+            entry = shard[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Mesure la durée du bloc"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _merge(self, total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+
+class MetricsRegistry:
+    """
+    Registre des métriques; rendu Prometheus et agrégation entre workers
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._pid: Optional[int] = None
+        self._worker_id = ""
+        # Valeurs des autres workers (et des workers arrêtés) lues au dernier sync()
+        self._others: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def snapshot(self) -> Dict[str, List]:
+        """Valeurs de ce worker, sérialisables en JSON"""
+        return {
+            name: [[list(key), value] for key, value in metric.collect().items()]
+            for name, metric in self._metrics.items()
+        }
+
+    @property
+    def worker_id(self) -> str:
+        """Identifiant unique du worker, renouvelé dans un processus forké"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._worker_id = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        return self._worker_id
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(settings.METRICS_DIR, f"{SNAPSHOT_PREFIX}{self.worker_id}.json")
+
+    def _merge_snapshot(self, merged: Dict[str, Dict[Tuple[str, ...], Any]], snapshot: Dict[str, List]):
+        for name, values in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is None:
+                continue
+            target = merged.setdefault(name, {})
+            for key, value in values:
+                key = tuple(key)
+                target[key] = metric._merge(target.get(key), value)
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, List]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable metrics snapshot {os.path.basename(path)}: {e}")
+            return None
+
+    @staticmethod
+    def _write(path: str, data: Dict[str, List]):
+        """Écriture atomique"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """Verrou du répertoire: partagé pour lire, exclusif pour regrouper les instantanés arrêtés"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(settings.METRICS_DIR, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def write_snapshot(self):
+        """Publie l'instantané de ce worker"""
+        if not settings.METRICS_DIR:
+            return
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        self._write(self._snapshot_path(), self.snapshot())
+
+    def _retire_stale(self):
+        """Regroupe dans retired.json les instantanés des workers arrêtés, puis les supprime"""
+        if fcntl is None:
+            return
+        deadline = time.time() - settings.METRICS_STALE_AFTER
+        own = os.path.basename(self._snapshot_path())
+        with self._locked(exclusive=True):
+            stale = []
+            for filename in os.listdir(settings.METRICS_DIR):
+                if not filename.startswith(SNAPSHOT_PREFIX) or not filename.endswith(".json") or filename == own:
+                    continue
+                path = os.path.join(settings.METRICS_DIR, filename)
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        stale.append(path)
+                except FileNotFoundError:
+                    continue
+            if not stale:
+                return
+            retired_path = os.path.join(settings.METRICS_DIR, RETIRED_FILE)
+            retired: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+            self._merge_snapshot(retired, self._read(retired_path) or {})
+            for path in stale:
+                self._merge_snapshot(retired, self._read(path) or {})
+            self._write(retired_path, {
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in retired.items()
+            })
+            for path in stale:
+                os.remove(path)
+        logger.info(f"Metrics: {len(stale)} stopped worker snapshot(s) folded into {RETIRED_FILE}")
+
+    def sync(self):
+        """
+        Publie l'instantané de ce worker, regroupe ceux des workers arrêtés et relit
+        ceux des autres (appelé périodiquement hors de la boucle d'événements)
+        """
+        if not settings.METRICS_DIR:
+            return
+        self.write_snapshot()
+        self._retire_stale()
+
+        own = os.path.basename(self._snapshot_path())
+        others: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+        with self._locked(exclusive=False):
+            for filename in os.listdir(settings.METRICS_DIR):
+                is_snapshot = filename.startswith(SNAPSHOT_PREFIX) and filename.endswith(".json")
+                if (is_snapshot and filename != own) or filename == RETIRED_FILE:
+                    self._merge_snapshot(others, self._read(os.path.join(settings.METRICS_DIR, filename)) or {})
+        self._others = others
+
+    def aggregate(self) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+        """
+        Valeurs additionnées sur tous les workers: valeurs vivantes de ce worker et
+        instantanés des autres lus au dernier sync() (y compris les workers arrêtés,
+        les compteurs restant ainsi croissants)
+        """
+        merged = {name: metric.collect() for name, metric in self._metrics.items()}
+        if not settings.METRICS_DIR:
+            return merged
+        for name, values in self._others.items():
+            metric = self._metrics[name]
+            for key, value in values.items():
+                merged[name][key] = metric._merge(merged[name].get(key), value)
+        return merged
+
+    def render(self) -> str:
+        """Format texte d'exposition Prometheus (version 0.0.4)"""
+        values = self.aggregate()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(values[name].items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.type == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + ["+Inf"], value[0]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+async def publish_snapshots(interval: Optional[float] = None):
+    """Tâche de fond: publication de l'instantané du worker et lecture de ceux des autres, dans un thread"""
+    interval = interval or settings.METRICS_FLUSH_INTERVAL
+    while True:
+        try:
+            await asyncio.to_thread(registry.sync)
+        except OSError as e:
+            logger.warning(f"Error writing metrics snapshot: {e}")
+        await asyncio.sleep(interval)
+
+
+registry = MetricsRegistry()
+
+# Caches (hypothesis, estimate): événements memory_hit, redis_hit, miss, store, redis_error, redis_skipped
+CACHE_EVENTS = Counter("cache_events_total", "Cache lookups and stores by outcome", ("cache", "event"))
+CACHE_LOOKUP_SECONDS = Histogram("cache_lookup_seconds", "Cache lookup latency", ("cache",))
+CACHE_TIME_SAVED = Counter("cache_time_saved_seconds_total", "Age of the responses served from Redis", ("cache",))
+
+# Appels aux fournisseurs LLM (jusqu'à la réception des en-têtes pour les streams)
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "llm_provider_request_seconds", "LLM provider response latency", ("provider", "status")
+)
+
+# Appels des services externes (ExternalService): durée totale, nouvelles tentatives et requêtes de couverture comprises
+EXTERNAL_CALL_SECONDS = Histogram(
+    "external_call_seconds", "External service call latency including retries", ("service", "outcome")
+)
+# Événements retry, hedge, hedge_won, circuit_open par service
+EXTERNAL_CALL_EVENTS = Counter(
+    "external_call_events_total", "External service retries, hedged requests and circuit rejections", ("service", "event")
+)
+
+# Calcul des estimations (hors cache)
+ESTIMATE_COMPUTE_SECONDS = Histogram(
+    "estimate_compute_seconds", "Estimate computation time on cache miss", ("method",)
+)
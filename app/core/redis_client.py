@@ -0,0 +1,23 @@
+import redis
+import redis.asyncio
+
+from app.core.config import settings
+from app.core.circuit_breaker import CircuitBreaker
+
+# Client Redis partagé par les différents caches (None si REDIS_URL n'est pas configuré)
+redis_cache = redis.Redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
+
+# Client asynchrone (pool de connexions) pour les routes async: n'occupe pas la boucle d'événements
+redis_async = redis.asyncio.Redis.from_url(
+    settings.REDIS_URL,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT
+) if settings.REDIS_URL else None
+
+# Un Redis lent ou indisponible est contourné (cache mémoire seul) au lieu de ralentir chaque requête
+redis_breaker = CircuitBreaker(
+    "redis",
+    failure_threshold=settings.REDIS_BREAKER_FAILURES,
+    reset_timeout=settings.REDIS_BREAKER_RESET_TIMEOUT
+)
@@ -0,0 +1,278 @@
+"""
+Cache sémantique des réponses aux premiers messages.
+
+Le cache exact (app.core.cache) ne reconnaît que des prompts identiques. Ce
+niveau, consulté après lui, retrouve une réponse déjà générée pour un prompt
+voisin, comparé par similarité cosinus à un index borné : matrice NumPy
+persistée en .npy (mmap, une ligne écrite par insertion) et métadonnées dans
+SQLite. Quand l'index est plein, l'entrée utilisée le moins récemment est
+remplacée.
+
+Deux vectorisations:
+- par défaut, hachage des mots, paires de mots et trigrammes de caractères
+  (sans modèle à télécharger). Elle ne reconnaît que la même question écrite
+  autrement: casse, ponctuation, accents, singulier/pluriel, mot ajouté
+  (similarité 0.86 à 1). Une vraie reformulation ("How can I increase
+  checkout conversion?" / "How do I improve the checkout conversion rate?")
+  n'obtient que 0.55 à 0.65, moins qu'une question différente partageant les
+  mêmes mots (0.65 à 0.75 pour "checkout" / "homepage"): aucun seuil ne
+  sépare les deux, d'où le seuil par défaut de 0.9;
+- avec SEMANTIC_CACHE_MODEL (sentence-transformers installé), un modèle
+  d'embeddings multilingue qui rapproche aussi les synonymes et les
+  reformulations; le seuil doit alors être recalibré (~0.85).
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import CACHE_EVENTS
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:  # vectorisation par hachage seulement
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+# Dimension des vecteurs (nombre de cases de hachage)
+EMBEDDING_DIM = 1024
+
+VECTORS_FILE = "vectors.npy"
+ENTRIES_FILE = "entries.sqlite3"
+
+CACHE_NAME = "semantic"
+
+
+def _normalize(text: str) -> str:
+    """Minuscules et suppression des accents"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _features(text: str) -> List[str]:
+    words = re.findall(r"\w+", _normalize(text))
+    features = []
+    for word in words:
+        features.append(f"w:{word}")
+        padded = f"#{word}#"
+        features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    features.extend(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+    return features
+
+
+def embed(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Vecteur normalisé du texte par hachage signé des caractéristiques
+    (crc32: stable d'un processus à l'autre, contrairement à hash())
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class HashingEmbedder:
+    """Vectorisation par hachage (variantes d'écriture d'une même question)"""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def encode(self, text: str) -> np.ndarray:
+        return embed(text, self.dim)
+
+
+class ModelEmbedder:
+    """Modèle sentence-transformers (synonymes et reformulations), chargé à la première utilisation"""
+
+    def __init__(self, model_name: str):
+        self.name = f"model:{model_name}"
+        self._model_name = model_name
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = SentenceTransformer(self._model_name)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    def encode(self, text: str) -> np.ndarray:
+        return np.asarray(self.model.encode(text, normalize_embeddings=True), dtype=np.float32)
+
+
+def get_embedder():
+    """Vectorisation configurée (SEMANTIC_CACHE_MODEL), le hachage à défaut"""
+    if settings.SEMANTIC_CACHE_MODEL:
+        if SENTENCE_TRANSFORMERS_AVAILABLE:
+            return ModelEmbedder(settings.SEMANTIC_CACHE_MODEL)
+        logger.warning(
+            f"Semantic cache: sentence-transformers is not installed, "
+            f"{settings.SEMANTIC_CACHE_MODEL} ignored (hashing embeddings)"
+        )
+    return HashingEmbedder()
+
+
+class SemanticCache:
+    """
+    Index borné de réponses, recherché par similarité cosinus pour un même modèle et une même langue
+    """
+
+    def __init__(self, directory: str, max_entries: int, embedder=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.embedder = embedder or HashingEmbedder()
+        self._vectors: Optional[np.ndarray] = None
+        self._db: Optional[sqlite3.Connection] = None
+        # Étiquette "modèle:langue" de chaque emplacement ("" = libre)
+        self._tags = np.full(max_entries, "", dtype=object)
+        self._last_used = np.zeros(max_entries)
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0
+        }
+
+    def load(self):
+        """Ouvre (ou crée) l'index persisté"""
+        if self._db is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        dim = self.embedder.dim
+
+        db = sqlite3.connect(os.path.join(self.directory, ENTRIES_FILE), check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "slot INTEGER PRIMARY KEY, tag TEXT NOT NULL, prompt TEXT NOT NULL, "
+            "response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        row = db.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+
+        # Les vecteurs d'une autre vectorisation ne sont pas comparables
+        reset = row is None or row[0] != self.embedder.name or not os.path.exists(vectors_path)
+        if not reset:
+            try:
+                vectors = np.load(vectors_path, mmap_mode="r+")
+                reset = vectors.shape != (self.max_entries, dim)
+            except Exception as e:
+                logger.warning(f"Semantic cache: unreadable index ({e}), rebuilding")
+                reset = True
+        if reset:
+            # Nouvelle taille, dimension ou vectorisation: l'index est reconstruit vide
+            vectors = np.lib.format.open_memmap(
+                vectors_path, mode="w+", dtype=np.float32, shape=(self.max_entries, dim)
+            )
+            db.execute("DELETE FROM entries")
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (self.embedder.name,))
+            db.commit()
+        for slot, tag, last_used in db.execute("SELECT slot, tag, last_used FROM entries"):
+            self._tags[slot] = tag
+            self._last_used[slot] = last_used
+
+        self._vectors = vectors
+        self._db = db
+        logger.info(f"Semantic cache loaded: {self.size} entries in {self.directory} ({self.embedder.name})")
+
+    @property
+    def size(self) -> int:
+        return int(np.count_nonzero(self._tags != ""))
+
+    @staticmethod
+    def threshold(language: str) -> float:
+        """Similarité minimale pour la langue (SEMANTIC_CACHE_THRESHOLDS, sinon le seuil global)"""
+        return settings.SEMANTIC_CACHE_THRESHOLDS.get(language, settings.SEMANTIC_CACHE_THRESHOLD)
+
+    def lookup(self, prompt: str, model: str, language: str) -> Optional[Dict[str, Any]]:
+        """
+        Retourne la réponse (dictionnaire) de l'entrée la plus proche si sa similarité
+        atteint le seuil de la langue
+        """
+        self.load()
+        slots = np.flatnonzero(self._tags == f"{model}:{language}")
+        if slots.size:
+            scores = self._vectors[slots] @ self.embedder.encode(prompt)
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score >= self.threshold(language):
+                slot = int(slots[best])
+                row = self._db.execute("SELECT response FROM entries WHERE slot = ?", (slot,)).fetchone()
+                if row:
+                    now = time.time()
+                    self._last_used[slot] = now
+                    self._db.execute("UPDATE entries SET last_used = ? WHERE slot = ?", (now, slot))
+                    self._db.commit()
+                    self.stats["hits"] += 1
+                    CACHE_EVENTS.inc(cache=CACHE_NAME, event="hit")
+                    logger.debug(f"Semantic cache hit (similarity {score:.3f})")
+                    return json.loads(row[0])
+
+        self.stats["misses"] += 1
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="miss")
+        return None
+
+    def add(self, prompt: str, model: str, language: str, response: Dict[str, Any]):
+        """
+        Ajoute une entrée (une ligne de l'index écrite), en remplaçant la moins récemment utilisée si l'index est plein
+        """
+        self.load()
+        free = np.flatnonzero(self._tags == "")
+        if free.size:
+            slot = int(free[0])
+        else:
+            slot = int(np.argmin(self._last_used))
+            self.stats["evictions"] += 1
+            CACHE_EVENTS.inc(cache=CACHE_NAME, event="eviction")
+
+        now = time.time()
+        self._vectors[slot] = self.embedder.encode(prompt)
+        self._vectors.flush()
+        tag = f"{model}:{language}"
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (slot, tag, prompt, response, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (slot, tag, prompt, json.dumps(response), now, now)
+        )
+        self._db.commit()
+        self._tags[slot] = tag
+        self._last_used[slot] = now
+        self.stats["stores"] += 1
+        CACHE_EVENTS.inc(cache=CACHE_NAME, event="store")
+
+    def close(self):
+        """Ferme l'index (arrêt de l'application)"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            self._vectors = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": settings.SEMANTIC_CACHE_ENABLED,
+            "hit_rate_percent": round(self.stats["hits"] / lookups * 100, 2) if lookups else 0,
+            "size": self.size,
+            "max_entries": self.max_entries,
+            "embedder": self.embedder.name,
+            "threshold": settings.SEMANTIC_CACHE_THRESHOLD,
+            "thresholds": settings.SEMANTIC_CACHE_THRESHOLDS
+        }
+
+
+semantic_cache = SemanticCache(settings.SEMANTIC_CACHE_DIR, settings.SEMANTIC_CACHE_MAX_ENTRIES, get_embedder())
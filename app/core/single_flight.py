@@ -0,0 +1,178 @@
+"""
+Regroupement (single-flight) des appels identiques en cours.
+
+Le cache ne sert qu'une fois la réponse stockée : des requêtes identiques
+arrivées en même temps déclencheraient chacune un appel au fournisseur LLM.
+Ici, le premier appel pour une clé est exécuté une seule fois et les suivants
+attendent son résultat. Avec Redis, un verrou court étend la garantie aux
+autres workers : ils attendent le résultat publié par le worker qui détient
+le verrou au lieu de relancer l'appel.
+
+Seuls les résultats sont partagés: si l'appel en cours échoue, chaque requête
+en attente exécute son propre appel. Une erreur peut tenir à l'appelant (clé
+d'API refusée, quota épuisé) et ne doit pas être renvoyée à des requêtes
+identiques qui portent d'autres identifiants.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.redis_client import redis_async, redis_breaker
+
+# Durée de conservation du résultat publié pour les autres workers (secondes)
+RESULT_TTL = 60
+
+# Libère le verrou seulement s'il appartient encore à ce worker
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Exécute une seule fois les appels concurrents partageant la même clé
+    """
+
+    def __init__(self, namespace: str, lock_ttl: float = None, poll_interval: float = None, use_redis: bool = True):
+        self.namespace = namespace
+        # False: regroupement dans ce worker seulement, rien n'est écrit dans Redis (résultats sensibles)
+        self.use_redis = use_redis
+        self.lock_ttl = lock_ttl if lock_ttl is not None else settings.SINGLE_FLIGHT_LOCK_TTL
+        self.poll_interval = poll_interval if poll_interval is not None else settings.SINGLE_FLIGHT_POLL_INTERVAL
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            "calls": 0,            # appels réellement exécutés
+            "coalesced": 0,         # requêtes servies par un appel en cours dans ce worker
+            "remote_coalesced": 0,  # requêtes servies par un appel d'un autre worker
+            "own_calls": 0          # requêtes en attente relancées après l'échec de l'appel partagé
+        }
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads
+    ) -> Any:
+        """
+        Retourne le résultat de fn(), partagé entre les appels concurrents de même clé.
+        Une exception n'est levée que pour l'appelant dont fn() a échoué.
+        encode/decode sérialisent le résultat échangé entre workers via Redis.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            logger.debug(f"Single-flight: joined in-flight call {key[:8]}...")
+            try:
+                # shield: l'annulation d'une requête (client déconnecté) n'interrompt pas l'appel partagé
+                result = await asyncio.shield(task)
+            except Exception as e:
+                # Échec de l'appel partagé: peut-être propre à ses identifiants, on relance avec les nôtres
+                logger.debug(f"Single-flight: shared call {key[:8]} failed ({type(e).__name__}), running own call")
+                self.stats["calls"] += 1
+                self.stats["own_calls"] += 1
+                return await fn()
+            self.stats["coalesced"] += 1
+            return result
+
+        task = asyncio.ensure_future(self._run(key, fn, encode, decode))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, fn, encode, decode) -> Any:
+        if not (self.use_redis and redis_async):
+            self.stats["calls"] += 1
+            return await fn()
+
+        lock_key = f"singleflight:{self.namespace}:lock:{key}"
+        result_key = f"singleflight:{self.namespace}:result:{key}"
+        token = uuid.uuid4().hex
+
+        try:
+            acquired = await redis_breaker.call(
+                redis_async.set, lock_key, token, nx=True, px=int(self.lock_ttl * 1000)
+            )
+        except Exception as e:
+            # Redis indisponible (ou circuit ouvert): regroupement local seulement
+            logger.warning(f"Single-flight: Redis lock unavailable ({e}), running locally")
+            acquired = None
+            lock_key = None
+
+        if lock_key and not acquired:
+            # Un autre worker exécute déjà l'appel: attendre son résultat
+            result = await self._wait_remote(lock_key, result_key, decode)
+            if result is not None:
+                self.stats["remote_coalesced"] += 1
+                return result
+
+        published = False
+        try:
+            self.stats["calls"] += 1
+            result = await fn()
+            if lock_key:
+                # Publication du résultat et libération du verrou en un seul aller-retour
+                try:
+                    async with redis_async.pipeline(transaction=False) as pipe:
+                        pipe.setex(result_key, RESULT_TTL, encode(result))
+                        if acquired:
+                            pipe.eval(RELEASE_SCRIPT, 1, lock_key, token)
+                        await redis_breaker.call(pipe.execute)
+                    published = True
+                except Exception as e:
+                    logger.warning(f"Single-flight: error publishing result: {e}")
+            return result
+        finally:
+            if acquired and not published:
+                try:
+                    await redis_breaker.call(redis_async.eval, RELEASE_SCRIPT, 1, lock_key, token)
+                except Exception as e:
+                    logger.warning(f"Single-flight: error releasing lock: {e}")
+
+    async def _wait_remote(self, lock_key: str, result_key: str, decode) -> Optional[Any]:
+        """
+        Attend le résultat publié par le détenteur du verrou. Retourne None si le
+        verrou disparaît sans résultat (échec de l'autre worker) ou expire.
+        """
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            try:
+                # Présence du verrou puis résultat, en un seul aller-retour: le résultat
+                # étant publié avant la libération, un verrou absent garantit de le voir
+                async with redis_async.pipeline(transaction=False) as pipe:
+                    pipe.exists(lock_key)
+                    pipe.get(result_key)
+                    locked, data = await redis_breaker.call(pipe.execute)
+                if data is not None:
+                    return decode(data)
+                if not locked:
+                    return None
+            except Exception as e:
+                logger.warning(f"Single-flight: error waiting for remote result: {e}")
+                return None
+            await asyncio.sleep(self.poll_interval)
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Statistiques du regroupement: chaque requête regroupée est un appel au fournisseur évité
+        """
+        saved = self.stats["coalesced"] + self.stats["remote_coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+            "provider_calls_saved": saved
+        }
+
+
+# Générations d'hypothèses et de titres
+hypothesis_flight = SingleFlight("hypothesis")
+title_flight = SingleFlight("title")
@@ -0,0 +1,154 @@
+"""
+Cache des tokens OAuth2 (client_credentials) des API externes.
+
+Un token est valable expires_in secondes : il est conservé en mémoire (et,
+avec Redis, partagé entre les workers) sous une empreinte des identifiants,
+jamais sous les identifiants eux-mêmes. Peu avant son expiration, le token
+courant continue d'être servi pendant qu'un nouveau est demandé en arrière-plan ;
+les demandes concurrentes pour les mêmes identifiants partagent un seul appel.
+"""
+
+import asyncio
+import json
+import time
+from hashlib import sha256
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from loguru import logger
+
+from app.core.config import settings
+from app.core.redis_client import redis_async, redis_breaker
+from app.core.single_flight import SingleFlight
+
+# Durée de validité supposée quand le serveur n'envoie pas expires_in (secondes)
+DEFAULT_EXPIRES_IN = 300
+
+# En deçà de cette durée de validité restante, le token n'est plus servi (secondes)
+EXPIRY_SAFETY_MARGIN = 5
+
+# fetch() retourne (token, expires_in) ou None si les identifiants sont refusés
+TokenFetcher = Callable[[], Awaitable[Optional[Tuple[str, Optional[float]]]]]
+
+
+class TokenCache:
+    """
+    Tokens par identifiants: mémoire, puis Redis, puis appel au serveur d'autorisation
+    """
+
+    def __init__(self, namespace: str, refresh_margin: float = None, use_redis: bool = None):
+        self.namespace = namespace
+        self.refresh_margin = refresh_margin if refresh_margin is not None else settings.OAUTH_TOKEN_REFRESH_MARGIN
+        self.use_redis = settings.OAUTH_TOKEN_REDIS if use_redis is None else use_redis
+        # Entrée: (token, expires_at en temps epoch)
+        self._tokens: TTLCache = TTLCache(maxsize=1024, ttl=24 * 3600)
+        # Sans Redis pour les tokens, le regroupement reste local: le token n'est jamais publié
+        self._flight = SingleFlight(f"token:{namespace}", use_redis=self.use_redis)
+        self._background: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            "hits": 0,
+            "redis_hits": 0,
+            "refreshes": 0,           # tokens demandés au serveur d'autorisation
+            "background_refreshes": 0,
+            "failures": 0,
+            "invalidations": 0
+        }
+
+    def _key(self, client_id: str, client_secret: str) -> str:
+        return sha256(f"{client_id}:{client_secret}".encode()).hexdigest()
+
+    def _redis_key(self, key: str) -> str:
+        return f"oauth:{self.namespace}:{key}"
+
+    async def get(self, client_id: str, client_secret: str, fetch: TokenFetcher) -> Optional[str]:
+        """
+        Retourne un token valide pour les identifiants, en appelant fetch() seulement si nécessaire
+        """
+        key = self._key(client_id, client_secret)
+        entry = self._tokens.get(key)
+        if entry:
+            token, expires_at = entry
+            remaining = expires_at - time.time()
+            if remaining > self.refresh_margin:
+                self.stats["hits"] += 1
+                return token
+            if remaining > EXPIRY_SAFETY_MARGIN:
+                # Bientôt expiré: servi tel quel, renouvelé en arrière-plan
+                self.stats["hits"] += 1
+                self._refresh_in_background(key, fetch)
+                return token
+
+        return await self._shared_refresh(key, fetch)
+
+    def _refresh_in_background(self, key: str, fetch: TokenFetcher):
+        if key in self._background:
+            return
+        self.stats["background_refreshes"] += 1
+        task = asyncio.ensure_future(self._shared_refresh(key, fetch))
+        self._background[key] = task
+        task.add_done_callback(lambda _: self._background.pop(key, None))
+
+    async def _shared_refresh(self, key: str, fetch: TokenFetcher) -> Optional[str]:
+        """
+        Renouvellement partagé par les appels concurrents; le token est conservé
+        en mémoire même quand il a été obtenu par l'appel d'un autre worker
+        """
+        entry = await self._flight.do(key, lambda: self._refresh(key, fetch))
+        if not entry:
+            return None
+        token, expires_at = entry
+        self._tokens[key] = (token, expires_at)
+        return token
+
+    async def _refresh(self, key: str, fetch: TokenFetcher) -> Optional[Tuple[str, float]]:
+        """Retourne (token, expires_at), ou None si les identifiants sont refusés"""
+        # Token déjà obtenu (ou renouvelé) par un autre worker
+        if self.use_redis and redis_async:
+            try:
+                data = await redis_breaker.call(redis_async.get, self._redis_key(key))
+                if data:
+                    token, expires_at = json.loads(data)
+                    if expires_at - time.time() > self.refresh_margin:
+                        self.stats["redis_hits"] += 1
+                        return token, expires_at
+            except Exception as e:
+                logger.warning(f"Token cache {self.namespace}: Redis read failed: {e}")
+
+        result = await fetch()
+        if not result:
+            self.stats["failures"] += 1
+            return None
+
+        token, expires_in = result
+        self.stats["refreshes"] += 1
+        expires_in = float(expires_in or DEFAULT_EXPIRES_IN)
+        expires_at = time.time() + expires_in
+
+        if self.use_redis and redis_async:
+            try:
+                await redis_breaker.call(
+                    redis_async.setex, self._redis_key(key), max(1, int(expires_in)), json.dumps([token, expires_at])
+                )
+            except Exception as e:
+                logger.warning(f"Token cache {self.namespace}: Redis write failed: {e}")
+        return token, expires_at
+
+    async def invalidate(self, client_id: str, client_secret: str):
+        """Oublie le token des identifiants (refusé par l'API: révoqué ou expiré plus tôt que prévu)"""
+        key = self._key(client_id, client_secret)
+        self._tokens.pop(key, None)
+        self.stats["invalidations"] += 1
+        if self.use_redis and redis_async:
+            try:
+                await redis_breaker.call(redis_async.delete, self._redis_key(key))
+            except Exception as e:
+                logger.warning(f"Token cache {self.namespace}: Redis delete failed: {e}")
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            **self.stats,
+            "cached_tokens": len(self._tokens),
+            "refresh_margin": self.refresh_margin,
+            "redis": bool(self.use_redis and redis_async),
+            "single_flight": self._flight.get_stats()
+        }
@@ -1,6 +1,9 @@
 import sys
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import time
 from loguru import logger
@@ -20,16 +23,59 @@ from app.routers import imports
 from app.routers import settings as settings_router
 from app.core.logging import setup_logging
 from app.api import abtasty
+from app.services.worker_pool import calculation_pool
+from app.services.lookup_tables import sample_size_tables
+from app.core.http_clients import http_clients
+from app.core.semantic_cache import semantic_cache
+from app.core.redis_client import redis_async
+from app.core.metrics import registry, publish_snapshots
+from app.routers.hypothesis.cache_warmer import cache_warmer
+from app.services.abtasty_mirror import abtasty_mirror
 
 # Setup logging
 setup_logging()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables de tailles d'échantillon mappées en mémoire (absentes = calcul direct)
+    sample_size_tables.load()
+    # Pools de connexions keep-alive vers les fournisseurs LLM et AB Tasty
+    http_clients.start("huggingface", "deepseek", "abtasty")
+    # Index du cache sémantique persisté sur disque
+    if settings.SEMANTIC_CACHE_ENABLED:
+        semantic_cache.load()
+    # Publication des métriques de ce worker pour l'agrégation multi-workers
+    metrics_task = asyncio.create_task(publish_snapshots()) if settings.METRICS_DIR else None
+    # Préchauffage du cache en arrière-plan (le démarrage n'attend pas les appels LLM)
+    warm_task = asyncio.create_task(cache_warmer.run_forever()) if settings.CACHE_WARM_ENABLED else None
+    # Miroir local AB Tasty et rafraîchissement des comptes consultés
+    mirror_task = None
+    if settings.ABTASTY_MIRROR_ENABLED:
+        abtasty_mirror.load()
+        mirror_task = asyncio.create_task(abtasty_mirror.run_refresher())
+    yield
+    # Arrêt propre des ressources partagées
+    if warm_task:
+        warm_task.cancel()
+    if mirror_task:
+        mirror_task.cancel()
+    abtasty_mirror.close()
+    if metrics_task:
+        metrics_task.cancel()
+        registry.write_snapshot()
+    await http_clients.aclose()
+    if redis_async:
+        await redis_async.close()
+    semantic_cache.close()
+    calculation_pool.shutdown()
+
 app = FastAPI(
     title="A/B Test Calculator API",
     description="API for calculating A/B test sample sizes and durations",
     version=settings.APP_VERSION,
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Configuration des CORS pour permettre les requêtes depuis le frontend
@@ -71,6 +117,11 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métriques au format d'exposition Prometheus (tous workers)"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -1,8 +1,8 @@
 """Data models package for request and response schemas"""
 
-from app.models.schemas import EstimateRequest, EstimateResponse
+from app.models.schemas import EstimateRequest, EstimateResponse, EstimateGrid, EstimateBatchRequest
 
-__all__ = ["EstimateRequest", "EstimateResponse"]
+__all__ = ["EstimateRequest", "EstimateResponse", "EstimateGrid", "EstimateBatchRequest"]
 
 # Models package
 # Ce dossier contiendra les modèles de données pour l'API 
\ No newline at end of file
@@ -1,5 +1,7 @@
 from pydantic import BaseModel, field_validator, model_validator
-from typing import Optional, Literal, Dict, Any
+from typing import Optional, Literal, Dict, Any, List
+
+from app.core.config import settings
 
 
 class EstimateRequest(BaseModel):
@@ -16,6 +18,11 @@ class EstimateRequest(BaseModel):
     # Only for bayesian:
     prior_alpha: Optional[float] = None
     prior_beta: Optional[float] = None
+    # gauss_legendre: approximation numérique de référence (données discrétisées, intégrale tronquée);
+    # "exact" est son ancien nom, toujours accepté
+    engine: Literal["gauss_legendre", "exact", "quadrature", "montecarlo"] = "quadrature"
+    search: Literal["bisection", "grid"] = "bisection"  # moteur montecarlo uniquement
+    seed: Optional[int] = None      # moteur montecarlo: tirages reproductibles
 
     @model_validator(mode='after')
     def validate_method_specific(self) -> 'EstimateRequest':
@@ -29,6 +36,18 @@ class EstimateRequest(BaseModel):
             raise ValueError("prior_alpha and prior_beta required for bayesian method")
         return self
     
+    @model_validator(mode='after')
+    def validate_bayesian_confidence(self) -> 'EstimateRequest':
+        # Seuil de décision bayésien: en dessous de 0.5 il n'y a pas d'effet minimal à chercher
+        if self.statistical_method == "bayesian" and not 0.5 < self.confidence < 1:
+            raise ValueError("confidence doit être dans ]0.5, 1[ pour la méthode bayésienne")
+        return self
+    
+    @field_validator('engine')
+    def normalize_engine(cls, v: str) -> str:
+        # Un seul nom par moteur (clé de cache, regroupement des lots)
+        return "gauss_legendre" if v == "exact" else v
+    
     @field_validator('expected_improvement')
     def validate_improvement(cls, v: float) -> float:
         if v is not None and v > 1.0:
@@ -61,10 +80,100 @@ class EstimateRequest(BaseModel):
     }
 
 
+class EstimateGrid(BaseModel):
+    """
+    Grille de scénarios: produit cartésien des valeurs balayées autour d'une requête de base
+    """
+    base: EstimateRequest
+    traffic_allocations: List[float] = []       # vide = valeur de base
+    expected_improvements: List[float] = []
+    variations: List[int] = []
+
+    @field_validator('traffic_allocations')
+    def validate_allocations(cls, v: List[float]) -> List[float]:
+        if any(value <= 0 or value > 1 for value in v):
+            raise ValueError("traffic_allocations doit contenir des valeurs dans ]0, 1]")
+        return v
+
+    @field_validator('expected_improvements')
+    def validate_improvements(cls, v: List[float]) -> List[float]:
+        if any(value > 1.0 for value in v):
+            raise ValueError("Expected improvement doit être en pourcentage relatif (0-100)")
+        return v
+
+    @field_validator('variations')
+    def validate_variations(cls, v: List[int]) -> List[int]:
+        if any(value < 2 for value in v):
+            raise ValueError("variations doit être au moins 2")
+        return v
+
+    def expand(self) -> List[Dict[str, Any]]:
+        """Retourne les paramètres de chaque scénario de la grille"""
+        base = self.base.dict()
+        return [
+            {**base, "traffic_allocation": allocation, "expected_improvement": improvement, "variations": variations}
+            for allocation in self.traffic_allocations or [self.base.traffic_allocation]
+            for improvement in self.expected_improvements or [self.base.expected_improvement]
+            for variations in self.variations or [self.base.variations]
+        ]
+
+    @property
+    def size(self) -> int:
+        return (
+            max(1, len(self.traffic_allocations))
+            * max(1, len(self.expected_improvements))
+            * max(1, len(self.variations))
+        )
+
+
+class EstimateBatchRequest(BaseModel):
+    # Exactement un des deux champs
+    requests: Optional[List[EstimateRequest]] = None
+    grid: Optional[EstimateGrid] = None
+
+    @model_validator(mode='after')
+    def validate_batch(self) -> 'EstimateBatchRequest':
+        if (self.requests is None) == (self.grid is None):
+            raise ValueError("Provide either requests or grid")
+        size = len(self.requests) if self.requests is not None else self.grid.size
+        if size > settings.ESTIMATE_BATCH_MAX_SCENARIOS:
+            raise ValueError(f"Too many scenarios ({size} > {settings.ESTIMATE_BATCH_MAX_SCENARIOS})")
+        return self
+
+    def scenarios(self) -> List[Dict[str, Any]]:
+        if self.requests is not None:
+            return [request.dict() for request in self.requests]
+        return self.grid.expand()
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "grid": {
+                    "base": {
+                        "daily_visits": 1000,
+                        "daily_conversions": 100,
+                        "traffic_allocation": 0.5,
+                        "expected_improvement": 0.05,
+                        "variations": 2,
+                        "confidence": 0.95,
+                        "statistical_method": "frequentist",
+                        "test_type": "two-sided",
+                        "power": 0.8
+                    },
+                    "traffic_allocations": [0.25, 0.5, 1.0],
+                    "expected_improvements": [0.02, 0.05, 0.1],
+                    "variations": [2, 3]
+                }
+            }
+        }
+    }
+
+
 class EstimateResponse(BaseModel):
     sample_size_per_variation: int
     total_sample: int
     estimated_days: int
+    simulation_draws: Optional[int] = None  # moteur montecarlo: expériences simulées
 
     model_config = {
         "json_schema_extra": {
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from loguru import logger
-from typing import Dict, Any, List
-from app.models.schemas import EstimateRequest, EstimateResponse
-from app.services.statistics import estimate_test_duration
+from typing import Dict, Any, List, AsyncIterator, Literal, Optional
+from app.models.schemas import EstimateRequest, EstimateResponse, EstimateBatchRequest
+from app.core.estimate_cache import cached_estimate_test_duration, get_estimate_cache_stats
+from app.services.statistics import estimate_test_duration_batch
+from app.services.evolution import calculate_mde_evolution, MAX_EVOLUTION_PERIODS
+from app.services.worker_pool import calculation_pool, PoolSaturatedError, PoolTimeoutError
 from app.core.config import settings
-import math
-from scipy import stats
+import json
+import time
+
+# Nombre de lignes NDJSON regroupées par envoi, et délai maximal avant envoi
+BATCH_FLUSH_LINES = 512
+BATCH_FLUSH_SECONDS = 0.1
 
 router = APIRouter()
 
@@ -13,6 +21,7 @@ router = APIRouter()
 @router.post(
     "/estimate",
     response_model=EstimateResponse,
+    response_model_exclude_none=True,
     summary="Calculate A/B test sample size and duration",
     description="Calculate required sample size and test duration based on provided parameters",
 )
@@ -33,11 +42,14 @@ async def calculate_estimate(
     - **power**: (frequentist only) Statistical power (e.g., 0.8)
     - **prior_alpha**: (bayesian only) Alpha parameter for Beta prior
     - **prior_beta**: (bayesian only) Beta parameter for Beta prior
+    - **engine**: (bayesian only) "quadrature" (default), "gauss_legendre" (numerical reference,
+      formerly "exact") or "montecarlo"
     
     Returns:
     - **sample_size_per_variation**: Required sample size per variation
     - **total_sample**: Total required sample size across all variations
     - **estimated_days**: Estimated test duration in days
+    - **simulation_draws**: (montecarlo engine only) Number of simulated experiments used
     """
     try:
         # Log the request
@@ -46,18 +58,74 @@ async def calculate_estimate(
         # Convert pydantic model to dict
         params = request.dict()
         
-        # Calculate estimate
-        result = await estimate_test_duration(params)
+        # Calculate estimate (ou réutiliser un résultat en cache)
+        result = await cached_estimate_test_duration(params)
         
         # Log the result
         logger.info(f"Estimate result: {result}")
         
         return result
+    except PoolSaturatedError as e:
+        logger.warning(f"Estimate rejected: {str(e)}")
+        raise HTTPException(status_code=503, detail="Calculation capacity exhausted. Try again later.", headers={"Retry-After": "1"})
+    except PoolTimeoutError as e:
+        logger.error(f"Estimate timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"Calculation timed out: {str(e)}")
     except Exception as e:
         logger.error(f"Error calculating estimate: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error calculating estimate: {str(e)}")
 
 
+@router.post(
+    "/estimate/batch",
+    response_class=StreamingResponse,
+    summary="Calculate many A/B test estimates at once",
+    description="Evaluate a list of estimate requests or a scenario grid, streamed back as NDJSON",
+)
+async def calculate_estimate_batch(
+    request: EstimateBatchRequest,
+) -> StreamingResponse:
+    """
+    Evaluate many scenarios in a single call.
+    
+    - **requests**: List of /estimate request bodies
+    - **grid**: Base /estimate request plus lists of **traffic_allocations**,
+      **expected_improvements** and **variations** to sweep (cartesian product)
+    
+    Returns one JSON object per line, in scenario order, with:
+    - **index**, **traffic_allocation**, **expected_improvement**, **variations**
+    - **sample_size_per_variation**, **total_sample**, **estimated_days**, or **error**
+    """
+    scenarios = request.scenarios()
+    logger.info(f"Received batch estimation request: {len(scenarios)} scenarios")
+    
+    return StreamingResponse(
+        _ndjson_lines(estimate_test_duration_batch(scenarios)),
+        media_type="application/x-ndjson"
+    )
+
+
+async def _ndjson_lines(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Sérialise les résultats en NDJSON, regroupés pour limiter le nombre d'envois
+    sans retenir les résultats lents à calculer
+    """
+    buffer = []
+    last_flush = time.monotonic()
+    try:
+        async for row in rows:
+            buffer.append(json.dumps(row))
+            if len(buffer) >= BATCH_FLUSH_LINES or time.monotonic() - last_flush >= BATCH_FLUSH_SECONDS:
+                yield "\n".join(buffer) + "\n"
+                buffer = []
+                last_flush = time.monotonic()
+    except Exception as e:
+        logger.error(f"Error calculating batch estimate: {str(e)}")
+        buffer.append(json.dumps({"error": f"Error calculating batch estimate: {str(e)}"}))
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
 @router.post(
     "/estimate/weekly-evolution",
     summary="Calculate weekly evolution of sample size and MDE",
@@ -77,99 +145,69 @@ async def calculate_weekly_evolution(
     - **mde_relative**: Minimum detectable effect (relative) that can be detected by this week
     - **status**: Classification as "too short", "optimal", or "too long"
     """
+    return await calculate_evolution(request, granularity="week", horizon=None, bayesian_mode="incremental")
+
+
+@router.post(
+    "/estimate/evolution",
+    summary="Calculate evolution of sample size and MDE over any horizon",
+    description="Calculate how MDE evolves over daily or weekly periods based on sample size accumulation",
+)
+async def calculate_evolution(
+    request: EstimateRequest,
+    granularity: Literal["day", "week"] = Query("week", description="Period length"),
+    horizon: Optional[int] = Query(None, ge=1, le=MAX_EVOLUTION_PERIODS, description="Number of periods"),
+    bayesian_mode: Literal["incremental", "approximate"] = Query("incremental", description="Bayesian curve computation"),
+) -> List[Dict[str, Any]]:
+    """
+    Calculate how the minimum detectable effect (MDE) changes over daily or weekly periods.
+    
+    Parameters are the same as the /estimate endpoint, plus:
+    - **granularity**: "day" or "week" (query parameter)
+    - **horizon**: Number of periods (query parameter, defaults to 8 weeks or twice the estimated duration)
+    - **bayesian_mode**: "incremental" (default, inverts the Bayesian decision rule at every
+      period from one incremental simulation) or "approximate" (fixed 2 or 3 standard errors)
+    
+    Returns a list of data points with:
+    - **day** or **week**: Period number
+    - **visitors_per_variant**: Cumulative visitors per variant by this period
+    - **mde_relative**: Minimum detectable effect (relative) that can be detected by this period
+    - **status**: Classification as "too short", "optimal", or "too long"
+    """
     try:
         # Log the request
-        logger.info(f"Received weekly evolution request: statistical_method={request.statistical_method}")
-
-        # Convert pydantic model to dict
-        params = request.dict()
+        logger.info(f"Received evolution request: statistical_method={request.statistical_method}, granularity={granularity}")
         
-        # Calculate baseline conversion rate
-        baseline_rate = params["daily_conversions"] / params["daily_visits"]
-        
-        # Calculate daily visitors per variant
-        daily_visitors_per_variant = (params["daily_visits"] * params["traffic_allocation"]) / params["variations"]
-        
-        # Get the base sample size requirement
-        result = await estimate_test_duration(params)
-        sample_size_per_variation = result["sample_size_per_variation"]
-        
-        # Calculate estimated days and convert to weeks
-        total_days = result["estimated_days"]
-        estimated_weeks = math.ceil(total_days / 7)
-        
-        # Generate weekly evolution data
-        weekly_evolution = []
-        
-        # Calculate for 8 weeks or twice the estimated duration, whichever is greater
-        max_weeks = max(8, estimated_weeks * 2)
-        
-        for week in range(1, max_weeks + 1):
-            # Calculate visitors per variant accumulated by this week
-            days = week * 7
-            visitors_per_variant = math.floor(daily_visitors_per_variant * days)
-            
-            # Calculate the relative MDE that can be detected with this sample size
-            # This is based on the inverse of the sample size formula
-            if params["statistical_method"] == "frequentist":
-                power = params["power"]
-                alpha = 1 - params["confidence"]
-                
-                # Adjust z-alpha based on test type
-                if params["test_type"] == "one-sided":
-                    z_alpha = _stats_z_score(1 - alpha)
-                else:  # two-sided
-                    z_alpha = _stats_z_score(1 - alpha / 2)
-                    
-                z_beta = _stats_z_score(power)
-                
-                # Calculate MDE as percentage of baseline rate
-                if visitors_per_variant > 0:
-                    p2 = baseline_rate
-                    variance = baseline_rate * (1 - baseline_rate) + p2 * (1 - p2)
-                    mde_absolute = math.sqrt((variance * (z_alpha + z_beta)**2) / visitors_per_variant)
-                    mde_relative = (mde_absolute / baseline_rate) * 100
-                else:
-                    mde_relative = float('inf')
-            else:  # bayesian
-                # Simplified Bayesian estimate
-                if visitors_per_variant > 0:
-                    # This is a simplification for the relative MDE
-                    confidence_factor = 3 if params["confidence"] >= 0.95 else 2  # Higher confidence needs larger effect
-                    mde_relative = (confidence_factor * math.sqrt(baseline_rate * (1 - baseline_rate) / visitors_per_variant) / baseline_rate) * 100
-                else:
-                    mde_relative = float('inf')
-            
-            # Determine status
-            status = "durée optimale"
-            if week < estimated_weeks / 2:
-                status = "durée trop courte"
-            elif week > estimated_weeks * 1.2:
-                status = "durée trop longue"
-            
-            weekly_evolution.append({
-                "week": week,
-                "visitors_per_variant": visitors_per_variant,
-                "mde_relative": round(mde_relative, 1),
-                "status": status
-            })
+        params = request.dict()
+        if request.statistical_method == "bayesian" and bayesian_mode == "incremental":
+            # Simulation incrémentale (jusqu'à plusieurs secondes): exécutée dans le pool de processus
+            return await calculation_pool.run(
+                calculate_mde_evolution, params, granularity=granularity, horizon=horizon, bayesian_mode=bayesian_mode
+            )
         
-        # Log and return result
-        logger.info(f"Generated weekly evolution data with {len(weekly_evolution)} weeks")
-        return weekly_evolution
+        # Durée requise en forme close: pas de recherche ni de simulation
+        return calculate_mde_evolution(
+            params, granularity=granularity, horizon=horizon, bayesian_mode=bayesian_mode
+        )
+    except PoolSaturatedError as e:
+        logger.warning(f"Evolution rejected: {str(e)}")
+        raise HTTPException(status_code=503, detail="Calculation capacity exhausted. Try again later.", headers={"Retry-After": "1"})
+    except PoolTimeoutError as e:
+        logger.error(f"Evolution timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"Calculation timed out: {str(e)}")
     except Exception as e:
-        logger.error(f"Error calculating weekly evolution: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error calculating weekly evolution: {str(e)}")
+        logger.error(f"Error calculating evolution: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error calculating evolution: {str(e)}")
 
 
-def _stats_z_score(p: float) -> float:
+@router.get(
+    "/estimate/cache-stats",
+    summary="Estimate cache statistics",
+    description="Hit/miss counters of the estimate result cache",
+)
+async def estimate_cache_statistics() -> Dict[str, Any]:
     """
-    Calculate z-score from probability.
-    This is a simplified version of the function in the statistics service.
+    Retourne des statistiques sur l'utilisation du cache des estimations
     """
-    # Simple handling of extreme values
-    if p <= 0 or p >= 1:
-        return -6 if p < 0.5 else 6
-    
-    # Use scipy's more accurate implementation
-    return stats.norm.ppf(p) 
\ No newline at end of file
+    return get_estimate_cache_stats()
+
@@ -1,169 +1,230 @@
 import httpx
 import time
+from typing import Optional, List
 from fastapi import HTTPException
+from app.core.prompts import get_prompt_by_message_position, get_language_instruction
+from app.core.language import detect_language
 from app.routers.hypothesis.models import HypothesisResponse
 from app.routers.hypothesis.data_extraction import extract_structured_data
+from app.services.llm_services import huggingface_service, deepseek_service
 
 # Paramètres standard utilisés dans toutes les API calls (importants pour le caching)
 DEFAULT_TEMPERATURE = 0.7
 DEFAULT_MAX_TOKENS = 1024
 DEFAULT_TOP_P = 0.9
 
-async def call_huggingface_api(messages, api_key, model_name, conversation_id, detected_language="en"):
+def build_generation_messages(user_message: str, message_history: Optional[List[dict]] = None):
     """
-    Appel à l'API Hugging Face pour le modèle Llama
+    Prépare les messages envoyés au modèle (prompt système, langue, historique).
+    Retourne (messages, detected_language).
     """
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        api_url = f"https://api-inference.huggingface.co/models/{model_name}"
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Debug logging
-        print(f"Using HF model: {model_name}")
-        print(f"Using API URL: {api_url}")
-        
-        # Essayer le format structuré d'abord
-        try:
-            payload = {
-                "inputs": messages,
-                "parameters": {
-                    "max_new_tokens": DEFAULT_MAX_TOKENS,
-                    "temperature": DEFAULT_TEMPERATURE,
-                    "top_p": DEFAULT_TOP_P
-                }
-            }
-            
-            response = await client.post(
-                api_url,
-                json=payload,
-                headers=headers
-            )
-            
-            if response.status_code == 422:  # Format non accepté
-                raise ValueError("Format payload non accepté")
-                
-        except (ValueError, httpx.HTTPStatusError):
-            # Essayer avec juste le message comme input
-            print("Trying alternative payload format...")
-            last_message = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else ""
-            
-            payload = {
-                "inputs": last_message,
-                "parameters": {
-                    "max_new_tokens": DEFAULT_MAX_TOKENS,
-                    "temperature": DEFAULT_TEMPERATURE,
-                    "top_p": DEFAULT_TOP_P,
-                    "return_full_text": False
-                }
-            }
-            
-            response = await client.post(
-                api_url,
-                json=payload,
-                headers=headers
-            )
-        
-        if response.status_code != 200:
-            error_detail = f"Hugging Face API error ({response.status_code}): {response.text}"
-            print(f"API Error: {error_detail}")
-            raise HTTPException(status_code=response.status_code, detail=error_detail)
-        
-        data = response.json()
-        print(f"Response data type: {type(data)}")
-        
-        # Extract generated text depending on HF return format
-        assistant_message = None
-        
-        # Handle different response formats
-        if isinstance(data, list) and len(data) > 0:
-            # Format: [{"generated_text": "..."}]
-            assistant_message = data[0].get("generated_text", "")
-        elif isinstance(data, dict):
-            if "generated_text" in data:
-                # Format: {"generated_text": "..."}
-                assistant_message = data["generated_text"]
-            elif "choices" in data and data["choices"]:
-                # Format: {"choices": [{"message": {"content": "..."}}]}
-                assistant_message = data["choices"][0]["message"]["content"]
-        
-        if not assistant_message:
-            print(f"Unexpected response format: {data}")
-            raise HTTPException(status_code=500, detail="Invalid response format from Hugging Face API")
-        
-        # Extraire les éventuelles données structurées (tables, etc.)
-        structured_data = extract_structured_data(assistant_message)
-        
-        # Return the result
-        return HypothesisResponse(
-            message=assistant_message,
-            conversation_id=conversation_id,
-            timestamp=time.time(),
-            structured_data=structured_data,
-            lang_confidence=0.95 if detected_language in ['en', 'fr', 'es', 'de'] else 0.8
-        )
+    # Déterminer si c'est le premier message de l'utilisateur
+    is_first_message = not message_history or len(message_history) <= 1
+    
+    # Utiliser notre fonction de gestion de prompts selon la position du message
+    system_prompt = get_prompt_by_message_position(is_first_message)
+    
+    # Détecter la langue de l'utilisateur avec notre module de détection
+    detected_language = detect_language(user_message)
+    
+    print(f"Detected language: {detected_language}")
+    
+    # Ajouter une instruction explicite pour la langue détectée
+    language_instruction = get_language_instruction(detected_language)
+    
+    # Prepare the history for the API
+    messages = []
+    messages.append({"role": "system", "content": system_prompt})
+    
+    # Ajouter l'instruction de langue comme premier message
+    messages.append({"role": "system", "content": language_instruction})
+    
+    if message_history:
+        for msg in message_history:
+            role = msg.get("role", "")
+            content = msg.get("content", "")
+            if role in ["user", "assistant"]:
+                messages.append({"role": role, "content": content})
+    
+    # Add the current message
+    messages.append({"role": "user", "content": user_message})
+    
+    return messages, detected_language
 
-async def call_deepseek_api(messages, api_key, api_url, conversation_id, model_type="deepseek-chat", detected_language="en"):
+def build_hypothesis_response(assistant_message, conversation_id, detected_language="en"):
     """
-    Appel à l'API Deepseek directement
+    Construit la réponse finale à partir du message complet de l'assistant
+    """
+    # Extraire les éventuelles données structurées (tables, etc.)
+    structured_data = extract_structured_data(assistant_message)
+    
+    return HypothesisResponse(
+        message=assistant_message,
+        conversation_id=conversation_id,
+        timestamp=time.time(),
+        structured_data=structured_data,
+        lang_confidence=0.95 if detected_language in ['en', 'fr', 'es', 'de'] else 0.8
+    )
+
+async def call_huggingface_api(messages, api_key, model_name, conversation_id, detected_language="en"):
+    """
+    Appel à l'API Hugging Face pour le modèle Llama
     """
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
+    api_url = f"https://api-inference.huggingface.co/models/{model_name}"
+    
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    # Debug logging
+    print(f"Using HF model: {model_name}")
+    print(f"Using API URL: {api_url}")
+    
+    # Essayer le format structuré d'abord
+    try:
+        payload = {
+            "inputs": messages,
+            "parameters": {
+                "max_new_tokens": DEFAULT_MAX_TOKENS,
+                "temperature": DEFAULT_TEMPERATURE,
+                "top_p": DEFAULT_TOP_P
+            }
         }
         
-        # Sélection du modèle Deepseek basée sur le type
-        model_name = "deepseek-chat"
-        if model_type == "deepseek-reasoner":
-            model_name = "deepseek-reasoner"
+        response = await huggingface_service.request(
+            "POST",
+            api_url,
+            json=payload,
+            headers=headers
+        )
         
-        # Debug logging
-        print(f"Using Deepseek model: {model_name}")
-        print(f"Using Deepseek API URL: {api_url}")
+        if response.status_code == 422:  # Format non accepté
+            raise ValueError("Format payload non accepté")
+            
+    except (ValueError, httpx.HTTPStatusError):
+        # Essayer avec juste le message comme input
+        print("Trying alternative payload format...")
+        last_message = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else ""
         
         payload = {
-            "model": model_name,
-            "messages": messages,
-            "temperature": DEFAULT_TEMPERATURE,
-            "top_p": DEFAULT_TOP_P,
-            "max_tokens": DEFAULT_MAX_TOKENS
+            "inputs": last_message,
+            "parameters": {
+                "max_new_tokens": DEFAULT_MAX_TOKENS,
+                "temperature": DEFAULT_TEMPERATURE,
+                "top_p": DEFAULT_TOP_P,
+                "return_full_text": False
+            }
         }
         
-        response = await client.post(
+        response = await huggingface_service.request(
+            "POST",
             api_url,
             json=payload,
             headers=headers
         )
-        
-        if response.status_code != 200:
-            error_detail = f"Deepseek API error ({response.status_code}): {response.text}"
-            print(f"API Error: {error_detail}")
-            raise HTTPException(status_code=response.status_code, detail=error_detail)
-        
-        data = response.json()
-        print(f"Deepseek Response: {data}")
-        
-        # Format typique de réponse Deepseek: {"id": "...", "choices": [{"message": {"role": "assistant", "content": "..."}}]}
-        if "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0]:
+    
+    if response.status_code != 200:
+        error_detail = f"Hugging Face API error ({response.status_code}): {response.text}"
+        print(f"API Error: {error_detail}")
+        raise HTTPException(status_code=response.status_code, detail=error_detail)
+    
+    data = response.json()
+    print(f"Response data type: {type(data)}")
+    
+    # Extract generated text depending on HF return format
+    assistant_message = None
+    
+    # Handle different response formats
+    if isinstance(data, list) and len(data) > 0:
+        # Format: [{"generated_text": "..."}]
+        assistant_message = data[0].get("generated_text", "")
+    elif isinstance(data, dict):
+        if "generated_text" in data:
+            # Format: {"generated_text": "..."}
+            assistant_message = data["generated_text"]
+        elif "choices" in data and data["choices"]:
+            # Format: {"choices": [{"message": {"content": "..."}}]}
             assistant_message = data["choices"][0]["message"]["content"]
-        else:
-            print(f"Unexpected Deepseek response format: {data}")
-            raise HTTPException(status_code=500, detail="Invalid response format from Deepseek API")
-        
-        # Extraire les données structurées
-        structured_data = extract_structured_data(assistant_message)
-        
-        # Return the result
-        return HypothesisResponse(
-            message=assistant_message,
-            conversation_id=conversation_id,
-            timestamp=time.time(),
-            structured_data=structured_data,
-            lang_confidence=0.95 if detected_language in ['en', 'fr', 'es', 'de'] else 0.8
+    
+    if not assistant_message:
+        print(f"Unexpected response format: {data}")
+        raise HTTPException(status_code=500, detail="Invalid response format from Hugging Face API")
+    
+    return build_hypothesis_response(assistant_message, conversation_id, detected_language)
+
+async def call_deepseek_api(messages, api_key, api_url, conversation_id, model_type="deepseek-chat", detected_language="en"):
+    """
+    Appel à l'API Deepseek directement
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    # Sélection du modèle Deepseek basée sur le type
+    model_name = "deepseek-chat"
+    if model_type == "deepseek-reasoner":
+        model_name = "deepseek-reasoner"
+    
+    # Debug logging
+    print(f"Using Deepseek model: {model_name}")
+    print(f"Using Deepseek API URL: {api_url}")
+    
+    payload = {
+        "model": model_name,
+        "messages": messages,
+        "temperature": DEFAULT_TEMPERATURE,
+        "top_p": DEFAULT_TOP_P,
+        "max_tokens": DEFAULT_MAX_TOKENS
+    }
+    
+    response = await deepseek_service.request(
+        "POST",
+        api_url,
+        json=payload,
+        headers=headers
+    )
+    
+    if response.status_code != 200:
+        error_detail = f"Deepseek API error ({response.status_code}): {response.text}"
+        print(f"API Error: {error_detail}")
+        raise HTTPException(status_code=response.status_code, detail=error_detail)
+    
+    data = response.json()
+    print(f"Deepseek Response: {data}")
+    
+    # Format typique de réponse Deepseek: {"id": "...", "choices": [{"message": {"role": "assistant", "content": "..."}}]}
+    if "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0]:
+        assistant_message = data["choices"][0]["message"]["content"]
+    else:
+        print(f"Unexpected Deepseek response format: {data}")
+        raise HTTPException(status_code=500, detail="Invalid response format from Deepseek API")
+    
+    return build_hypothesis_response(assistant_message, conversation_id, detected_language)
+
+async def call_generation_api(model, messages, conversation_id, detected_language, hf_api_key, deepseek_api_key, settings):
+    """
+    Appel au fournisseur correspondant au modèle demandé (llama, deepseek, deepseek-reasoner)
+    """
+    if model == "llama":
+        return await call_huggingface_api(
+            messages,
+            hf_api_key,
+            settings.hf_llama_model,
+            conversation_id,
+            detected_language
         )
+    
+    model_type = "deepseek-reasoner" if model == "deepseek-reasoner" else "deepseek-chat"
+    return await call_deepseek_api(
+        messages,
+        deepseek_api_key,
+        settings.deepseek_api_url,
+        conversation_id,
+        model_type,
+        detected_language
+    )
 
 async def call_title_api(messages, api_key, api_url, model_type):
     """
@@ -172,74 +233,76 @@ async def call_title_api(messages, api_key, api_url, model_type):
     try:
         if model_type == "llama":
             # Hugging Face API
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                api_url = f"https://api-inference.huggingface.co/models/{api_url}"
-                
-                headers = {
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                payload = {
-                    "inputs": messages[-1]["content"],
-                    "parameters": {
-                        "max_new_tokens": 50,
-                        "temperature": 0.5,
-                        "top_p": 0.9,
-                        "return_full_text": False
-                    }
-                }
-                
-                response = await client.post(
-                    api_url,
-                    json=payload,
-                    headers=headers
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(status_code=response.status_code, detail=f"API error: {response.text}")
-                
-                data = response.json()
-                if isinstance(data, list) and len(data) > 0:
-                    return data[0].get("generated_text", "").strip()
-                else:
-                    return "Nouvelle hypothèse"
-        else:
-            # Deepseek API
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                headers = {
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                # Fix: Utiliser toujours "deepseek-chat" pour les titres avec Deepseek
-                # Le modèle Reasoner cause des erreurs avec les requêtes courtes
-                model_name = "deepseek-chat"
-                
-                payload = {
-                    "model": model_name,
-                    "messages": messages,
+            api_url = f"https://api-inference.huggingface.co/models/{api_url}"
+            
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+            
+            payload = {
+                "inputs": messages[-1]["content"],
+                "parameters": {
+                    "max_new_tokens": 50,
                     "temperature": 0.5,
                     "top_p": 0.9,
-                    "max_tokens": 50
+                    "return_full_text": False
                 }
-                
-                print(f"Generating title with model: {model_name}")
-                
-                response = await client.post(
-                    api_url,
-                    json=payload,
-                    headers=headers
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(status_code=response.status_code, detail=f"API error: {response.text}")
-                
-                data = response.json()
-                if "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0]:
-                    return data["choices"][0]["message"]["content"].strip()
-                else:
-                    return "Nouvelle hypothèse"
+            }
+            
+            response = await huggingface_service.request(
+                "POST",
+                api_url,
+                json=payload,
+                headers=headers,
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                raise HTTPException(status_code=response.status_code, detail=f"API error: {response.text}")
+            
+            data = response.json()
+            if isinstance(data, list) and len(data) > 0:
+                return data[0].get("generated_text", "").strip()
+            else:
+                return "Nouvelle hypothèse"
+        else:
+            # Deepseek API
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+            
+            # Fix: Utiliser toujours "deepseek-chat" pour les titres avec Deepseek
+            # Le modèle Reasoner cause des erreurs avec les requêtes courtes
+            model_name = "deepseek-chat"
+            
+            payload = {
+                "model": model_name,
+                "messages": messages,
+                "temperature": 0.5,
+                "top_p": 0.9,
+                "max_tokens": 50
+            }
+            
+            print(f"Generating title with model: {model_name}")
+            
+            response = await deepseek_service.request(
+                "POST",
+                api_url,
+                json=payload,
+                headers=headers,
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                raise HTTPException(status_code=response.status_code, detail=f"API error: {response.text}")
+            
+            data = response.json()
+            if "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0]:
+                return data["choices"][0]["message"]["content"].strip()
+            else:
+                return "Nouvelle hypothèse"
     except Exception as e:
         print(f"Error in call_title_api: {str(e)}")
         return "Nouvelle hypothèse" 
\ No newline at end of file
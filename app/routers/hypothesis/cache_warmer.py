@@ -0,0 +1,284 @@
+"""
+Préchauffage du cache des réponses aux premiers messages.
+
+Les premiers messages partagent le même prompt système et la même instruction
+de langue : les questions d'amorce les plus fréquentes produisent donc les
+mêmes clés de cache d'un utilisateur à l'autre. Après un déploiement, le cache
+mémoire est vide et ces questions coûtent un appel au fournisseur chacune.
+
+Le préchauffage génère à l'avance les réponses des N premiers messages les plus
+fréquents de chaque langue (fichier CACHE_WARM_FILE et/ou classement Redis des
+premiers messages reçus), avec un nombre limité d'appels simultanés, au
+démarrage puis éventuellement toutes les CACHE_WARM_INTERVAL secondes.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import Settings, get_settings
+from app.core.language import FULLY_SUPPORTED_LANGUAGES
+from app.core.cache import generate_cache_key, get_cached_responses, cache_response, memory_cache
+from app.core.redis_client import redis_async, redis_breaker
+from app.core.single_flight import hypothesis_flight
+from app.core.semantic_cache import semantic_cache
+from app.routers.hypothesis.models import HypothesisResponse
+from app.routers.hypothesis.api_calls import build_generation_messages, call_generation_api
+
+# Classement Redis des premiers messages (score = nombre de demandes), supprimé après
+# CACHE_WARM_PROMPTS_TTL secondes sans nouveau message
+POPULAR_PROMPTS_KEY = "hypothesis:first_messages:{model}:{language}"
+
+# Taille maximale d'un classement (les prompts les moins demandés sont retirés)
+MAX_TRACKED_PROMPTS = 1000
+
+# Les messages plus longs ne sont pas des questions d'amorce réutilisables
+MAX_TRACKED_PROMPT_CHARS = 500
+
+# Estimation du coût: environ 4 caractères par token
+CHARS_PER_TOKEN = 4
+
+
+class CacheWarmer:
+    """
+    Préchauffe le cache avec les premiers messages les plus fréquents, pour chaque langue supportée
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._tracking_tasks = set()
+        self.stats = {
+            "runs": 0,
+            "warmed": 0,            # réponses générées et mises en cache
+            "already_cached": 0,    # prompts déjà en cache (mémoire ou Redis)
+            "failed": 0,
+            "provider_calls": 0,
+            "provider_time": 0.0,   # secondes passées en appels au fournisseur
+            "estimated_tokens": 0   # entrée et sortie des appels
+        }
+        # Avancement du dernier passage
+        self.last_run: Dict[str, Any] = {}
+
+    def record_first_message(self, model: str, language: str, message: str):
+        """
+        Compte un premier message dans le classement Redis (sans attendre la réponse de Redis)
+        """
+        message = message.strip()
+        if not redis_async or not message or len(message) > MAX_TRACKED_PROMPT_CHARS:
+            return
+        task = asyncio.ensure_future(self._record(POPULAR_PROMPTS_KEY.format(model=model, language=language), message))
+        self._tracking_tasks.add(task)
+        task.add_done_callback(self._tracking_tasks.discard)
+
+    async def _record(self, key: str, message: str):
+        async def write_pipeline():
+            async with redis_async.pipeline(transaction=False) as pipe:
+                pipe.zincrby(key, 1, message)
+                pipe.zremrangebyrank(key, 0, -(MAX_TRACKED_PROMPTS + 1))
+                pipe.expire(key, get_settings().CACHE_WARM_PROMPTS_TTL)
+                return await pipe.execute()
+
+        try:
+            await redis_breaker.call(write_pipeline)
+        except Exception as e:
+            print(f"Cache warmer: error recording first message: {e}")
+
+    def load_file_prompts(self, path: str) -> Dict[str, List[str]]:
+        """
+        Lit les prompts par langue d'un fichier JSON: {"fr": ["...", ...], "en": [...], ...}
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected an object of prompt lists by language")
+
+        prompts = {}
+        for language, items in data.items():
+            if language not in FULLY_SUPPORTED_LANGUAGES:
+                print(f"Cache warmer: ignoring unsupported language '{language}' in {path}")
+                continue
+            prompts[language] = [item.strip() for item in items if isinstance(item, str) and item.strip()]
+        return prompts
+
+    async def load_redis_prompts(self, models: List[str], top_n: int) -> Dict[Tuple[str, str], List[str]]:
+        """
+        Lit les top_n premiers messages de chaque classement (un seul aller-retour Redis)
+        """
+        if not redis_async:
+            return {}
+        pairs = [(model, language) for model in models for language in FULLY_SUPPORTED_LANGUAGES]
+
+        async def read_pipeline():
+            async with redis_async.pipeline(transaction=False) as pipe:
+                for model, language in pairs:
+                    pipe.zrevrange(POPULAR_PROMPTS_KEY.format(model=model, language=language), 0, top_n - 1)
+                return await pipe.execute()
+
+        try:
+            results = await redis_breaker.call(read_pipeline)
+        except Exception as e:
+            print(f"Cache warmer: Redis access statistics unavailable ({e})")
+            return {}
+        return {
+            pair: [item.decode("utf-8") if isinstance(item, bytes) else item for item in items]
+            for pair, items in zip(pairs, results)
+        }
+
+    async def load_prompts(self, models: List[str], top_n: int, path: str = "") -> Dict[Tuple[str, str], List[str]]:
+        """
+        Prompts à préchauffer par (modèle, langue): ceux du fichier d'abord, puis les plus demandés
+        """
+        file_prompts = {}
+        if path:
+            try:
+                file_prompts = self.load_file_prompts(path)
+            except (OSError, ValueError) as e:
+                print(f"Cache warmer: unable to read {path}: {e}")
+        redis_prompts = await self.load_redis_prompts(models, top_n)
+
+        prompts = {}
+        for model in models:
+            for language in FULLY_SUPPORTED_LANGUAGES:
+                candidates = file_prompts.get(language, []) + redis_prompts.get((model, language), [])
+                # Dédoublonnage en conservant l'ordre
+                prompts[(model, language)] = list(dict.fromkeys(candidates))[:top_n]
+        return prompts
+
+    async def warm(
+        self,
+        models: Optional[List[str]] = None,
+        top_n: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        path: Optional[str] = None,
+        settings: Optional[Settings] = None
+    ) -> Dict[str, Any]:
+        """
+        Un passage de préchauffage: génère les réponses absentes du cache.
+        Ignoré si un passage est déjà en cours.
+        """
+        if self._lock.locked():
+            print("Cache warmer: a run is already in progress")
+            return self.get_stats()
+
+        async with self._lock:
+            settings = settings or get_settings()
+            models = models or settings.CACHE_WARM_MODELS
+            top_n = top_n or settings.CACHE_WARM_TOP_N
+            concurrency = concurrency or settings.CACHE_WARM_CONCURRENCY
+            path = settings.CACHE_WARM_FILE if path is None else path
+
+            # Modèles sans clé API: rien à préchauffer
+            api_keys = {
+                "llama": settings.hf_api_key,
+                "deepseek": settings.deepseek_api_key,
+                "deepseek-reasoner": settings.deepseek_api_key
+            }
+            usable_models = [model for model in models if model in api_keys and api_keys[model]]
+            for model in set(models) - set(usable_models):
+                print(f"Cache warmer: skipping model '{model}' (unknown model or missing API key)")
+
+            started = time.time()
+            self.last_run = {
+                "started_at": started,
+                "duration": None,
+                "prompts": 0,
+                "done": 0,
+                "warmed": 0,
+                "already_cached": 0,
+                "failed": 0,
+                "in_progress": True
+            }
+            self.stats["runs"] += 1
+
+            jobs = []
+            prompts = await self.load_prompts(usable_models, top_n, path)
+            for (model, language), items in prompts.items():
+                for prompt in items:
+                    messages, detected_language = build_generation_messages(prompt)
+                    cache_key = generate_cache_key(messages, model)
+                    jobs.append((model, prompt, messages, detected_language, cache_key))
+            self.last_run["prompts"] = len(jobs)
+
+            # Présence dans le cache en une seule lecture (les entrées Redis remontent en mémoire)
+            cached = await get_cached_responses([job[4] for job in jobs], count_stats=False)
+            self._count("already_cached", len(cached))
+            self.last_run["done"] += len(cached)
+
+            semaphore = asyncio.Semaphore(max(1, concurrency))
+            await asyncio.gather(*(
+                self._warm_one(*job, api_keys[job[0]], semaphore, settings)
+                for job in jobs if job[4] not in cached
+            ))
+
+            self.last_run["duration"] = round(time.time() - started, 3)
+            self.last_run["in_progress"] = False
+            print(f"Cache warmer: run completed | {self.last_run}")
+            return self.get_stats()
+
+    async def _warm_one(self, model, prompt, messages, detected_language, cache_key, api_key, semaphore, settings):
+        async with semaphore:
+            async def call_model() -> HypothesisResponse:
+                start_time = time.perf_counter()
+                llm_response = await call_generation_api(
+                    model,
+                    messages,
+                    f"warm_{int(time.time() * 1000)}",
+                    detected_language,
+                    api_key,
+                    api_key,
+                    settings
+                )
+                self.stats["provider_calls"] += 1
+                self.stats["provider_time"] += time.perf_counter() - start_time
+                prompt_chars = sum(len(message["content"]) for message in messages)
+                self.stats["estimated_tokens"] += (prompt_chars + len(llm_response.message)) // CHARS_PER_TOKEN
+
+                await cache_response(cache_key, llm_response)
+                if settings.SEMANTIC_CACHE_ENABLED:
+                    semantic_cache.add(prompt, model, detected_language, llm_response.dict())
+                return llm_response
+
+            try:
+                # Partagé avec une requête identique en cours (ou le préchauffage d'un autre worker)
+                llm_response = await hypothesis_flight.do(
+                    cache_key,
+                    call_model,
+                    encode=lambda response: response.json(),
+                    decode=HypothesisResponse.parse_raw
+                )
+                memory_cache[cache_key] = llm_response
+                self._count("warmed")
+            except Exception as e:
+                print(f"Cache warmer: error warming '{prompt[:50]}': {e}")
+                self._count("failed")
+            self.last_run["done"] += 1
+
+    def _count(self, stat: str, amount: int = 1):
+        self.stats[stat] += amount
+        self.last_run[stat] += amount
+
+    async def run_forever(self, interval: Optional[float] = None):
+        """
+        Tâche de fond: un passage au démarrage, puis toutes les interval secondes (0 = une seule fois)
+        """
+        interval = get_settings().CACHE_WARM_INTERVAL if interval is None else interval
+        while True:
+            try:
+                await self.warm()
+            except Exception as e:
+                print(f"Cache warmer: run failed: {e}")
+            if not interval:
+                return
+            await asyncio.sleep(interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "provider_time": round(self.stats["provider_time"], 3),
+            "enabled": get_settings().CACHE_WARM_ENABLED,
+            "last_run": self.last_run
+        }
+
+
+cache_warmer = CacheWarmer()
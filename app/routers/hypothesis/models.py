@@ -27,4 +27,11 @@ class ThinkingStep(BaseModel):
     step: str
     status: str  # 'processing'|'completed'|'error'
     details: Optional[str] = None
-    reasoning_content: Optional[str] = None 
\ No newline at end of file
+    reasoning_content: Optional[str] = None
+    # Protocole delta (voir streaming.ReasoningEncoder)
+    reasoning_delta: Optional[str] = None
+    seq: Optional[int] = None
+    reasoning_length: Optional[int] = None
+    checksum: Optional[str] = None
+    # Réponse finale complète (étape "answer")
+    response: Optional[HypothesisResponse] = None
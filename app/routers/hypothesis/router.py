@@ -1,19 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from fastapi.responses import JSONResponse, StreamingResponse
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 import time
 import json
 import asyncio
 
 from app.core.config import Settings, get_settings
 from app.services.rate_limiter import RateLimiter
-from app.core.prompts import (
-    TITLE_GENERATION_PROMPT, 
-    get_prompt_by_message_position,
-    get_language_instruction
-)
+from app.core.prompts import TITLE_GENERATION_PROMPT
 from app.core.language import detect_language, get_language_name
 from app.core.cache import generate_cache_key, get_cached_response, cache_response, get_cache_stats
+from app.core.single_flight import hypothesis_flight, title_flight
+from app.core.semantic_cache import semantic_cache
+from app.services.worker_pool import calculation_pool
+from app.core.http_clients import http_clients
+from app.core.circuit_breaker import CircuitOpenError
+from app.services.base_external_service import get_breakers_stats
+from app.routers.hypothesis.cache_warmer import cache_warmer
 
 from app.routers.hypothesis.models import (
     HypothesisRequest,
@@ -22,11 +25,14 @@ from app.routers.hypothesis.models import (
     TitleResponse,
     ThinkingStep
 )
-from app.routers.hypothesis.streaming import stream_deepseek_response
+from app.routers.hypothesis.streaming import stream_deepseek_response, stream_deepseek_content, DELTA_FIELDS
 from app.routers.hypothesis.api_calls import (
     call_huggingface_api,
     call_deepseek_api, 
-    call_title_api
+    call_title_api,
+    call_generation_api,
+    build_hypothesis_response,
+    build_generation_messages
 )
 from app.routers.hypothesis.data_extraction import extract_structured_data
 
@@ -36,7 +42,18 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-rate_limiter = RateLimiter(max_requests=10, time_window=60)  # 10 requests per minute
+rate_limiter = RateLimiter(max_requests=10, time_window=60, name="hypothesis")  # 10 requests per minute
+
+async def apply_rate_limit(client_ip: str) -> Dict[str, str]:
+    """
+    Applique la limite de requêtes du client et retourne les en-têtes RateLimit-*.
+    Lève une erreur 429 (avec Retry-After) si la limite est atteinte.
+    """
+    decision = await rate_limiter.check(client_ip)
+    headers = rate_limiter.decision_headers(decision)
+    if not decision.allowed:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.", headers=headers)
+    return headers
 
 @router.get("/check-config")
 async def check_config(settings: Settings = Depends(get_settings)):
@@ -55,20 +72,11 @@ async def check_config(settings: Settings = Depends(get_settings)):
         "deepseek_api_key_starts_with": settings.deepseek_api_key[:5] + "..." if settings.deepseek_api_key else None
     }
 
-@router.post("/generate", response_model=HypothesisResponse)
-async def generate_hypothesis(
-    request: HypothesisRequest,
-    req: Request,
-    settings: Settings = Depends(get_settings)
-):
-    # Apply rate limiting
-    client_ip = req.client.host
-    if not rate_limiter.is_allowed(client_ip):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.")
-    
-    # Create a conversation ID if one doesn't exist
-    conversation_id = request.conversation_id or f"conv_{int(time.time() * 1000)}"
-    
+def _validate_generation_request(request, settings: Settings):
+    """
+    Vérifie le modèle demandé et les clés API disponibles.
+    Retourne (model, hf_api_key, deepseek_api_key).
+    """
     # Sélection du modèle
     model = request.model.lower()
     if model not in ["llama", "deepseek", "deepseek-reasoner"]:
@@ -94,86 +102,182 @@ async def generate_hypothesis(
             detail="DEEPSEEK_API_KEY not configured. Please provide it in the request or set the environment variable."
         )
     
+    return model, hf_api_key, deepseek_api_key
+
+@router.post("/generate", response_model=HypothesisResponse)
+async def generate_hypothesis(
+    request: HypothesisRequest,
+    req: Request,
+    response: Response,
+    settings: Settings = Depends(get_settings)
+):
+    # Apply rate limiting
+    client_ip = req.client.host
+    response.headers.update(await apply_rate_limit(client_ip))
+    
+    # Create a conversation ID if one doesn't exist
+    conversation_id = request.conversation_id or f"conv_{int(time.time() * 1000)}"
+    
+    model, hf_api_key, deepseek_api_key = _validate_generation_request(request, settings)
+    
     try:
-        # Déterminer si c'est le premier message de l'utilisateur
-        is_first_message = not request.message_history or len(request.message_history) <= 1
-        
-        # Utiliser notre fonction de gestion de prompts selon la position du message
-        system_prompt = get_prompt_by_message_position(is_first_message)
-        
-        # Détecter la langue de l'utilisateur avec notre module de détection
-        user_message = request.message
-        detected_language = detect_language(user_message)
-        
-        print(f"Detected language: {detected_language}")
-        
-        # Ajouter une instruction explicite pour la langue détectée
-        language_instruction = get_language_instruction(detected_language)
-        
-        # Prepare the history for the API
-        messages = []
-        messages.append({"role": "system", "content": system_prompt})
-        
-        # Ajouter l'instruction de langue comme premier message
-        messages.append({"role": "system", "content": language_instruction})
-        
-        if request.message_history:
-            for msg in request.message_history:
-                role = msg.get("role", "")
-                content = msg.get("content", "")
-                if role in ["user", "assistant"]:
-                    messages.append({"role": role, "content": content})
-        
-        # Add the current message
-        messages.append({"role": "user", "content": request.message})
+        messages, detected_language = build_generation_messages(request.message, request.message_history)
         
         # Génération de la clé de cache
         cache_key = generate_cache_key(messages, model)
         
+        # Classement des premiers messages pour le préchauffage du cache
+        if settings.CACHE_WARM_ENABLED and not request.message_history:
+            cache_warmer.record_first_message(model, detected_language, request.message)
+        
         # Vérification du cache
-        cached_response = get_cached_response(cache_key)
+        cached_response = await get_cached_response(cache_key)
         if cached_response:
             print("Cache hit!")
-            return cached_response
+            # La réponse peut provenir d'une autre conversation (ou du préchauffage)
+            return cached_response.copy(update={"conversation_id": conversation_id})
         
-        # API Call depending on model (cache miss)
-        if model == "llama":
-            llm_response = await call_huggingface_api(
-                messages,
-                hf_api_key,
-                settings.hf_llama_model,
-                conversation_id,
-                detected_language
-            )
-        elif model == "deepseek-reasoner":
-            llm_response = await call_deepseek_api(
+        # Cache sémantique: premier message proche d'une question déjà posée
+        use_semantic_cache = settings.SEMANTIC_CACHE_ENABLED and not request.message_history
+        if use_semantic_cache:
+            similar_response = semantic_cache.lookup(request.message, model, detected_language)
+            if similar_response:
+                similar_response = HypothesisResponse(**{**similar_response, "conversation_id": conversation_id})
+                await cache_response(cache_key, similar_response)
+                return similar_response
+        
+        async def call_model() -> HypothesisResponse:
+            # API Call depending on model (cache miss)
+            llm_response = await call_generation_api(
+                model,
                 messages,
-                deepseek_api_key,
-                settings.deepseek_api_url,
                 conversation_id,
-                "deepseek-reasoner",
-                detected_language
-            )
-        else:  # deepseek standard
-            llm_response = await call_deepseek_api(
-                messages,
+                detected_language,
+                hf_api_key,
                 deepseek_api_key,
-                settings.deepseek_api_url,
-                conversation_id,
-                "deepseek-chat",
-                detected_language
+                settings
             )
+            
+            # Mise en cache de la réponse
+            await cache_response(cache_key, llm_response)
+            if use_semantic_cache:
+                semantic_cache.add(request.message, model, detected_language, llm_response.dict())
+            return llm_response
         
-        # Mise en cache de la réponse
-        cache_response(cache_key, llm_response)
-        
-        return llm_response
+        # Les requêtes identiques simultanées partagent un seul appel au fournisseur
+        llm_response = await hypothesis_flight.do(
+            cache_key,
+            call_model,
+            encode=lambda response: response.json(),
+            decode=HypothesisResponse.parse_raw
+        )
+        # Réponse partagée: chaque appelant retrouve son propre conversation_id
+        return llm_response.copy(update={"conversation_id": conversation_id})
             
+    except CircuitOpenError as e:
+        # Fournisseur en échec répété: refus immédiat plutôt qu'une attente jusqu'au délai
+        raise HTTPException(status_code=503, detail=f"Model provider unavailable: {str(e)}")
     except Exception as e:
         error_message = f"Error generating hypothesis: {str(e)}"
         print(f"Exception in generate_hypothesis: {error_message}")
         raise HTTPException(status_code=500, detail=error_message)
 
+@router.post("/generate/stream", response_class=StreamingResponse)
+async def generate_hypothesis_stream(
+    request: HypothesisRequest,
+    req: Request,
+    format: Literal["sse", "ndjson"] = "sse",
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Variante streamée de /generate : le texte de la réponse est transmis au fur et
+    à mesure (événements "delta"), puis la réponse complète (événement "final",
+    même contenu que /generate) qui est aussi mise en cache.
+    Format SSE (défaut, terminé par [DONE]) ou NDJSON (?format=ndjson).
+    """
+    # Apply rate limiting
+    client_ip = req.client.host
+    rate_limit_headers = await apply_rate_limit(client_ip)
+    
+    # Create a conversation ID if one doesn't exist
+    conversation_id = request.conversation_id or f"conv_{int(time.time() * 1000)}"
+    
+    model, hf_api_key, deepseek_api_key = _validate_generation_request(request, settings)
+    
+    def encode(event: Dict[str, Any]) -> str:
+        if format == "ndjson":
+            return json.dumps(event) + "\n"
+        return f"data: {json.dumps(event)}\n\n"
+    
+    async def event_generator():
+        try:
+            messages, detected_language = build_generation_messages(request.message, request.message_history)
+            cache_key = generate_cache_key(messages, model)
+            
+            if settings.CACHE_WARM_ENABLED and not request.message_history:
+                cache_warmer.record_first_message(model, detected_language, request.message)
+            
+            llm_response = await get_cached_response(cache_key)
+            if llm_response:
+                print("Cache hit!")
+                llm_response = llm_response.copy(update={"conversation_id": conversation_id})
+                yield encode({"type": "delta", "content": llm_response.message})
+            elif model == "llama":
+                # L'API Hugging Face n'est pas streamée: la réponse arrive en un seul bloc
+                llm_response = await call_huggingface_api(
+                    messages,
+                    hf_api_key,
+                    settings.hf_llama_model,
+                    conversation_id,
+                    detected_language
+                )
+                yield encode({"type": "delta", "content": llm_response.message})
+                await cache_response(cache_key, llm_response)
+            else:
+                model_type = "deepseek-reasoner" if model == "deepseek-reasoner" else "deepseek-chat"
+                parts = []
+                async for delta in stream_deepseek_content(
+                    messages,
+                    deepseek_api_key,
+                    settings.deepseek_api_url,
+                    model_type
+                ):
+                    parts.append(delta)
+                    yield encode({"type": "delta", "content": delta})
+                
+                if not parts:
+                    raise Exception("Invalid response format from Deepseek API")
+                
+                # Extraction des données structurées une seule fois, sur la réponse complète
+                llm_response = build_hypothesis_response("".join(parts), conversation_id, detected_language)
+                await cache_response(cache_key, llm_response)
+            
+            yield encode({"type": "final", "response": llm_response.dict()})
+        
+        except asyncio.CancelledError:
+            # Client déconnecté: la réponse incomplète n'est pas mise en cache
+            print("Generate stream cancelled - client disconnected")
+            raise
+        
+        except Exception as e:
+            error_message = f"Error generating hypothesis: {str(e)}"
+            print(f"Exception in generate_hypothesis_stream: {error_message}")
+            yield encode({"type": "error", "detail": error_message})
+        
+        if format == "sse":
+            # Envoyer un signal de fin pour fermer proprement la connexion
+            yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="application/x-ndjson" if format == "ndjson" else "text/event-stream",
+        headers={
+            **rate_limit_headers,
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Désactiver la mise en buffer pour Nginx
+        }
+    )
+
 @router.get("/stream", response_class=StreamingResponse)
 async def stream_hypothesis(
     message: str,
@@ -181,16 +285,18 @@ async def stream_hypothesis(
     model: str = 'deepseek-reasoner',
     api_key_huggingface: Optional[str] = None,
     api_key_deepseek: Optional[str] = None,
+    protocol: Literal["delta", "cumulative"] = "delta",
     req: Request = None,
     settings: Settings = Depends(get_settings)
 ):
     """
-    Endpoint qui stream le processus de génération d'hypothèse avec étapes de raisonnement en SSE
+    Endpoint qui stream le processus de génération d'hypothèse avec étapes de raisonnement en SSE.
+    protocol=delta (défaut) n'envoie que les nouveaux fragments de raisonnement ;
+    protocol=cumulative conserve l'ancien format (texte complet à chaque événement).
     """
     # Apply rate limiting
     client_ip = req.client.host if req else "unknown"
-    if not rate_limiter.is_allowed(client_ip):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.")
+    rate_limit_headers = await apply_rate_limit(client_ip)
     
     # Create a conversation ID if one doesn't exist
     conversation_id = conversation_id or f"conv_{int(time.time() * 1000)}"
@@ -212,16 +318,10 @@ async def stream_hypothesis(
     # Pour le message SSE
     async def event_generator():
         try:
-            # Préparer les messages
-            is_first_message = True  # Nous n'avons pas l'historique en GET, on suppose que c'est le premier message
-            system_prompt = get_prompt_by_message_position(is_first_message)
-            detected_language = detect_language(message)
-            language_instruction = get_language_instruction(detected_language)
-            
-            messages = []
-            messages.append({"role": "system", "content": system_prompt})
-            messages.append({"role": "system", "content": language_instruction})
-            messages.append({"role": "user", "content": message})
+            # Préparer les messages comme /generate (pas d'historique en GET: premier message),
+            # pour que la réponse finale soit mise en cache sous la même clé
+            messages, detected_language = build_generation_messages(message)
+            cache_key = generate_cache_key(messages, model)
             
             # Message de début du raisonnement avec la langue adaptée
             reasoning_label = "Analyse"
@@ -249,11 +349,20 @@ async def stream_hypothesis(
                     deepseek_api_key,
                     settings.deepseek_api_url,
                     model,
-                    detected_language
+                    detected_language,
+                    protocol,
+                    conversation_id
                 ):
-                    yield f"data: {json.dumps(chunk.dict())}\n\n"
-                    # Réduire le délai pour accélérer le stream
-                    await asyncio.sleep(0.01)
+                    if chunk.step == "answer" and chunk.response:
+                        # Un appel /generate identique sera servi par le cache
+                        await cache_response(cache_key, chunk.response)
+                    
+                    # Les deltas sont déjà regroupés par fenêtre: pas de délai artificiel
+                    if protocol == "delta":
+                        chunk_data = chunk.dict(exclude_none=True)
+                    else:
+                        chunk_data = chunk.dict(exclude=DELTA_FIELDS if chunk.response else DELTA_FIELDS | {"response"})
+                    yield f"data: {json.dumps(chunk_data)}\n\n"
                 
                 # Message final pour indiquer que c'est terminé
                 completion_label = "Analyse terminée"
@@ -322,6 +431,7 @@ async def stream_hypothesis(
         event_generator(), 
         media_type="text/event-stream",
         headers={
+            **rate_limit_headers,
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no"  # Désactiver la mise en buffer pour Nginx
@@ -332,12 +442,12 @@ async def stream_hypothesis(
 async def generate_title(
     request: TitleRequest,
     req: Request,
+    response: Response,
     settings: Settings = Depends(get_settings)
 ):
     # Apply rate limiting
     client_ip = req.client.host
-    if not rate_limiter.is_allowed(client_ip):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.")
+    response.headers.update(await apply_rate_limit(client_ip))
     
     # Sélection du modèle
     model = request.model.lower()
@@ -370,17 +480,25 @@ async def generate_title(
         
         # API Call depending on model
         if model == "llama":
-            response = await call_title_api(messages, hf_api_key, settings.hf_llama_model, "llama")
-        elif model == "deepseek-reasoner":
-            # Pour éviter les erreurs avec Deepseek Reasoner, utiliser toujours le modèle standard pour les titres
-            print("Notice: Using standard Deepseek model for title generation instead of Deepseek Reasoner")
-            response = await call_title_api(messages, deepseek_api_key, settings.deepseek_api_url, "deepseek")
-        else:  # deepseek standard
-            response = await call_title_api(messages, deepseek_api_key, settings.deepseek_api_url, "deepseek")
+            title_model = "llama"
+            api_key, api_url = hf_api_key, settings.hf_llama_model
+        else:
+            if model == "deepseek-reasoner":
+                # Pour éviter les erreurs avec Deepseek Reasoner, utiliser toujours le modèle standard pour les titres
+                print("Notice: Using standard Deepseek model for title generation instead of Deepseek Reasoner")
+            title_model = "deepseek"
+            api_key, api_url = deepseek_api_key, settings.deepseek_api_url
         
-        print(f"Generated title: {response}")
+        # Les demandes de titre identiques simultanées partagent un seul appel
+        title_key = generate_cache_key(messages, f"title:{title_model}", max_tokens=50, temperature=0.5)
+        title = await title_flight.do(
+            title_key,
+            lambda: call_title_api(messages, api_key, api_url, title_model)
+        )
+        
+        print(f"Generated title: {title}")
             
-        return TitleResponse(title=response)
+        return TitleResponse(title=title)
             
     except Exception as e:
         error_message = f"Error generating title: {str(e)}"
@@ -390,6 +508,37 @@ async def generate_title(
 @router.get("/cache-stats")
 async def cache_statistics():
     """
-    Retourne des statistiques sur l'utilisation du cache
+    Retourne des statistiques sur l'utilisation du cache et le regroupement des appels en cours
+    """
+    return {
+        **get_cache_stats(),
+        "semantic": semantic_cache.get_stats(),
+        "single_flight": {
+            "generate": hypothesis_flight.get_stats(),
+            "generate_title": title_flight.get_stats()
+        },
+        "warmer": cache_warmer.get_stats()
+    }
+
+@router.get("/rate-limit")
+async def rate_limit_status(req: Request, response: Response):
+    """
+    Retourne le quota restant du client (sans le consommer) et l'état du limiteur
+    """
+    remaining, reset_in = await rate_limiter.get_remaining(req.client.host)
+    response.headers.update(rate_limiter.headers(remaining, reset_in))
+    return {"remaining": remaining, "reset_in": reset_in, **rate_limiter.get_stats()}
+
+@router.get("/pool-stats")
+async def pool_statistics():
+    """
+    Retourne des statistiques sur le pool de calcul des estimations
+    """
+    return calculation_pool.get_stats()
+
+@router.get("/http-stats")
+async def http_statistics():
+    """
+    Retourne des statistiques sur les pools de connexions vers les fournisseurs et l'état de leurs disjoncteurs
     """
-    return get_cache_stats() 
\ No newline at end of file
+    return {**http_clients.get_stats(), "circuits": get_breakers_stats()}
@@ -1,22 +1,121 @@
 import httpx
 import json
-from typing import AsyncGenerator
+import time
+import zlib
+from typing import AsyncGenerator, List, Optional
 from app.routers.hypothesis.models import ThinkingStep
+from app.routers.hypothesis.api_calls import (
+    DEFAULT_TEMPERATURE,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_TOP_P,
+    build_hypothesis_response
+)
+from app.services.llm_services import deepseek_service
 import asyncio
 
+# Protocoles de transmission du raisonnement: deltas (défaut) ou texte cumulé (ancien format)
+REASONING_PROTOCOLS = ("delta", "cumulative")
+
+# Fenêtre de regroupement des deltas: envoi dès 256 caractères ou 50 ms
+REASONING_FLUSH_CHARS = 256
+REASONING_FLUSH_SECONDS = 0.05
+
+# Longueur et somme de contrôle envoyées tous les 20 événements
+REASONING_CHECKSUM_INTERVAL = 20
+
+# Champs du protocole delta, absents de l'ancien format
+DELTA_FIELDS = {"reasoning_delta", "seq", "reasoning_length", "checksum"}
+
+class ReasoningEncoder:
+    """
+    Regroupe les deltas de raisonnement et les encode en ThinkingStep.
+    
+    Protocole "delta": chaque événement porte seulement le nouveau texte
+    (reasoning_delta) et un numéro de séquence (seq) ; la longueur totale
+    (reasoning_length, en caractères) et le CRC32 du texte UTF-8 cumulé
+    (checksum) sont ajoutés périodiquement, et le dernier événement contient
+    l'instantané complet (reasoning_content) pour resynchroniser le client.
+    
+    Protocole "cumulative": ancien format, reasoning_content contient tout le
+    texte à chaque événement.
+    """
+    
+    def __init__(self, protocol: str = "delta"):
+        if protocol not in REASONING_PROTOCOLS:
+            raise ValueError(f"Unknown reasoning protocol: {protocol}. Supported: {', '.join(REASONING_PROTOCOLS)}")
+        self.protocol = protocol
+        self.parts: List[str] = []
+        self.pending: List[str] = []
+        self.pending_chars = 0
+        self.length = 0
+        self.checksum = 0
+        self.seq = 0
+        self.last_flush = time.monotonic()
+    
+    def add(self, delta: str) -> Optional[ThinkingStep]:
+        """Ajoute un delta; retourne un événement si la fenêtre est pleine"""
+        if not delta:
+            return None
+        self.pending.append(delta)
+        self.pending_chars += len(delta)
+        
+        # Un delta vide de contenu significatif n'est pas envoyé seul
+        if not "".join(self.pending).strip():
+            return None
+        if self.pending_chars >= REASONING_FLUSH_CHARS or time.monotonic() - self.last_flush >= REASONING_FLUSH_SECONDS:
+            return self.flush()
+        return None
+    
+    def flush(self, final: bool = False) -> Optional[ThinkingStep]:
+        """Envoie les deltas en attente (et l'instantané complet si final)"""
+        if not self.pending and not (final and self.protocol == "delta" and self.seq):
+            return None
+        
+        delta = "".join(self.pending)
+        self.pending = []
+        self.pending_chars = 0
+        self.last_flush = time.monotonic()
+        
+        self.parts.append(delta)
+        self.length += len(delta)
+        self.checksum = zlib.crc32(delta.encode("utf-8"), self.checksum)
+        self.seq += 1
+        
+        if self.protocol == "cumulative":
+            return ThinkingStep(
+                step="reasoning",
+                status="processing",
+                reasoning_content="".join(self.parts)
+            )
+        
+        step = ThinkingStep(
+            step="reasoning",
+            status="processing",
+            reasoning_delta=delta,
+            seq=self.seq
+        )
+        if final or self.seq % REASONING_CHECKSUM_INTERVAL == 0:
+            step.reasoning_length = self.length
+            step.checksum = f"{self.checksum:08x}"
+        if final:
+            step.reasoning_content = "".join(self.parts)
+        return step
+
 async def stream_deepseek_response(
     messages, 
     api_key, 
     api_url, 
     model_type="deepseek-reasoner", 
-    language="fr"
+    language="fr",
+    protocol="delta",
+    conversation_id=None
 ) -> AsyncGenerator[ThinkingStep, None]:
     """
     Stream la réponse de DeepSeek Reasoner pour récupérer le reasoning_content en temps réel
+    (voir ReasoningEncoder pour les protocoles "delta" et "cumulative").
+    La réponse finale est envoyée à la fin dans une étape "answer" (HypothesisResponse).
     """
-    client = None
     try:
-        client = httpx.AsyncClient(timeout=120.0)
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
@@ -27,14 +126,15 @@ async def stream_deepseek_response(
         payload = {
             "model": model_type,
             "messages": messages,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "max_tokens": 1024,
+            "temperature": DEFAULT_TEMPERATURE,
+            "top_p": DEFAULT_TOP_P,
+            "max_tokens": DEFAULT_MAX_TOKENS,
             "stream": True  # Activer le streaming
         }
         
         # Utiliser la méthode stream pour recevoir les chunks
-        async with client.stream("POST", api_url, json=payload, headers=headers) as response:
+        # Client partagé via le disjoncteur DeepSeek: la connexion keep-alive est rendue au pool à la fin du stream
+        async with deepseek_service.stream("POST", api_url, json=payload, headers=headers) as response:
             if response.status_code != 200:
                 error_detail = f"Deepseek API error ({response.status_code})"
                 print(f"API Error: {error_detail}")
@@ -55,7 +155,7 @@ async def stream_deepseek_response(
                 )
                 return
             
-            reasoning_content = ""
+            reasoning = ReasoningEncoder(protocol)
             regular_content = ""
             
             # Traiter les chunks de données SSE
@@ -80,15 +180,11 @@ async def stream_deepseek_response(
                                 # Si le chunk contient du reasoning_content
                                 if "delta" in choice and "reasoning_content" in choice["delta"]:
                                     delta_reasoning = choice["delta"]["reasoning_content"] or ""
-                                    reasoning_content += delta_reasoning
                                     
-                                    # Envoyer un chunk de reasoning seulement s'il y a du contenu significatif
-                                    if len(delta_reasoning.strip()) > 0:
-                                        yield ThinkingStep(
-                                            step="reasoning",
-                                            status="processing",
-                                            reasoning_content=reasoning_content
-                                        )
+                                    # Regroupement des deltas: envoi par fenêtre de taille ou de temps
+                                    step = reasoning.add(delta_reasoning)
+                                    if step:
+                                        yield step
                                 
                                 # Si le chunk contient du contenu normal
                                 elif "delta" in choice and "content" in choice["delta"]:
@@ -101,6 +197,19 @@ async def stream_deepseek_response(
                         except Exception as e:
                             print(f"Error processing chunk: {str(e)}")
                             continue
+                
+                # Envoyer le reste du raisonnement, avec l'instantané complet
+                step = reasoning.flush(final=True)
+                if step:
+                    yield step
+                
+                # Réponse finale, au même format que /generate
+                if regular_content:
+                    yield ThinkingStep(
+                        step="answer",
+                        status="completed",
+                        response=build_hypothesis_response(regular_content, conversation_id, language)
+                    )
             except httpx.ReadTimeout as e:
                 print(f"Read timeout during streaming: {str(e)}")
                 error_msg = "Temps d'attente dépassé lors du traitement"
@@ -176,8 +285,56 @@ async def stream_deepseek_response(
             status="error",
             details=error_msg
         )
+ 
+
+async def stream_deepseek_content(
+    messages,
+    api_key,
+    api_url,
+    model_type="deepseek-chat"
+) -> AsyncGenerator[str, None]:
+    """
+    Stream le contenu de la réponse DeepSeek (delta.content) au fur et à mesure.
+    Mêmes paramètres que call_deepseek_api, pour que la réponse assemblée puisse
+    être mise en cache sous la même clé. Les erreurs sont levées à l'appelant.
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
     
-    finally:
-        # Fermer le client dans tous les cas
-        if client:
-            await client.aclose() 
\ No newline at end of file
+    payload = {
+        "model": model_type,
+        "messages": messages,
+        "temperature": DEFAULT_TEMPERATURE,
+        "top_p": DEFAULT_TOP_P,
+        "max_tokens": DEFAULT_MAX_TOKENS,
+        "stream": True
+    }
+    
+    print(f"Streaming content with model: {model_type}")
+    
+    async with deepseek_service.stream("POST", api_url, json=payload, headers=headers) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            raise Exception(f"Deepseek API error ({response.status_code}): {body.decode(errors='replace')}")
+        
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            
+            line_data = line[5:].strip()
+            if line_data == "[DONE]":
+                break
+            
+            try:
+                chunk_data = json.loads(line_data)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON: {str(e)}, line: {line}")
+                continue
+            
+            # Le reasoning_content (modèle Reasoner) n'est pas transmis, seulement la réponse
+            choices = chunk_data.get("choices") or []
+            delta_content = choices[0].get("delta", {}).get("content") if choices else None
+            if delta_content:
+                yield delta_content
@@ -1,42 +1,44 @@
 from fastapi import APIRouter, File, UploadFile, HTTPException
-import csv
-from io import StringIO
-from typing import List, Dict, Any
+from typing import Dict, Any
+
+from app.core.config import settings
+from app.services.csv_import import CSVAggregator, CSVImportError, dataset_store
 
 router = APIRouter(prefix="/api/imports", tags=["Data Imports"])
 
 @router.post("/upload/csv", response_model=Dict[str, Any])
 async def upload_csv(file: UploadFile = File(...)):
     """
-    Upload and process AB test data from CSV file
+    Upload and process AB test data from CSV file.
+    The file is read and aggregated chunk by chunk; the response holds the totals
+    per test and variation and the dataset_id of the stored dataset, not the rows.
     """
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
     try:
-        # Read and validate CSV content
-        contents = await file.read()
-        text = contents.decode('utf-8')
-        csv_reader = csv.DictReader(StringIO(text))
-        
-        # Convert CSV to list of dictionaries
-        data = [row for row in csv_reader]
-        
-        # Validate required fields
-        required_fields = ["test_name", "variation", "visitors", "conversions"]
-        if not all(field in csv_reader.fieldnames for field in required_fields):
-            raise HTTPException(
-                status_code=400, 
-                detail=f"CSV must contain the following fields: {', '.join(required_fields)}"
-            )
+        aggregator = CSVAggregator()
+        while chunk := await file.read(settings.IMPORT_CHUNK_SIZE):
+            aggregator.feed(chunk)
+        aggregator.close()
         
+        dataset = dataset_store.add(aggregator, file.filename)
         return {
             "success": True,
-            "filename": file.filename,
-            "row_count": len(data),
-            "data": data
+            **dataset.summary(),
+            "errors": aggregator.errors
         }
-    except UnicodeDecodeError:
-        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+    except CSVImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing CSV file: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing CSV file: {str(e)}")
+
+@router.get("/datasets/{dataset_id}", response_model=Dict[str, Any])
+async def get_dataset(dataset_id: str):
+    """
+    Retrieve the aggregated totals of an imported dataset
+    """
+    dataset = dataset_store.get(dataset_id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found or expired")
+    return dataset.summary()
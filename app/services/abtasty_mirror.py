@@ -0,0 +1,292 @@
+"""
+Miroir local des réponses de l'API AB Tasty.
+
+Chaque réponse (liste de tests, détails, variations) est conservée dans SQLite
+avec ses validateurs HTTP (ETag, Last-Modified). Une lecture est servie
+localement tant que l'entrée a moins de ABTASTY_MIRROR_TTL secondes ; au-delà,
+l'entrée est encore servie (stale-while-revalidate) pendant qu'une requête
+conditionnelle la revalide en arrière-plan : une réponse 304 ne fait que
+rafraîchir la date de l'entrée. Une entrée associée à une version (date de
+modification du test) reste valable tant que cette version ne change pas.
+
+Seules les erreurs passagères (réseau, 429, 5xx) laissent servir la dernière
+réponse connue, et jamais plus de ABTASTY_MIRROR_MAX_STALE secondes après son
+expiration ; un 401/403/404 supprime l'entrée.
+
+Une tâche de fond rafraîchit périodiquement les comptes consultés récemment,
+en ne retéléchargeant que les éléments modifiés.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+from app.core.single_flight import SingleFlight
+
+# Les comptes non consultés depuis cette durée ne sont plus rafraîchis (secondes)
+ACTIVE_ACCOUNT_WINDOW = 3600
+
+# Réponses définitives d'AB Tasty: credentials refusés ou élément supprimé, l'entrée est oubliée
+REVOKED_STATUSES = (401, 403, 404)
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """Code HTTP porté par l'erreur d'une requête (None pour une erreur réseau ou un circuit ouvert)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return getattr(error, "status_code", None)
+
+
+def is_transient(error: Exception) -> bool:
+    """Erreur passagère (réseau, 429, 5xx) pendant laquelle la dernière réponse connue peut être servie"""
+    status = error_status(error)
+    return status is None or status == 429 or status >= 500
+
+
+class MirrorEntry(NamedTuple):
+    data: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    version: Optional[str]
+    fetched_at: float
+
+
+class FetchResult(NamedTuple):
+    """Réponse d'une requête (conditionnelle): status 304 = entrée inchangée, data absent"""
+    status: int
+    data: Any = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+# fetch(etag, last_modified) envoie la requête conditionnelle
+Fetcher = Callable[[Optional[str], Optional[str]], Awaitable[FetchResult]]
+
+
+class ABTastyMirror:
+    """
+    Réponses AB Tasty persistées dans SQLite, servies localement et revalidées à l'expiration
+    """
+
+    def __init__(self, path: str, ttl: float, max_stale: float):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._db: Optional[sqlite3.Connection] = None
+        # Les accès SQLite se font dans des threads (hors boucle d'événements), un seul à la fois
+        self._db_lock = threading.Lock()
+        self._flight = SingleFlight("abtasty-mirror")
+        self._revalidating: Dict[str, asyncio.Future] = {}
+        # Rafraîchissements enregistrés par compte: (fonction, dernière consultation)
+        self._refreshers: Dict[str, tuple] = {}
+        self.stats = {
+            "hits": 0,          # entrées fraîches
+            "unchanged": 0,     # version identique: entrée valable sans requête
+            "stale_hits": 0,    # entrées expirées servies pendant la revalidation
+            "misses": 0,
+            "revalidations": 0,
+            "not_modified": 0,  # revalidations terminées par un 304
+            "updates": 0,
+            "errors": 0,
+            "evictions": 0      # entrées supprimées (401/403/404)
+        }
+
+    def load(self):
+        """Ouvre (ou crée) la base du miroir"""
+        if self._db is not None:
+            return
+        with self._db_lock:
+            if self._db is not None:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+                "version TEXT, fetched_at REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        logger.info(f"AB Tasty mirror loaded: {self.size} responses in {self.path}")
+
+    def close(self):
+        """Ferme la base (arrêt de l'application)"""
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @property
+    def size(self) -> int:
+        self.load()
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def read(self, key: str) -> Optional[MirrorEntry]:
+        self.load()
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, version, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        body, etag, last_modified, version, fetched_at = row
+        return MirrorEntry(json.loads(body), etag, last_modified, version, fetched_at)
+
+    def write(self, key: str, result: FetchResult, version: Optional[str] = None):
+        self.load()
+        body = json.dumps(result.data)
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, last_modified, version, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, result.etag, result.last_modified, version, time.time())
+            )
+            self._db.commit()
+
+    def touch(self, key: str, version: Optional[str] = None):
+        self.load()
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE responses SET fetched_at = ?, version = COALESCE(?, version) WHERE key = ?",
+                (time.time(), version, key)
+            )
+            self._db.commit()
+
+    def delete(self, key: str):
+        self.load()
+        with self._db_lock:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    async def get(
+        self,
+        key: str,
+        fetch: Fetcher,
+        version: Optional[str] = None,
+        max_age: Optional[float] = None,
+        background: bool = True
+    ) -> Any:
+        """
+        Retourne la réponse de la clé: locale si fraîche (ou de même version), sinon revalidée.
+
+        Args:
+            key: Clé de la réponse (identifiants, URL et paramètres)
+            fetch: Requête conditionnelle vers AB Tasty
+            version: Version connue de l'élément (date de modification), None si inconnue
+            max_age: Âge maximal d'une entrée fraîche (ABTASTY_MIRROR_TTL par défaut)
+            background: Entrée expirée servie et revalidée en arrière-plan (False: revalidée avant de répondre)
+        """
+        max_age = self.ttl if max_age is None else max_age
+        entry = await asyncio.to_thread(self.read, key)
+        if entry is not None:
+            if version is not None and entry.version == version:
+                self.stats["unchanged"] += 1
+                return entry.data
+            age = time.time() - entry.fetched_at
+            if age < max_age:
+                self.stats["hits"] += 1
+                return entry.data
+            if background and age < max_age + self.max_stale:
+                self.stats["stale_hits"] += 1
+                self._revalidate_in_background(key, fetch, version, max_age)
+                return entry.data
+        else:
+            self.stats["misses"] += 1
+
+        return await self._flight.do(key, lambda: self._revalidate(key, fetch, version, max_age))
+
+    def _revalidate_in_background(self, key: str, fetch: Fetcher, version: Optional[str], max_age: float):
+        if key in self._revalidating:
+            return
+        task = asyncio.ensure_future(self._flight.do(key, lambda: self._revalidate(key, fetch, version, max_age)))
+        self._revalidating[key] = task
+
+        def done(task: asyncio.Future):
+            self._revalidating.pop(key, None)
+            if not task.cancelled() and task.exception():
+                logger.warning(f"AB Tasty mirror: background revalidation failed: {task.exception()}")
+
+        task.add_done_callback(done)
+
+    async def _revalidate(self, key: str, fetch: Fetcher, version: Optional[str], max_age: float) -> Any:
+        entry = await asyncio.to_thread(self.read, key)
+        self.stats["revalidations"] += 1
+        try:
+            result = await fetch(entry.etag if entry else None, entry.last_modified if entry else None)
+        except Exception as e:
+            self.stats["errors"] += 1
+            if entry is None:
+                raise
+            if error_status(e) in REVOKED_STATUSES:
+                # Credentials révoqués ou test supprimé: la réponse stockée n'est plus servie
+                self.stats["evictions"] += 1
+                await asyncio.to_thread(self.delete, key)
+                raise
+            if not is_transient(e) or time.time() - entry.fetched_at >= max_age + self.max_stale:
+                raise
+            # AB Tasty indisponible: la dernière version connue reste servie (au plus max_stale secondes)
+            logger.warning(f"AB Tasty mirror: revalidation failed ({e}), serving stored response")
+            return entry.data
+
+        if result.status == 304 and entry is not None:
+            self.stats["not_modified"] += 1
+            await asyncio.to_thread(self.touch, key, version)
+            return entry.data
+
+        self.stats["updates"] += 1
+        await asyncio.to_thread(self.write, key, result, version)
+        return result.data
+
+    def register_refresher(self, name: str, refresh: Callable[[], Awaitable[Any]]):
+        """
+        Enregistre (ou renouvelle) le rafraîchissement périodique d'un compte consulté.
+        Les identifiants éventuellement capturés par refresh restent en mémoire seulement.
+        """
+        self._refreshers[name] = (refresh, time.time())
+
+    async def refresh_active(self):
+        """Rafraîchit les comptes consultés récemment et oublie les autres"""
+        now = time.time()
+        for name, (refresh, last_access) in list(self._refreshers.items()):
+            if now - last_access > ACTIVE_ACCOUNT_WINDOW:
+                del self._refreshers[name]
+                continue
+            try:
+                await refresh()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"AB Tasty mirror: refresh of {name[:12]}... failed: {e}")
+
+    async def run_refresher(self, interval: Optional[float] = None):
+        """Tâche de fond: rafraîchissement des comptes actifs toutes les interval secondes"""
+        interval = interval or settings.ABTASTY_MIRROR_REFRESH_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh_active()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["unchanged"] + self.stats["stale_hits"] + self.stats["misses"]
+        local = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": settings.ABTASTY_MIRROR_ENABLED,
+            "local_rate_percent": round(local / lookups * 100, 2) if lookups else 0,
+            "size": self.size if self._db is not None else 0,
+            "active_accounts": len(self._refreshers),
+            "ttl": self.ttl,
+            "max_stale": self.max_stale
+        }
+
+
+abtasty_mirror = ABTastyMirror(settings.ABTASTY_MIRROR_PATH, settings.ABTASTY_MIRROR_TTL, settings.ABTASTY_MIRROR_MAX_STALE)
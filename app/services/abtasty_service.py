@@ -1,14 +1,33 @@
-import httpx
+from hashlib import sha256
+from typing import Optional
+from app.core.config import settings
+from app.services.abtasty_mirror import abtasty_mirror, FetchResult
 from app.services.base_external_service import ExternalService
 
 class ABTastyService(ExternalService):
     def __init__(self, api_key: str):
+        super().__init__("abtasty", timeout=settings.ABTASTY_REQUEST_TIMEOUT, hedge_delay=settings.ABTASTY_HEDGE_DELAY)
         self.base_url = "https://api.abtasty.com"
         self.headers = {"X-API-KEY": api_key}
+        # Clé du miroir: empreinte de la clé API, jamais la clé elle-même
+        self.mirror_prefix = sha256(api_key.encode()).hexdigest()[:16]
     
     async def get_tests(self):
         """Retrieve test/experiment data from AB Tasty API"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.base_url}/v2/experiments", headers=self.headers)
+        url = f"{self.base_url}/v2/experiments"
+
+        async def conditional_fetch(etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+            headers = dict(self.headers)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            response = await self.request("GET", url, headers=headers)
+            if response.status_code == 304:
+                return FetchResult(status=304)
             response.raise_for_status()
-            return response.json() 
\ No newline at end of file
+            return FetchResult(200, response.json(), response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+        if not settings.ABTASTY_MIRROR_ENABLED:
+            return (await conditional_fetch()).data
+        return await abtasty_mirror.get(f"{self.mirror_prefix}:{url}", conditional_fetch)
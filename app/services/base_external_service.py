@@ -1,7 +1,284 @@
-from abc import ABC, abstractmethod
+"""
+Base client for the external services (AB Tasty, DeepSeek, Hugging Face).
 
-class ExternalService(ABC):
-    @abstractmethod
-    async def get_tests(self):
-        """Retrieve test/experiment data from external service"""
-        pass 
\ No newline at end of file
+Every call goes through the shared keep-alive pool of its upstream
+(app.core.http_clients) and a circuit breaker per upstream, so a failing
+upstream is rejected immediately instead of holding request slots until the
+timeout. Idempotent calls are retried with jittered exponential backoff;
+other calls (billed LLM generations) only when the upstream did not process
+them: connection failures, 429 and 503. Idempotent calls can optionally be
+hedged: a second identical request is sent if the first has not answered
+after hedge_delay seconds, and the first response wins.
+"""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from loguru import logger
+
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.core.config import settings
+from app.core.http_clients import DEFAULT_TIMEOUT, http_clients
+from app.core.metrics import EXTERNAL_CALL_EVENTS, EXTERNAL_CALL_SECONDS
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Statuses worth retrying: rate limiting and upstream failures
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# The upstream refused the request without processing it: retrying is safe even for POST
+REFUSED_STATUSES = frozenset({429, 503})
+
+# The connection was never established, so the request was not sent: retrying is safe even for POST
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# One circuit breaker per upstream, shared by all the services calling it
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Return the circuit breaker of an upstream, creating it on first use.
+
+    Args:
+        name (str): Upstream name (also the name of its shared HTTP client)
+
+    Returns:
+        CircuitBreaker: The upstream's circuit breaker
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=settings.EXTERNAL_BREAKER_FAILURES,
+            reset_timeout=settings.EXTERNAL_BREAKER_RESET_TIMEOUT
+        )
+    return breaker
+
+
+def get_breakers_stats() -> Dict[str, Dict[str, Any]]:
+    """Circuit breaker state of every upstream called so far."""
+    return {name: breaker.get_stats() for name, breaker in _breakers.items()}
+
+
+class ExternalService:
+    """
+    Resilient HTTP client of one upstream: pooling, retries, hedging, circuit breaking and latency histograms.
+    """
+
+    def __init__(self, name: str, timeout: Optional[float] = None, retries: Optional[int] = None, hedge_delay: float = 0.0):
+        """
+        Initialize the service.
+
+        Args:
+            name (str): Upstream name, used for the shared HTTP client, the circuit breaker and the metrics
+            timeout (float, optional): Read timeout of each attempt in seconds (DEFAULT_TIMEOUT by default)
+            retries (int, optional): Retries of idempotent calls (EXTERNAL_RETRIES by default)
+            hedge_delay (float): Seconds before a hedged request is sent for idempotent calls (0 = no hedging)
+        """
+        self.name = name
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.retries = settings.EXTERNAL_RETRIES if retries is None else retries
+        self.hedge_delay = hedge_delay
+        self.breaker = get_breaker(name)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return http_clients.get(self.name)
+
+    def _timeout(self, timeout: Optional[float]) -> httpx.Timeout:
+        return httpx.Timeout(timeout or self.timeout, connect=settings.EXTERNAL_CONNECT_TIMEOUT)
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+        """
+        Backoff before the next attempt: full jitter over an exponential bound, or the server's Retry-After.
+
+        Returns:
+            Optional[float]: Seconds to wait, or None if the server asks to wait longer than EXTERNAL_RETRY_MAX_DELAY
+        """
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                retry_after = float(response.headers["Retry-After"])
+            except ValueError:
+                retry_after = None
+            if retry_after is not None:
+                return retry_after if retry_after <= settings.EXTERNAL_RETRY_MAX_DELAY else None
+        bound = min(settings.EXTERNAL_RETRY_MAX_DELAY, settings.EXTERNAL_RETRY_BASE_DELAY * 2 ** attempt)
+        return random.uniform(0, bound)
+
+    def _record_status(self, status_code: int) -> str:
+        """Report a response to the circuit breaker and return the outcome label of the metrics."""
+        if status_code == 429:
+            # Rate limited: the upstream is up, this is neither a failure nor a success
+            self.breaker.release()
+            return "rate_limited"
+        if status_code in RETRYABLE_STATUSES:
+            self.breaker.record_failure()
+            return "server_error"
+        self.breaker.record_success()
+        return "success" if status_code < 400 else "client_error"
+
+    def _reject(self):
+        EXTERNAL_CALL_EVENTS.inc(service=self.name, event="circuit_open")
+        raise CircuitOpenError(f"Circuit {self.name} is open")
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        idempotent: Optional[bool] = None,
+        hedge_delay: Optional[float] = None,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request, retrying transient failures of idempotent calls.
+
+        Non-idempotent calls are only retried when the upstream did not process
+        them (connection failure, 429, 503): a read timeout is never replayed.
+
+        The last response is returned whatever its status (callers keep their own
+        error handling); transport errors are raised once the retries are exhausted.
+
+        Args:
+            method (str): HTTP method
+            url (str): Absolute URL
+            idempotent (bool, optional): Whether the call may be replayed (defaults to the method's semantics)
+            hedge_delay (float, optional): Overrides the service's hedge delay for this call
+            timeout (float, optional): Overrides the service's read timeout for this call
+            **kwargs: Passed to httpx (params, json, headers...)
+
+        Returns:
+            httpx.Response: The upstream response
+
+        Raises:
+            CircuitOpenError: If the upstream's circuit is open
+            httpx.TransportError: If the upstream could not be reached
+        """
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        hedge_delay = self.hedge_delay if hedge_delay is None else hedge_delay
+        kwargs["timeout"] = self._timeout(timeout)
+        start = time.perf_counter()
+        outcome = "error"
+        response: Optional[httpx.Response] = None
+
+        try:
+            for attempt in range(self.retries + 1):
+                if not self.breaker.allow():
+                    if response is not None:
+                        return response
+                    outcome = "circuit_open"
+                    self._reject()
+                try:
+                    if idempotent and hedge_delay > 0:
+                        response = await self._hedged_send(method, url, hedge_delay, kwargs)
+                    else:
+                        response = await self.client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    self.breaker.record_failure()
+                    if attempt == self.retries or not (idempotent or isinstance(e, CONNECT_ERRORS)):
+                        raise
+                    delay = self._retry_delay(attempt)
+                    logger.warning(f"{self.name}: {type(e).__name__} on {method} {url}, retrying in {delay:.2f}s")
+                except BaseException as e:
+                    # Cancelled, or failed before reaching the upstream (invalid URL, event hook, decoding):
+                    # neither a failure nor a success, but a half-open probe slot must be freed
+                    outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+                    self.breaker.release()
+                    raise
+                else:
+                    outcome = self._record_status(response.status_code)
+                    retryable = RETRYABLE_STATUSES if idempotent else REFUSED_STATUSES
+                    if response.status_code not in retryable or attempt == self.retries:
+                        return response
+                    delay = self._retry_delay(attempt, response)
+                    if delay is None:
+                        return response
+                    logger.warning(f"{self.name}: {response.status_code} on {method} {url}, retrying in {delay:.2f}s")
+                EXTERNAL_CALL_EVENTS.inc(service=self.name, event="retry")
+                await asyncio.sleep(delay)
+            return response
+        finally:
+            EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service=self.name, outcome=outcome)
+
+    async def _hedged_send(self, method: str, url: str, hedge_delay: float, kwargs: Dict[str, Any]) -> httpx.Response:
+        """Send the request, and a second copy if it is still pending after hedge_delay; the first response wins."""
+        primary = asyncio.ensure_future(self.client.request(method, url, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        EXTERNAL_CALL_EVENTS.inc(service=self.name, event="hedge")
+        hedge = asyncio.ensure_future(self.client.request(method, url, **kwargs))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            EXTERNAL_CALL_EVENTS.inc(service=self.name, event="hedge_won")
+                        return task.result()
+            # Both copies failed: report the primary's error
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Streamed request through the circuit breaker.
+
+        Only connection failures are retried: once the upstream has started
+        answering, the stream cannot be replayed. The latency histogram measures
+        the time to the response headers.
+
+        Raises:
+            CircuitOpenError: If the upstream's circuit is open
+            httpx.TransportError: If the upstream could not be reached
+        """
+        kwargs["timeout"] = self._timeout(timeout)
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service=self.name, outcome="circuit_open")
+                self._reject()
+            try:
+                response = await self.client.send(self.client.build_request(method, url, **kwargs), stream=True)
+                break
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if attempt == self.retries or not isinstance(e, CONNECT_ERRORS):
+                    EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service=self.name, outcome="error")
+                    raise
+                EXTERNAL_CALL_EVENTS.inc(service=self.name, event="retry")
+                await asyncio.sleep(self._retry_delay(attempt))
+            except BaseException as e:
+                # Cancelled or failed locally: free a half-open probe slot
+                self.breaker.release()
+                if not isinstance(e, asyncio.CancelledError):
+                    EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service=self.name, outcome="error")
+                raise
+
+        outcome = self._record_status(response.status_code)
+        EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service=self.name, outcome=outcome)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "hedge_delay": self.hedge_delay,
+            "circuit": self.breaker.get_stats()
+        }
@@ -0,0 +1,307 @@
+import codecs
+import csv
+import io
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+
+from app.core.config import settings
+
+REQUIRED_FIELDS = ("test_name", "variation", "visitors", "conversions")
+
+# Invalid rows reported in the response (the others are only counted)
+MAX_REPORTED_ERRORS = 20
+
+
+class CSVImportError(ValueError):
+    """The file cannot be imported (encoding, missing columns, malformed CSV)."""
+    pass
+
+
+class ImportedDataset(NamedTuple):
+    """Rows of an import aggregated by (test, variation), stored as typed columns."""
+    dataset_id: str
+    filename: str
+    created_at: float
+    test_names: List[str]     # distinct tests, indexed by test_codes
+    test_codes: np.ndarray    # int32, test index of each group
+    variations: List[str]     # variation name of each group
+    rows: np.ndarray          # int64, rows of each group
+    visitors: np.ndarray      # int64
+    conversions: np.ndarray   # int64
+    row_count: int
+    invalid_rows: int
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Aggregated totals per test and variation.
+
+        Returns:
+            Dict[str, Any]: Dataset handle, row counts and totals (no raw rows)
+        """
+        tests = []
+        for code, test_name in enumerate(self.test_names):
+            groups = np.flatnonzero(self.test_codes == code)
+            visitors = int(self.visitors[groups].sum())
+            conversions = int(self.conversions[groups].sum())
+            tests.append({
+                "test_name": test_name,
+                "visitors": visitors,
+                "conversions": conversions,
+                "variations": [
+                    {
+                        "variation": self.variations[i],
+                        "rows": int(self.rows[i]),
+                        "visitors": int(self.visitors[i]),
+                        "conversions": int(self.conversions[i]),
+                        "conversion_rate": float(self.conversions[i] / self.visitors[i]) if self.visitors[i] else 0.0
+                    }
+                    for i in groups
+                ]
+            })
+        return {
+            "dataset_id": self.dataset_id,
+            "filename": self.filename,
+            "created_at": self.created_at,
+            "row_count": self.row_count,
+            "invalid_rows": self.invalid_rows,
+            "totals": {
+                "tests": len(self.test_names),
+                "variations": len(self.variations),
+                "visitors": int(self.visitors.sum()),
+                "conversions": int(self.conversions.sum())
+            },
+            "tests": tests
+        }
+
+
+class CSVAggregator:
+    """
+    Incremental CSV parser aggregating visitors and conversions by (test, variation).
+
+    Chunks of bytes are fed as they are read: only the current chunk and the
+    totals per group are held in memory, whatever the file size. Quoted fields
+    spanning several lines are kept whole across chunk boundaries.
+    """
+
+    def __init__(self, max_record_size: Optional[int] = None):
+        """
+        Initialize the aggregator.
+
+        Args:
+            max_record_size (int, optional): Longest record accepted, in characters (IMPORT_MAX_RECORD_SIZE by default)
+        """
+        self.max_record_size = max_record_size or settings.IMPORT_MAX_RECORD_SIZE
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._pending = ""
+        self._scanned = 0          # offset of _pending up to which quotes are counted
+        self._in_quotes = False    # odd number of quotes between the start of _pending and _scanned
+        self._columns: Optional[Tuple[int, int, int, int]] = None
+        self._line = 1  # physical line number of the next record (1 = header)
+        self._tests: Dict[str, int] = {}
+        self._groups: Dict[Tuple[str, str], int] = {}
+        self._group_tests: List[int] = []
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._visitors = np.zeros(0, dtype=np.int64)
+        self._conversions = np.zeros(0, dtype=np.int64)
+        self.row_count = 0
+        self.invalid_rows = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def feed(self, chunk: bytes):
+        """
+        Parse the complete records of a chunk and add them to the totals.
+
+        Args:
+            chunk (bytes): Next bytes of the file
+
+        Raises:
+            CSVImportError: If the file is not UTF-8, lacks a required column or is malformed
+        """
+        try:
+            self._pending += self._decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise CSVImportError("CSV file must be UTF-8 encoded")
+        cut = self._scan()
+        if cut:
+            text, self._pending = self._pending[:cut], self._pending[cut:]
+            self._scanned -= cut
+            self._parse(text)
+        if len(self._pending) > self.max_record_size:
+            raise CSVImportError(
+                f"Malformed CSV near line {self._line}: record longer than {self.max_record_size} characters (unbalanced quote?)"
+            )
+
+    def close(self):
+        """Parse the last record (file without a trailing newline)."""
+        try:
+            text = self._pending + self._decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            raise CSVImportError("CSV file must be UTF-8 encoded")
+        self._pending = ""
+        self._scanned = 0
+        self._parse(text)
+        if self._columns is None:
+            raise CSVImportError("CSV file is empty")
+
+    def _scan(self) -> int:
+        """
+        Count the quotes of the lines added since the last scan, and return the offset
+        just after the last newline outside a quoted field (0 if no record is complete).
+        Each character of the file is scanned once.
+        """
+        cut = 0
+        position = self._scanned
+        while True:
+            newline = self._pending.find("\n", position)
+            if newline == -1:
+                break
+            if self._pending.count('"', position, newline) % 2:
+                self._in_quotes = not self._in_quotes
+            position = newline + 1
+            if not self._in_quotes:
+                cut = position
+        self._scanned = position
+        return cut
+
+    def _parse(self, text: str):
+        if not text:
+            return
+        reader = csv.reader(io.StringIO(text, newline=""))
+        records: List[Tuple[int, List[str]]] = []
+        consumed = 0
+        try:
+            for record in reader:
+                # reader.line_num counts physical lines: quoted fields may span several
+                records.append((self._line + consumed, record))
+                consumed = reader.line_num
+        except csv.Error as e:
+            raise CSVImportError(f"Malformed CSV near line {self._line + consumed}: {e}")
+        self._line += consumed
+
+        if self._columns is None and records:
+            header = [name.strip() for name in records[0][1]]
+            missing = [field for field in REQUIRED_FIELDS if field not in header]
+            if missing:
+                raise CSVImportError(f"CSV must contain the following fields: {', '.join(REQUIRED_FIELDS)}")
+            self._columns = tuple(header.index(field) for field in REQUIRED_FIELDS)
+            records = records[1:]
+        self._aggregate(records)
+
+    def _aggregate(self, records: List[Tuple[int, List[str]]]):
+        """Validate a batch of records and add the valid ones to the group totals."""
+        test_index, variation_index, visitors_index, conversions_index = self._columns
+        width = max(self._columns) + 1
+        codes: List[int] = []
+        visitors: List[int] = []
+        conversions: List[int] = []
+
+        for line, record in records:
+            if not any(field.strip() for field in record):
+                continue  # empty line
+            self.row_count += 1
+            error = None
+            if len(record) < width:
+                error = "missing fields"
+            else:
+                test_name = record[test_index].strip()
+                variation = record[variation_index].strip()
+                try:
+                    row_visitors = int(record[visitors_index])
+                    row_conversions = int(record[conversions_index])
+                except ValueError:
+                    error = "visitors and conversions must be integers"
+                else:
+                    if not test_name or not variation:
+                        error = "test_name and variation are required"
+                    elif row_visitors < 0 or row_conversions < 0:
+                        error = "visitors and conversions must be non-negative"
+                    elif row_conversions > row_visitors:
+                        error = "conversions cannot exceed visitors"
+            if error:
+                self.invalid_rows += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append({"line": line, "error": error})
+                continue
+
+            group = self._groups.get((test_name, variation))
+            if group is None:
+                group = self._groups[(test_name, variation)] = len(self._groups)
+                self._group_tests.append(self._tests.setdefault(test_name, len(self._tests)))
+            codes.append(group)
+            visitors.append(row_visitors)
+            conversions.append(row_conversions)
+
+        if codes:
+            size = len(self._groups)
+            group_codes = np.array(codes, dtype=np.int64)
+            self._rows = self._grow(self._rows, size) + np.bincount(group_codes, minlength=size)
+            self._visitors = self._grow(self._visitors, size)
+            self._conversions = self._grow(self._conversions, size)
+            np.add.at(self._visitors, group_codes, np.array(visitors, dtype=np.int64))
+            np.add.at(self._conversions, group_codes, np.array(conversions, dtype=np.int64))
+
+    @staticmethod
+    def _grow(array: np.ndarray, size: int) -> np.ndarray:
+        if len(array) == size:
+            return array
+        return np.concatenate([array, np.zeros(size - len(array), dtype=array.dtype)])
+
+    def to_dataset(self, dataset_id: str, filename: str) -> ImportedDataset:
+        """
+        Freeze the totals into a dataset.
+
+        Args:
+            dataset_id (str): Handle of the dataset
+            filename (str): Name of the uploaded file
+
+        Returns:
+            ImportedDataset: Typed columns grouped by test and variation
+        """
+        size = len(self._groups)
+        return ImportedDataset(
+            dataset_id=dataset_id,
+            filename=filename,
+            created_at=time.time(),
+            test_names=list(self._tests),
+            test_codes=np.array(self._group_tests, dtype=np.int32),
+            variations=[variation for _, variation in self._groups],
+            rows=self._grow(self._rows, size),
+            visitors=self._grow(self._visitors, size),
+            conversions=self._grow(self._conversions, size),
+            row_count=self.row_count,
+            invalid_rows=self.invalid_rows
+        )
+
+
+class DatasetStore:
+    """
+    Imported datasets kept in memory for IMPORT_DATASET_TTL seconds, by handle.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Initialize the store.
+
+        Args:
+            maxsize (int): Maximum number of datasets (the oldest are evicted first)
+            ttl (float): Lifetime of a dataset in seconds
+        """
+        self._datasets: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def add(self, aggregator: CSVAggregator, filename: str) -> ImportedDataset:
+        dataset = aggregator.to_dataset(uuid.uuid4().hex, filename)
+        self._datasets[dataset.dataset_id] = dataset
+        return dataset
+
+    def get(self, dataset_id: str) -> Optional[ImportedDataset]:
+        return self._datasets.get(dataset_id)
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+
+dataset_store = DatasetStore(settings.IMPORT_MAX_DATASETS, settings.IMPORT_DATASET_TTL)
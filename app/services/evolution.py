@@ -0,0 +1,174 @@
+import math
+from hashlib import sha256
+import numpy as np
+import scipy.stats as stats
+from loguru import logger
+from typing import Dict, Any, List, Optional
+
+from app.services.statistics import FrequentistCalculator, BayesianCalculator
+
+# Longueur en jours de chaque granularité supportée
+EVOLUTION_GRANULARITIES = {"day": 1, "week": 7}
+
+# Calcul de la courbe bayésienne: simulation incrémentale ou facteur simplifié
+BAYESIAN_EVOLUTION_MODES = ("incremental", "approximate")
+
+# Horizon minimal par défaut, en jours (8 semaines)
+DEFAULT_MIN_HORIZON_DAYS = 56
+
+# Nombre maximal de périodes calculées (10 ans en jours)
+MAX_EVOLUTION_PERIODS = 3650
+
+# Chiffres significatifs des paramètres dont dérive la graine par défaut
+SEED_SIGNIFICANT_DIGITS = 6
+
+
+def _z_score(p: float) -> float:
+    """
+    Calculate z-score from probability, clamped to ±6 for degenerate probabilities
+    """
+    if p <= 0 or p >= 1:
+        return -6 if p < 0.5 else 6
+    return stats.norm.ppf(p)
+
+
+def default_seed(params: Dict[str, Any]) -> int:
+    """
+    Seed of the incremental Bayesian simulation when the request gives none
+
+    Derived from the quantized parameters the curve depends on, so identical
+    requests get the same curve.
+
+    Args:
+        params: Dictionary with the /estimate parameters
+
+    Returns:
+        int: A 64-bit seed
+    """
+    baseline_rate = params["daily_conversions"] / params["daily_visits"]
+    key = ",".join(
+        f"{value:.{SEED_SIGNIFICANT_DIGITS}g}"
+        for value in (baseline_rate, params["confidence"], params["prior_alpha"], params["prior_beta"])
+    )
+    return int.from_bytes(sha256(key.encode()).digest()[:8], "big")
+
+
+def required_days(params: Dict[str, Any]) -> int:
+    """
+    Closed-form test duration in days, without any search or simulation
+
+    The frequentist duration is the same as /estimate. The Bayesian duration uses
+    the Gaussian approximation of the posterior, which the engines only refine.
+
+    Args:
+        params: Dictionary with the /estimate parameters
+
+    Returns:
+        int: The estimated duration in days
+    """
+    baseline_rate = params["daily_conversions"] / params["daily_visits"]
+    mde_absolute = baseline_rate * params["expected_improvement"]
+
+    if params["statistical_method"] == "frequentist":
+        z_sum = FrequentistCalculator.z_score_sum(1 - params["confidence"], params["power"], params["test_type"])
+        sample_size_per_variation = FrequentistCalculator.sample_size_from_z_sum(baseline_rate, mde_absolute, z_sum)
+    else:  # bayesian
+        sample_size_per_variation = BayesianCalculator.approximate_sample_size(
+            baseline_rate, mde_absolute, params["confidence"]
+        )
+
+    total_sample = sample_size_per_variation * params["variations"]
+    return math.ceil(total_sample / (params["daily_visits"] * params["traffic_allocation"]))
+
+
+def calculate_mde_evolution(
+    params: Dict[str, Any],
+    granularity: str = "week",
+    horizon: Optional[int] = None,
+    bayesian_mode: str = "incremental"
+) -> List[Dict[str, Any]]:
+    """
+    Calculate how the minimum detectable effect evolves as visitors accumulate
+
+    The frequentist curve is a single NumPy expression with z-scores computed once.
+    The Bayesian curve inverts the decision rule at every horizon from one
+    incremental simulation (see BayesianCalculator.detectable_lift_curve), seeded
+    with the request seed or default_seed.
+
+    Args:
+        params: Dictionary with the /estimate parameters
+        granularity: "day" or "week"
+        horizon: Number of periods to return (defaults to 8 weeks or twice the
+            estimated duration, whichever is greater, capped at MAX_EVOLUTION_PERIODS)
+        bayesian_mode: "incremental" or "approximate" (legacy 2 or 3 standard errors)
+
+    Returns:
+        List of data points with the period number (under the granularity name),
+        visitors_per_variant, mde_relative (in %) and status
+    """
+    if granularity not in EVOLUTION_GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}. Supported: {', '.join(EVOLUTION_GRANULARITIES)}")
+    if bayesian_mode not in BAYESIAN_EVOLUTION_MODES:
+        raise ValueError(f"Unknown Bayesian mode: {bayesian_mode}. Supported: {', '.join(BAYESIAN_EVOLUTION_MODES)}")
+    period_days = EVOLUTION_GRANULARITIES[granularity]
+
+    baseline_rate = params["daily_conversions"] / params["daily_visits"]
+    daily_visitors_per_variant = (params["daily_visits"] * params["traffic_allocation"]) / params["variations"]
+
+    estimated_periods = math.ceil(required_days(params) / period_days)
+    if horizon is None:
+        horizon = min(max(math.ceil(DEFAULT_MIN_HORIZON_DAYS / period_days), estimated_periods * 2), MAX_EVOLUTION_PERIODS)
+
+    periods = np.arange(1, horizon + 1)
+    visitors_per_variant = np.floor(daily_visitors_per_variant * (periods * period_days))
+
+    # Inverse de la formule de taille d'échantillon, avec p2 = taux de base
+    if params["statistical_method"] == "frequentist":
+        alpha = 1 - params["confidence"]
+        z_alpha = _z_score(1 - alpha) if params["test_type"] == "one-sided" else _z_score(1 - alpha / 2)
+        z_beta = _z_score(params["power"])
+        spread = (z_alpha + z_beta) * math.sqrt(2 * baseline_rate * (1 - baseline_rate))
+    elif bayesian_mode == "approximate":
+        # Approximation simplifiée: l'effet doit dépasser 2 ou 3 écarts-types
+        confidence_factor = 3 if params["confidence"] >= 0.95 else 2
+        spread = confidence_factor * math.sqrt(baseline_rate * (1 - baseline_rate))
+    else:  # bayesian incrémental
+        spread = None
+
+    if spread is not None:
+        with np.errstate(divide="ignore"):
+            mde_relative = np.where(
+                visitors_per_variant > 0,
+                spread / np.sqrt(visitors_per_variant) / baseline_rate * 100,
+                np.inf
+            )
+    else:
+        # Une seule simulation prolongée de période en période
+        lifts = BayesianCalculator.detectable_lift_curve(
+            baseline_rate=baseline_rate,
+            sizes=visitors_per_variant,
+            confidence=params["confidence"],
+            prior_alpha=params["prior_alpha"],
+            prior_beta=params["prior_beta"],
+            rng=np.random.default_rng(params["seed"] if params.get("seed") is not None else default_seed(params))
+        )
+        mde_relative = lifts / baseline_rate * 100
+
+    status = np.where(
+        periods < estimated_periods / 2,
+        "durée trop courte",
+        np.where(periods > estimated_periods * 1.2, "durée trop longue", "durée optimale")
+    )
+
+    logger.info(f"Generated MDE evolution with {horizon} {granularity} periods")
+    return [
+        {
+            granularity: period,
+            "visitors_per_variant": visitors,
+            "mde_relative": round(mde, 1),
+            "status": period_status
+        }
+        for period, visitors, mde, period_status in zip(
+            periods.tolist(), visitors_per_variant.astype(np.int64).tolist(), mde_relative.tolist(), status.tolist()
+        )
+    ]
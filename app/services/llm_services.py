@@ -0,0 +1,15 @@
+"""
+Services externes des fournisseurs LLM.
+
+Chaque appel de génération est facturé : il n'est relancé que si le fournisseur
+ne l'a pas traité (échec de connexion, 429, 503), jamais après un délai de lecture
+dépassé, et n'est jamais doublé par une requête de couverture. Une génération
+occupe ainsi la requête au plus LLM_REQUEST_TIMEOUT secondes (plus les relances
+de connexion), en deçà de SINGLE_FLIGHT_LOCK_TTL.
+"""
+
+from app.core.config import settings
+from app.services.base_external_service import ExternalService
+
+huggingface_service = ExternalService("huggingface", timeout=settings.LLM_REQUEST_TIMEOUT)
+deepseek_service = ExternalService("deepseek", timeout=settings.LLM_REQUEST_TIMEOUT)
@@ -0,0 +1,239 @@
+"""
+Tables précalculées de tailles d'échantillon bayésiennes.
+
+Les tables sont générées par la CLI de ce module puis chargées en mémoire mappée
+au démarrage. Les estimations situées dans la grille sont interpolées en temps
+constant ; en dehors de la grille, ou si l'erreur d'interpolation de la cellule
+dépasse la tolérance, l'appelant retombe sur le calcul direct.
+
+Les tailles fréquentistes n'ont pas de table: la formule fermée (norm.ppf) est
+exacte et déjà en temps constant, une interpolation ne ferait qu'ajouter de
+l'erreur.
+
+Génération :
+    python -m app.services.lookup_tables --output app/data/lookup
+"""
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import settings
+
+# Erreur relative maximale tolérée sur la taille d'échantillon interpolée
+LOOKUP_MAX_RELATIVE_ERROR = 0.005
+
+# Grilles par défaut
+BAYESIAN_BASELINES = np.geomspace(0.001, 0.5, 36)
+BAYESIAN_IMPROVEMENTS = np.geomspace(0.005, 1.0, 36)
+BAYESIAN_CONFIDENCES = [0.8, 0.85, 0.9, 0.95, 0.99]
+BAYESIAN_PRIORS = [(0.5, 0.5), (1.0, 1.0)]
+
+METADATA_FILE = "metadata.json"
+
+
+def _locate(axis: np.ndarray, value: float) -> Optional[Tuple[int, float]]:
+    """
+    Retourne l'indice de la cellule contenant value et la position relative dans
+    la cellule, ou None si value est hors de l'axe
+    """
+    if value < axis[0] or value > axis[-1]:
+        return None
+    index = int(np.clip(np.searchsorted(axis, value, side="right") - 1, 0, len(axis) - 2))
+    fraction = (value - axis[index]) / (axis[index + 1] - axis[index])
+    return index, float(fraction)
+
+
+def _bilinear(table: np.ndarray, i: int, fx: float, j: int, fy: float) -> float:
+    return float(
+        table[i, j] * (1 - fx) * (1 - fy)
+        + table[i + 1, j] * fx * (1 - fy)
+        + table[i, j + 1] * (1 - fx) * fy
+        + table[i + 1, j + 1] * fx * fy
+    )
+
+
+def _cell_errors(values: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    Erreur relative de l'interpolation bilinéaire au centre de chaque cellule,
+    là où elle est maximale pour une surface régulière
+    """
+    interpolated = (values[:-1, :-1] + values[1:, :-1] + values[:-1, 1:] + values[1:, 1:]) / 4
+    errors = np.abs(np.expm1(interpolated - centers))
+    return np.where(np.isfinite(errors), errors, np.inf)
+
+
+class SampleSizeTables:
+    """
+    Accès en temps constant aux tables précalculées
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.loaded = False
+        self.metadata: Dict[str, Any] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.stats = {"hits": 0, "fallbacks": 0}
+
+    def load(self) -> bool:
+        """
+        Ouvre les tables en mémoire mappée (les pages sont lues à la demande)
+        """
+        metadata_path = self.directory / METADATA_FILE
+        if not metadata_path.exists():
+            logger.info(f"No sample size tables in {self.directory}, estimates will be computed live")
+            return False
+        try:
+            with open(metadata_path) as f:
+                self.metadata = json.load(f)
+            self.arrays = {
+                name: np.load(self.directory / f"{name}.npy", mmap_mode="r")
+                for name in self.metadata["arrays"]
+            }
+            self.loaded = True
+            logger.info(f"Sample size tables loaded from {self.directory}")
+        except Exception as e:
+            logger.error(f"Error loading sample size tables: {e}")
+            self.loaded = False
+        return self.loaded
+
+    def _record(self, value: Optional[Any]) -> Optional[Any]:
+        self.stats["hits" if value is not None else "fallbacks"] += 1
+        return value
+
+    def bayesian_sample_size(
+        self,
+        baseline_rate: float,
+        expected_improvement: float,
+        confidence: float,
+        prior_alpha: float,
+        prior_beta: float
+    ) -> Optional[int]:
+        """
+        Taille d'échantillon bayésienne (moteur quadrature) interpolée en log,
+        ou None si les paramètres sont hors de la surface précalculée
+        """
+        if not self.loaded:
+            return None
+        axes = self.metadata["bayesian"]
+        priors = [tuple(prior) for prior in axes["priors"]]
+        matches_c = [k for k, c in enumerate(axes["confidences"]) if math.isclose(c, confidence, abs_tol=1e-9)]
+        matches_p = [k for k, p in enumerate(priors) if math.isclose(p[0], prior_alpha) and math.isclose(p[1], prior_beta)]
+        if not matches_c or not matches_p or expected_improvement <= 0:
+            return self._record(None)
+        position_b = _locate(np.log(axes["baselines"]), math.log(baseline_rate))
+        position_m = _locate(np.log(axes["improvements"]), math.log(expected_improvement))
+        if position_b is None or position_m is None:
+            return self._record(None)
+        (i, fx), (j, fy) = position_b, position_m
+        c, p = matches_c[0], matches_p[0]
+        if self.arrays["bayesian_error"][c, p, i, j] > LOOKUP_MAX_RELATIVE_ERROR:
+            return self._record(None)
+        log_n = _bilinear(self.arrays["bayesian_log_n"][c, p], i, fx, j, fy)
+        return self._record(math.ceil(math.exp(log_n)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "loaded": self.loaded, "directory": str(self.directory)}
+
+
+def _bayesian_log_n(baseline_rate: float, improvement: float, confidence: float, prior: Tuple[float, float]) -> float:
+    """log de la taille d'échantillon, NaN si elle est plafonnée ou si l'effet est impossible"""
+    # Import local: statistics utilise lui-même ce module
+    from app.services.statistics import BayesianCalculator
+    expected_cr = baseline_rate * (1 + improvement)
+    if expected_cr >= 1:
+        return math.nan
+    n = BayesianCalculator.calculate_sample_size(
+        baseline_rate=baseline_rate,
+        mde=baseline_rate * improvement,
+        confidence=confidence,
+        prior_alpha=prior[0],
+        prior_beta=prior[1],
+        test_type="one-sided",
+        engine="quadrature"
+    )
+    if n <= BayesianCalculator.MIN_SAMPLE_SIZE or n >= BayesianCalculator.MAX_SAMPLE_SIZE:
+        return math.nan
+    return math.log(n)
+
+
+def build_tables(
+    output_dir: str,
+    baselines: np.ndarray = BAYESIAN_BASELINES,
+    improvements: np.ndarray = BAYESIAN_IMPROVEMENTS,
+    confidences: List[float] = BAYESIAN_CONFIDENCES,
+    priors: List[Tuple[float, float]] = BAYESIAN_PRIORS
+) -> Path:
+    """
+    Calcule et écrit les tables dans output_dir.
+
+    Pour une amélioration positive, la règle bilatérale max(P, 1-P) coïncide avec
+    la règle unilatérale : la surface bayésienne n'a donc pas d'axe test_type.
+    """
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    started_at = time.perf_counter()
+
+    # Surface bayésienne: log n sur (taux de base, amélioration relative) en échelle log
+    mid_baselines = np.sqrt(baselines[:-1] * baselines[1:])
+    mid_improvements = np.sqrt(improvements[:-1] * improvements[1:])
+    log_n = np.full((len(confidences), len(priors), len(baselines), len(improvements)), np.nan)
+    log_n_centers = np.full((len(confidences), len(priors), len(baselines) - 1, len(improvements) - 1), np.nan)
+    for c, confidence in enumerate(confidences):
+        for p, prior in enumerate(priors):
+            for i, baseline_rate in enumerate(baselines):
+                for j, improvement in enumerate(improvements):
+                    log_n[c, p, i, j] = _bayesian_log_n(baseline_rate, improvement, confidence, prior)
+            for i, baseline_rate in enumerate(mid_baselines):
+                for j, improvement in enumerate(mid_improvements):
+                    log_n_centers[c, p, i, j] = _bayesian_log_n(baseline_rate, improvement, confidence, prior)
+            logger.info(f"Bayesian surface done for confidence={confidence}, prior={prior}")
+    bayesian_error = np.array([
+        [_cell_errors(log_n[c, p], log_n_centers[c, p]) for p in range(len(priors))]
+        for c in range(len(confidences))
+    ])
+
+    arrays = {
+        "bayesian_log_n": log_n,
+        "bayesian_error": bayesian_error
+    }
+    for name, array in arrays.items():
+        np.save(output / f"{name}.npy", array)
+
+    metadata = {
+        "generated_at": time.time(),
+        "max_relative_error": LOOKUP_MAX_RELATIVE_ERROR,
+        "arrays": list(arrays),
+        "bayesian": {
+            "baselines": np.asarray(baselines).tolist(),
+            "improvements": np.asarray(improvements).tolist(),
+            "confidences": list(confidences),
+            "priors": [list(prior) for prior in priors],
+            "engine": "quadrature"
+        }
+    }
+    with open(output / METADATA_FILE, "w") as f:
+        json.dump(metadata, f)
+
+    logger.info(f"Sample size tables written to {output} in {time.perf_counter() - started_at:.1f}s")
+    return output
+
+
+sample_size_tables = SampleSizeTables(settings.LOOKUP_TABLES_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère les tables précalculées de tailles d'échantillon")
+    parser.add_argument("--output", default=settings.LOOKUP_TABLES_DIR, help="Dossier de sortie des tables")
+    args = parser.parse_args()
+    build_tables(args.output)
+
+
+if __name__ == "__main__":
+    main()
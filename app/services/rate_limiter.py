@@ -1,81 +1,269 @@
-import time
-from collections import defaultdict
-from typing import Dict, List, Tuple
+import math
 import threading
+import time
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.redis_client import redis_async, redis_breaker
+
+# GCRA (generic cell rate algorithm) in Redis: one key per client holding the
+# theoretical arrival time (TAT) in milliseconds, expiring once the quota is full again.
+# ARGV: emission interval (ms), window (ms), cost (1 = consume, 0 = peek).
+# Returns {allowed, remaining, reset_ms, retry_after_ms}.
+GCRA_SCRIPT = """
+local emission = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call("TIME")
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local tat = tonumber(redis.call("GET", KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + emission * cost
+local allow_at = new_tat - window
+if now < allow_at then
+    return {0, 0, tat - now, allow_at - now}
+end
+if cost > 0 then
+    redis.call("SET", KEYS[1], new_tat, "PX", new_tat - now)
+end
+return {1, math.floor((now + window - new_tat) / emission), new_tat - now, 0}
+"""
+
+
+class RateLimitDecision(NamedTuple):
+    """Outcome of a rate limit check for one client."""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # seconds until the full quota is available again
+    retry_after: float  # seconds until the next request is allowed (0 if allowed)
+
+
+class MemoryRateLimitBackend:
+    """
+    In-process GCRA limiter.
+
+    Each client costs a single float (its theoretical arrival time), whatever its
+    request rate. Keys are spread over shards with their own lock, and keys whose
+    quota is full again are evicted, so idle clients do not accumulate.
+    """
+
+    def __init__(self, max_requests: int, time_window: float, shards: int = 16):
+        """
+        Initialize the backend.
+
+        Args:
+            max_requests (int): Maximum number of requests allowed in the time window
+            time_window (float): Time window in seconds
+            shards (int): Number of independently locked key partitions
+        """
+        self.max_requests = max_requests
+        self.time_window = time_window
+        self.emission_interval = time_window / max_requests
+        self._shards: List[Dict[str, float]] = [{} for _ in range(max(1, shards))]
+        self._locks = [threading.Lock() for _ in self._shards]
+        self._last_sweep = [0.0] * len(self._shards)
+
+    def _shard_index(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % len(self._shards)
+
+    def _sweep(self, index: int, now: float):
+        """Drop the keys of a shard whose quota is full again (at most once per window)."""
+        if now - self._last_sweep[index] < self.time_window:
+            return
+        shard = self._shards[index]
+        for key in [key for key, tat in shard.items() if tat <= now]:
+            del shard[key]
+        self._last_sweep[index] = now
+
+    def check(self, key: str, cost: int = 1) -> RateLimitDecision:
+        """
+        Consume cost requests from the client's quota (cost=0 only reads it).
+
+        Args:
+            key (str): Client identifier
+            cost (int): Number of requests to consume
+
+        Returns:
+            RateLimitDecision: Whether the request is allowed and the quota state
+        """
+        index = self._shard_index(key)
+        now = time.monotonic()
+        with self._locks[index]:
+            shard = self._shards[index]
+            tat = max(shard.get(key, now), now)
+            new_tat = tat + self.emission_interval * cost
+            allow_at = new_tat - self.time_window
+            if now < allow_at:
+                return RateLimitDecision(False, self.max_requests, 0, tat - now, allow_at - now)
+            if cost:
+                shard[key] = new_tat
+            self._sweep(index, now)
+        remaining = int((now + self.time_window - new_tat) / self.emission_interval + 1e-9)
+        return RateLimitDecision(True, self.max_requests, remaining, new_tat - now, 0.0)
+
+    def size(self) -> int:
+        """Number of clients currently tracked."""
+        return sum(len(shard) for shard in self._shards)
+
+
+class RedisRateLimitBackend:
+    """
+    GCRA limiter shared by all workers, evaluated atomically by a Lua script.
+    """
+
+    def __init__(self, max_requests: int, time_window: float, prefix: str):
+        """
+        Initialize the backend.
+
+        Args:
+            max_requests (int): Maximum number of requests allowed in the time window
+            time_window (float): Time window in seconds
+            prefix (str): Namespace of the Redis keys
+        """
+        self.max_requests = max_requests
+        self.time_window = time_window
+        self.prefix = prefix
+        self._window_ms = max(1, int(time_window * 1000))
+        self._emission_ms = max(1, self._window_ms // max_requests)
+
+    async def check(self, key: str, cost: int = 1) -> RateLimitDecision:
+        """
+        Consume cost requests from the client's quota (cost=0 only reads it).
+
+        Raises:
+            Exception: If Redis is unavailable or the circuit breaker is open
+        """
+        allowed, remaining, reset_ms, retry_ms = await redis_breaker.call(
+            redis_async.eval, GCRA_SCRIPT, 1, f"{self.prefix}{key}",
+            self._emission_ms, self._window_ms, cost
+        )
+        return RateLimitDecision(bool(allowed), self.max_requests, int(remaining), reset_ms / 1000, retry_ms / 1000)
+
 
 class RateLimiter:
     """
-    A simple in-memory rate limiter that limits requests based on client IP.
-    For production use, consider using Redis or another distributed solution.
+    Rate limiter per client key (usually the client IP).
+
+    The "memory" backend limits each worker process separately; the "redis"
+    backend shares the quota across workers and falls back to the memory
+    backend while Redis is unavailable.
     """
-    
-    def __init__(self, max_requests: int, time_window: int):
+
+    def __init__(self, max_requests: int, time_window: int, name: str = "default", backend: Optional[str] = None):
         """
         Initialize the rate limiter.
-        
+
         Args:
             max_requests (int): Maximum number of requests allowed in the time window
             time_window (int): Time window in seconds
+            name (str): Limiter name, used to namespace the shared Redis keys
+            backend (str, optional): "memory" or "redis" (defaults to RATE_LIMIT_BACKEND)
         """
         self.max_requests = max_requests
         self.time_window = time_window
-        self.request_records: Dict[str, List[float]] = defaultdict(list)
-        self.lock = threading.Lock()
-        
-    def is_allowed(self, client_ip: str) -> bool:
+        self.memory = MemoryRateLimitBackend(max_requests, time_window, settings.RATE_LIMIT_SHARDS)
+        self.redis: Optional[RedisRateLimitBackend] = None
+
+        backend = backend or settings.RATE_LIMIT_BACKEND
+        if backend == "redis":
+            if redis_async:
+                self.redis = RedisRateLimitBackend(max_requests, time_window, f"ratelimit:{name}:")
+            else:
+                logger.warning(f"Rate limiter {name}: REDIS_URL is not configured, using the memory backend")
+        self.backend = "redis" if self.redis else "memory"
+
+    async def check(self, client_ip: str, cost: int = 1) -> RateLimitDecision:
+        """
+        Consume cost requests for the client and return the decision.
+
+        Args:
+            client_ip (str): The client IP address
+            cost (int): Number of requests to consume (0 to only read the quota)
+
+        Returns:
+            RateLimitDecision: Whether the request is allowed and the quota state
+        """
+        if self.redis:
+            try:
+                return await self.redis.check(client_ip, cost)
+            except Exception as e:
+                # Redis unavailable: limit per worker rather than rejecting or allowing everything
+                logger.debug(f"Rate limiter falling back to memory backend: {e}")
+        return self.memory.check(client_ip, cost)
+
+    async def is_allowed(self, client_ip: str) -> bool:
         """
         Check if a request from the given client IP is allowed.
-        
+
         Args:
             client_ip (str): The client IP address
-            
+
         Returns:
             bool: True if the request is allowed, False otherwise
         """
-        current_time = time.time()
-        
-        with self.lock:
-            # Remove expired records
-            self.request_records[client_ip] = [
-                timestamp for timestamp in self.request_records[client_ip]
-                if current_time - timestamp < self.time_window
-            ]
-            
-            # Check if the client has exceeded the limit
-            if len(self.request_records[client_ip]) >= self.max_requests:
-                return False
-            
-            # Record the current request
-            self.request_records[client_ip].append(current_time)
-            return True
-            
-    def get_remaining(self, client_ip: str) -> Tuple[int, int]:
+        return (await self.check(client_ip)).allowed
+
+    async def get_remaining(self, client_ip: str) -> Tuple[int, int]:
         """
         Get the number of remaining requests for the client and reset time.
-        
+
         Args:
             client_ip (str): The client IP address
-            
+
         Returns:
             Tuple[int, int]: (remaining requests, seconds until reset)
         """
-        current_time = time.time()
-        
-        with self.lock:
-            # Remove expired records
-            valid_requests = [
-                timestamp for timestamp in self.request_records[client_ip]
-                if current_time - timestamp < self.time_window
-            ]
-            
-            # Calculate remaining requests
-            remaining = max(0, self.max_requests - len(valid_requests))
-            
-            # Calculate reset time
-            if valid_requests:
-                oldest_request = min(valid_requests)
-                reset_in = int(self.time_window - (current_time - oldest_request))
-            else:
-                reset_in = 0
-                
-            return remaining, reset_in 
\ No newline at end of file
+        decision = await self.check(client_ip, cost=0)
+        return decision.remaining, math.ceil(decision.reset_after)
+
+    def headers(self, remaining: int, reset_in: int, retry_after: Optional[float] = None) -> Dict[str, str]:
+        """
+        Build the RateLimit-* response headers (IETF draft) from get_remaining() values.
+
+        Args:
+            remaining (int): Remaining requests in the current window
+            reset_in (int): Seconds until the full quota is available again
+            retry_after (float, optional): Seconds before a rejected client may retry
+
+        Returns:
+            Dict[str, str]: Headers, with Retry-After when the request is rejected
+        """
+        headers = {
+            "RateLimit-Limit": str(self.max_requests),
+            "RateLimit-Remaining": str(remaining),
+            "RateLimit-Reset": str(reset_in),
+            "RateLimit-Policy": f"{self.max_requests};w={self.time_window}"
+        }
+        if retry_after is not None:
+            headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return headers
+
+    def decision_headers(self, decision: RateLimitDecision) -> Dict[str, str]:
+        """
+        Build the RateLimit-* response headers for the result of check().
+
+        Args:
+            decision (RateLimitDecision): Result of check()
+
+        Returns:
+            Dict[str, str]: Headers, with Retry-After when the request is rejected
+        """
+        return self.headers(
+            decision.remaining,
+            math.ceil(decision.reset_after),
+            None if decision.allowed else decision.retry_after
+        )
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend,
+            "max_requests": self.max_requests,
+            "time_window": self.time_window,
+            "tracked_clients": self.memory.size()
+        }
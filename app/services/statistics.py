@@ -1,8 +1,46 @@
 import math
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 import scipy.stats as stats
+from scipy import optimize, special
 from loguru import logger
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.lookup_tables import sample_size_tables
+from app.services.worker_pool import calculation_pool
+
+
+# Moteurs de calcul disponibles pour la méthode bayésienne
+BAYESIAN_ENGINES = ("gauss_legendre", "quadrature", "montecarlo")
+DEFAULT_BAYESIAN_ENGINE = "quadrature"
+
+# Anciens noms des moteurs, toujours acceptés
+BAYESIAN_ENGINE_ALIASES = {"exact": "gauss_legendre"}
+
+# Contrat de tolérance : les moteurs déterministes doivent retrouver la taille
+# d'échantillon du moteur Monte Carlo à 5% près (écart relatif), ce qui couvre
+# le bruit de simulation de la recherche dichotomique historique.
+ENGINE_RELATIVE_TOLERANCE = 0.05
+
+# Stratégies de recherche pour le moteur Monte Carlo
+MONTECARLO_SEARCHES = ("bisection", "grid")
+
+# Moteurs trop coûteux pour être exécutés dans la boucle d'événements
+POOLED_ENGINES = ("gauss_legendre", "montecarlo")
+
+# Threads partagés par les simulations Monte Carlo parallèles (créés à la demande)
+_simulation_threads: Optional[ThreadPoolExecutor] = None
+
+
+def _get_simulation_threads() -> ThreadPoolExecutor:
+    global _simulation_threads
+    if _simulation_threads is None:
+        _simulation_threads = ThreadPoolExecutor(
+            max_workers=max(1, settings.MONTECARLO_THREADS),
+            thread_name_prefix="montecarlo"
+        )
+    return _simulation_threads
 
 
 class FrequentistCalculator:
@@ -31,6 +69,15 @@ class FrequentistCalculator:
         Returns:
             int: The required sample size per variation
         """
+        z_sum = FrequentistCalculator.z_score_sum(alpha, power, test_type)
+        return FrequentistCalculator.sample_size_from_z_sum(baseline_rate, mde, z_sum)
+
+    @staticmethod
+    def z_score_sum(alpha: float, power: float, test_type: str) -> float:
+        """
+        Calculate z_alpha + z_beta, the only part of the formula that depends on
+        the confidence, the power and the test type
+        """
         # Adjust z-alpha based on test type
         if test_type == "one-sided":
             z_alpha = stats.norm.ppf(1 - alpha)
@@ -38,21 +85,76 @@ class FrequentistCalculator:
             z_alpha = stats.norm.ppf(1 - alpha / 2)
             
         z_beta = stats.norm.ppf(power)
-        
+        return z_alpha + z_beta
+
+    @staticmethod
+    def sample_size_from_z_sum(baseline_rate: float, mde: float, z_sum: float) -> int:
+        """
+        Calculate the sample size per variation from a precomputed z_alpha + z_beta
+        """
         # Utiliser la méthode exacte avec les variances individuelles des proportions
         p2 = baseline_rate + mde
         variance = baseline_rate * (1 - baseline_rate) + p2 * (1 - p2)
-        n = (z_alpha + z_beta)**2 * variance / (mde**2)
+        n = z_sum**2 * variance / (mde**2)
         
         # Round up to the nearest integer
         return math.ceil(n)
 
+    @staticmethod
+    def sample_sizes_from_z_sums(baseline_rates: np.ndarray, mdes: np.ndarray, z_sums: np.ndarray) -> np.ndarray:
+        """
+        Vectorized sample_size_from_z_sum over arrays of scenarios
+        
+        Returns:
+            np.ndarray: The required sample sizes per variation (int64)
+        """
+        p2 = baseline_rates + mdes
+        variance = baseline_rates * (1 - baseline_rates) + p2 * (1 - p2)
+        n = z_sums**2 * variance / (mdes**2)
+        return np.ceil(n).astype(np.int64)
+
 
 class BayesianCalculator:
     """
     Implements Bayesian hypothesis testing for proportion differences
     """
     
+    # Bornes de la recherche de taille d'échantillon
+    MIN_SAMPLE_SIZE = 10
+    MAX_SAMPLE_SIZE = 1000000
+    
+    # Nombre maximal de noeuds utilisés pour discrétiser la loi binomiale des données
+    GAUSS_LEGENDRE_DATA_NODES = 48
+    QUADRATURE_DATA_NODES = 32
+    
+    # Quadrature de Gauss-Legendre composite sur le taux de conversion (moteur "gauss_legendre")
+    GAUSS_LEGENDRE_PANELS = 4
+    GAUSS_LEGENDRE_NODES = 24
+    
+    # En dessous de ce nombre de conversions (ou non-conversions) attendues,
+    # l'approximation normale des postérieurs n'est plus fiable
+    NORMAL_APPROX_MIN_COUNT = 50
+    
+    # Taille des grilles de la recherche Monte Carlo vectorisée
+    GRID_COARSE_POINTS = 6
+    GRID_FINE_POINTS = 6
+    GRID_FINE_WIDTH = 0.05  # demi-largeur relative de la grille fine
+    
+    # Nombre d'expériences simulées pour la courbe d'effet détectable
+    CURVE_SIMULATIONS = 10000
+    # En deçà, l'effet détectable est considéré nul (bruit de simulation près de confidence = 0.5)
+    CURVE_MIN_LIFT = 1e-12
+    
+    # Chaque simulation est découpée en flux indépendants (SeedSequence.spawn), toujours
+    # les mêmes quel que soit le nombre de threads: le résultat ne dépend que de la graine
+    SIMULATION_STREAMS = 8
+    # En dessous, le coût de répartition sur les threads dépasse le gain
+    PARALLEL_MIN_SIMULATIONS = 20000
+    
+    # Arrêt anticipé: les flux sont tirés par vagues (1, 1, 2, 4...) et la simulation
+    # s'arrête dès que la décision est acquise avec ce taux d'erreur
+    EARLY_STOP_ERROR_RATE = 0.001
+    
     @staticmethod
     def calculate_sample_size(
         baseline_rate: float,
@@ -61,11 +163,44 @@ class BayesianCalculator:
         prior_alpha: float,
         prior_beta: float,
         test_type: str,
-        simulation_count: int = 50000  # Augmente la précision de la simulation Monte Carlo
+        simulation_count: int = 50000,  # Augmente la précision de la simulation Monte Carlo
+        engine: str = DEFAULT_BAYESIAN_ENGINE,
+        search: str = "bisection",
+        rng: Optional[np.random.Generator] = None,
+        seed: Optional[int] = None,
+        parallel: bool = False,
+        adaptive: bool = True
     ) -> int:
         """
         Calculate the sample size per variation required for a Bayesian A/B test
         
+        See calculate_sample_size_with_draws for the arguments.
+        """
+        return BayesianCalculator.calculate_sample_size_with_draws(
+            baseline_rate, mde, confidence, prior_alpha, prior_beta, test_type,
+            simulation_count, engine, search, rng, seed, parallel, adaptive
+        )[0]
+    
+    @staticmethod
+    def calculate_sample_size_with_draws(
+        baseline_rate: float,
+        mde: float,
+        confidence: float,
+        prior_alpha: float,
+        prior_beta: float,
+        test_type: str,
+        simulation_count: int = 50000,
+        engine: str = DEFAULT_BAYESIAN_ENGINE,
+        search: str = "bisection",
+        rng: Optional[np.random.Generator] = None,
+        seed: Optional[int] = None,
+        parallel: bool = False,
+        adaptive: bool = True
+    ) -> Tuple[int, int]:
+        """
+        Calculate the sample size per variation required for a Bayesian A/B test,
+        along with the number of simulated experiments it took
+        
         Args:
             baseline_rate: The baseline conversion rate (e.g., 0.1 for 10%)
             mde: Minimum Detectable Effect as absolute difference (e.g., 0.02 for 2%)
@@ -73,15 +208,106 @@ class BayesianCalculator:
             prior_alpha: Alpha parameter for Beta prior (successes)
             prior_beta: Beta parameter for Beta prior (failures)
             test_type: Either "one-sided" or "two-sided"
-            simulation_count: Number of Monte Carlo simulations
+            simulation_count: Number of Monte Carlo simulations (montecarlo engine only)
+            engine: "gauss_legendre" ("exact" is accepted as an alias), "quadrature" or "montecarlo"
+            search: (montecarlo engine only) "bisection" or "grid"
+            rng: (montecarlo engine only) Random generator of the request
+            seed: (montecarlo engine only) Seed of the generator when rng is not given,
+                for reproducible results
+            parallel: (montecarlo engine only) Run the simulation streams in worker threads
+            adaptive: (montecarlo bisection only) Stop each simulation as soon as the
+                decision is settled instead of always using simulation_count draws
             
         Returns:
-            int: The required sample size per variation
+            Tuple[int, int]: The required sample size per variation and the number of
+            simulated experiments drawn (0 for the deterministic engines)
+        """
+        engine = BAYESIAN_ENGINE_ALIASES.get(engine, engine)
+        if engine not in BAYESIAN_ENGINES:
+            raise ValueError(f"Unknown Bayesian engine: {engine}. Supported engines: {', '.join(BAYESIAN_ENGINES)}")
+        if search not in MONTECARLO_SEARCHES:
+            raise ValueError(f"Unknown search mode: {search}. Supported modes: {', '.join(MONTECARLO_SEARCHES)}")
+        
+        if engine == "montecarlo" and rng is None:
+            # PCG64, propre à la requête: pas d'état partagé entre calculs concurrents
+            rng = np.random.default_rng(seed)
+        
+        if engine == "montecarlo" and search == "grid":
+            return BayesianCalculator._search_montecarlo_grid(
+                baseline_rate,
+                mde,
+                confidence,
+                prior_alpha,
+                prior_beta,
+                test_type,
+                simulation_count,
+                rng,
+                parallel,
+                adaptive
+            )
+        
+        if engine == "montecarlo":
+            return BayesianCalculator._search_montecarlo(
+                baseline_rate,
+                mde,
+                confidence,
+                prior_alpha,
+                prior_beta,
+                test_type,
+                simulation_count,
+                rng,
+                parallel,
+                adaptive
+            )
+        
+        sample_size = BayesianCalculator._search_deterministic(
+            baseline_rate,
+            mde,
+            confidence,
+            prior_alpha,
+            prior_beta,
+            test_type,
+            engine
+        )
+        return sample_size, 0
+    
+    @staticmethod
+    def _is_confident(prob_b_better: float, confidence: float, test_type: str) -> bool:
+        """
+        Apply the decision rule of the test to a probability that B is better than A
+        """
+        if test_type == "two-sided":
+            # For two-sided, we want to be confident that there is a difference (in either direction)
+            # So we check if the probability is high enough or low enough
+            prob_difference = max(prob_b_better, 1 - prob_b_better)
+            return prob_difference >= confidence
+        # For one-sided, we only care if B>A
+        return prob_b_better >= confidence
+    
+    @staticmethod
+    def _search_montecarlo(
+        baseline_rate: float,
+        mde: float,
+        confidence: float,
+        prior_alpha: float,
+        prior_beta: float,
+        test_type: str,
+        simulation_count: int,
+        rng: np.random.Generator,
+        parallel: bool = False,
+        adaptive: bool = True
+    ) -> Tuple[int, int]:
+        """
+        Binary search of the sample size using Monte Carlo simulations at each step
+        
+        Returns:
+            Tuple[int, int]: The sample size and the number of simulated experiments
         """
         # Initialize search
-        min_n = 10
-        max_n = 1000000
+        min_n = BayesianCalculator.MIN_SAMPLE_SIZE
+        max_n = BayesianCalculator.MAX_SAMPLE_SIZE
         current_n = min_n
+        total_draws = 0
         
         # Calculer le taux de conversion attendu pour le variant B (mde est une différence absolue)
         expected_cr = baseline_rate + mde
@@ -91,25 +317,20 @@ class BayesianCalculator:
             mid_n = (min_n + max_n) // 2
             
             # Calculate the probability of B>A with this sample size
-            prob_b_better = BayesianCalculator._simulate_test(
+            prob_b_better, draws = BayesianCalculator._simulate_test(
                 baseline_rate, 
                 expected_cr,
                 mid_n, 
                 prior_alpha, 
                 prior_beta,
-                simulation_count
+                simulation_count,
+                rng,
+                parallel,
+                (confidence, test_type) if adaptive else None
             )
+            total_draws += draws
             
-            if test_type == "two-sided":
-                # For two-sided, we want to be confident that there is a difference (in either direction)
-                # So we check if the probability is high enough or low enough
-                prob_difference = max(prob_b_better, 1 - prob_b_better)
-                is_confident = prob_difference >= confidence
-            else:  # one-sided
-                # For one-sided, we only care if B>A
-                is_confident = prob_b_better >= confidence
-            
-            if is_confident:
+            if BayesianCalculator._is_confident(prob_b_better, confidence, test_type):
                 # We found a viable sample size, try a smaller one
                 current_n = mid_n
                 max_n = mid_n - 1
@@ -117,7 +338,520 @@ class BayesianCalculator:
                 # Not enough confidence, try a larger sample size
                 min_n = mid_n + 1
         
-        return current_n
+        logger.debug(f"Monte Carlo bisection converged to n={current_n} with {total_draws} simulated experiments")
+        return current_n, total_draws
+    
+    @staticmethod
+    def _search_montecarlo_grid(
+        baseline_rate: float,
+        mde: float,
+        confidence: float,
+        prior_alpha: float,
+        prior_beta: float,
+        test_type: str,
+        simulation_count: int,
+        rng: np.random.Generator,
+        parallel: bool = False,
+        adaptive: bool = True
+    ) -> Tuple[int, int]:
+        """
+        Grid search of the sample size with one vectorized simulation per grid
+        
+        A coarse geometric grid around the normal approximation locates the crossing
+        point, then a second small grid around the interpolated crossing refines it.
+        Both steps rely on probit(P(B>A)) being close to linear in sqrt(n).
+        
+        Returns:
+            Tuple[int, int]: The sample size and the number of simulated experiments
+        """
+        min_n = BayesianCalculator.MIN_SAMPLE_SIZE
+        max_n = BayesianCalculator.MAX_SAMPLE_SIZE
+        expected_cr = baseline_rate + mde
+        total_draws = 0
+        
+        def evaluate(sizes: np.ndarray) -> np.ndarray:
+            nonlocal total_draws
+            # Chaque expérience simulée est prolongée sur toute la grille
+            total_draws += simulation_count
+            prob_b_better = BayesianCalculator._simulate_grid(
+                baseline_rate,
+                expected_cr,
+                sizes,
+                prior_alpha,
+                prior_beta,
+                simulation_count,
+                rng
+            )
+            if test_type == "two-sided":
+                return np.maximum(prob_b_better, 1 - prob_b_better)
+            return prob_b_better
+        
+        def coarse_grid(lower: int, upper: int) -> np.ndarray:
+            return np.unique(np.geomspace(lower, upper, BayesianCalculator.GRID_COARSE_POINTS).round().astype(np.int64))
+        
+        # Passe grossière autour de l'approximation normale
+        guess = BayesianCalculator._normal_approximation(baseline_rate, expected_cr, confidence)
+        smallest_rate = min(baseline_rate, 1 - baseline_rate, expected_cr, 1 - expected_cr)
+        if guess is not None and guess * smallest_rate < BayesianCalculator.NORMAL_APPROX_MIN_COUNT:
+            # Petits effectifs: la comparaison gaussienne des postérieurs n'est plus fiable
+            return BayesianCalculator._search_montecarlo(
+                baseline_rate,
+                mde,
+                confidence,
+                prior_alpha,
+                prior_beta,
+                test_type,
+                simulation_count,
+                rng,
+                parallel,
+                adaptive
+            )
+        if guess is None:
+            lower, upper = min_n, max_n
+        else:
+            lower = min(max_n - 1, max(min_n, math.floor(guess / 4)))
+            upper = max(lower + 1, min(max_n, math.ceil(guess * 4)))
+        grid = coarse_grid(lower, upper)
+        probs = evaluate(grid)
+        confident = np.nonzero(probs >= confidence)[0]
+        
+        # Étendre la fenêtre si le point de bascule n'est pas dans la grille
+        if len(confident) == 0:
+            if grid[-1] >= max_n:
+                return max_n, total_draws
+            grid = coarse_grid(int(grid[-1]), max_n)
+            probs = evaluate(grid)
+            confident = np.nonzero(probs >= confidence)[0]
+            if len(confident) == 0:
+                return max_n, total_draws
+        elif confident[0] == 0:
+            if grid[0] <= min_n:
+                return min_n, total_draws
+            grid = coarse_grid(min_n, int(grid[0]))
+            probs = evaluate(grid)
+            confident = np.nonzero(probs >= confidence)[0]
+            if len(confident) == 0:
+                # Bruit de simulation: la nouvelle grille n'atteint plus le seuil, même à la
+                # taille confiante de la passe précédente, qui reste le point de bascule
+                return int(grid[-1]), total_draws
+            if confident[0] == 0:
+                return min_n, total_draws
+        
+        # Première estimation par interpolation sur l'échelle probit, linéaire en sqrt(n)
+        crossing = confident[0]
+        lo, hi = int(grid[crossing - 1]), int(grid[crossing])
+        if hi - lo <= 1:
+            return hi, total_draws
+        estimate = BayesianCalculator._probit_root(grid[crossing - 1:crossing + 1], probs[crossing - 1:crossing + 1], confidence)
+        if estimate is None:
+            estimate = (lo + hi) / 2
+        
+        # Passe fine resserrée autour de l'estimation, ajustée par moindres carrés
+        width = BayesianCalculator.GRID_FINE_WIDTH * estimate
+        grid = np.unique(np.linspace(
+            max(lo, estimate - width),
+            min(hi, estimate + width),
+            BayesianCalculator.GRID_FINE_POINTS
+        ).round().astype(np.int64))
+        if len(grid) >= 2:
+            refined = BayesianCalculator._probit_root(grid, evaluate(grid), confidence)
+            if refined is not None:
+                estimate = refined
+        return min(hi, max(lo + 1, math.ceil(estimate))), total_draws
+    
+    @staticmethod
+    def _probit_root(sizes: np.ndarray, probs: np.ndarray, confidence: float) -> Optional[float]:
+        """
+        Sample size at which the probability reaches the confidence level, assuming
+        probit(probability) is linear in sqrt(n) as it is for Gaussian posteriors
+        """
+        z = special.ndtri(np.clip(probs, 1e-12, 1 - 1e-12))
+        slope, intercept = np.polyfit(np.sqrt(sizes), z, 1)
+        if slope <= 0:
+            return None
+        return ((special.ndtri(confidence) - intercept) / slope) ** 2
+    
+    @staticmethod
+    def _search_deterministic(
+        baseline_rate: float,
+        mde: float,
+        confidence: float,
+        prior_alpha: float,
+        prior_beta: float,
+        test_type: str,
+        engine: str
+    ) -> int:
+        """
+        Root-finding of the sample size on a deterministic probability curve
+        
+        The search is bracketed around the normal approximation of the answer, then
+        refined with Brent's method and finally adjusted to the smallest integer
+        sample size that meets the confidence requirement.
+        """
+        min_n = BayesianCalculator.MIN_SAMPLE_SIZE
+        max_n = BayesianCalculator.MAX_SAMPLE_SIZE
+        expected_cr = baseline_rate + mde
+        evaluations: Dict[int, float] = {}
+        
+        def margin(n: float) -> float:
+            # Écart entre la probabilité de décision et le seuil de confiance
+            n = int(round(n))
+            if n not in evaluations:
+                prob_b_better = BayesianCalculator._posterior_probability(
+                    baseline_rate,
+                    expected_cr,
+                    n,
+                    prior_alpha,
+                    prior_beta,
+                    engine
+                )
+                evaluations[n] = max(prob_b_better, 1 - prob_b_better) if test_type == "two-sided" else prob_b_better
+            return evaluations[n] - confidence
+        
+        # Resserrer l'intervalle autour de l'approximation normale
+        lo, hi = min_n, max_n
+        guess = BayesianCalculator._normal_approximation(baseline_rate, expected_cr, confidence)
+        if guess is not None:
+            upper = min(max_n, max(min_n + 1, math.ceil(2 * guess)))
+            if margin(upper) >= 0:
+                hi = upper
+            else:
+                lo = upper
+            lower = max(min_n, math.floor(guess / 2))
+            if lo < lower < hi:
+                if margin(lower) < 0:
+                    lo = lower
+                else:
+                    hi = lower
+        
+        if lo == min_n and margin(min_n) >= 0:
+            return min_n
+        if hi == max_n and margin(max_n) < 0:
+            # Même la taille maximale ne suffit pas à atteindre la confiance demandée
+            return max_n
+        
+        root = optimize.brentq(margin, lo, hi, xtol=0.5)
+        
+        # Ajuster au plus petit entier qui satisfait la contrainte
+        n = min(hi, max(lo + 1, math.ceil(root)))
+        while n < hi and margin(n) < 0:
+            n += 1
+        while n - 1 > lo and margin(n - 1) >= 0:
+            n -= 1
+        
+        logger.debug(f"Bayesian {engine} search converged to n={n} in {len(evaluations)} evaluations")
+        return n
+    
+    @staticmethod
+    def approximate_sample_size(baseline_rate: float, mde: float, confidence: float) -> int:
+        """
+        Closed-form sample size per variation from the Gaussian approximation,
+        clipped to the same bounds as calculate_sample_size
+        """
+        guess = BayesianCalculator._normal_approximation(baseline_rate, baseline_rate + mde, confidence)
+        if guess is None:
+            return BayesianCalculator.MAX_SAMPLE_SIZE
+        return int(min(max(math.ceil(guess), BayesianCalculator.MIN_SAMPLE_SIZE), BayesianCalculator.MAX_SAMPLE_SIZE))
+    
+    @staticmethod
+    def _normal_approximation(p_a: float, p_b: float, confidence: float) -> Optional[float]:
+        """
+        Closed-form sample size assuming Gaussian posterior predictive distributions
+        
+        Each simulated posterior draw has a variance of about 2p(1-p)/n (posterior
+        variance plus the sampling variance of the posterior mean).
+        """
+        difference = abs(p_b - p_a)
+        if difference == 0:
+            return None
+        z = stats.norm.ppf(confidence)
+        variance = p_a * (1 - p_a) + p_b * (1 - p_b)
+        return 2 * z ** 2 * variance / difference ** 2
+    
+    @staticmethod
+    def _posterior_probability(
+        p_a: float,
+        p_b: float,
+        n: int,
+        prior_alpha: float,
+        prior_beta: float,
+        engine: str
+    ) -> float:
+        """
+        Deterministic counterpart of _simulate_test
+        
+        Computes the same quantity as the Monte Carlo simulation, i.e. the probability
+        that a posterior draw of B exceeds a posterior draw of A once averaged over the
+        binomial distribution of the observed conversions.
+        
+        Args:
+            p_a: The true conversion rate of variation A
+            p_b: The true conversion rate of variation B
+            n: The sample size per variation
+            prior_alpha: Alpha parameter for Beta prior
+            prior_beta: Beta parameter for Beta prior
+            engine: "gauss_legendre" or "quadrature"
+            
+        Returns:
+            float: The probability that B is better than A
+        """
+        smallest_count = n * min(p_a, 1 - p_a, p_b, 1 - p_b)
+        if engine == "quadrature" and smallest_count >= BayesianCalculator.NORMAL_APPROX_MIN_COUNT:
+            return BayesianCalculator._quadrature_probability(p_a, p_b, n, prior_alpha, prior_beta)
+        return BayesianCalculator._gauss_legendre_probability(p_a, p_b, n, prior_alpha, prior_beta)
+    
+    @staticmethod
+    def _binomial_nodes(n: int, p: float, max_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Discretize Binomial(n, p) on a regular sub-lattice of its support
+        
+        The full support is enumerated when it is small enough. Otherwise every k-th
+        value is kept: the probability mass function is smooth at that scale, so the
+        renormalized lattice sum converges geometrically fast.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (conversion counts, normalized weights)
+        """
+        sd = math.sqrt(n * p * (1 - p))
+        lower = max(0, math.floor(n * p - 8.5 * sd) - 2)
+        upper = min(n, math.ceil(n * p + 8.5 * sd) + 2)
+        stride = max(1, math.ceil((upper - lower + 1) / max_nodes))
+        counts = np.arange(lower, upper + 1, stride, dtype=float)
+        
+        log_weights = (
+            special.gammaln(n + 1) - special.gammaln(counts + 1) - special.gammaln(n - counts + 1)
+            + special.xlogy(counts, p) + special.xlog1py(n - counts, -p)
+        )
+        weights = np.exp(log_weights - np.max(log_weights))
+        return counts, weights / weights.sum()
+    
+    @staticmethod
+    def _gauss_legendre_probability(
+        p_a: float,
+        p_b: float,
+        n: int,
+        prior_alpha: float,
+        prior_beta: float
+    ) -> float:
+        """
+        P(B>A) = integral of f_B(t) * F_A(t) dt where f_B and F_A are the density and
+        the distribution function of the Beta mixtures obtained by averaging the
+        posteriors over the binomial data, integrated with Gauss-Legendre quadrature.
+        
+        This is a numerical approximation, not a closed form: the binomial data are
+        discretized on at most GAUSS_LEGENDRE_DATA_NODES values and the integral is
+        truncated to 12 standard deviations of B's mixture, on GAUSS_LEGENDRE_PANELS
+        panels of GAUSS_LEGENDRE_NODES nodes. Being the most accurate of the
+        deterministic engines, it serves as their reference.
+        """
+        counts_a, weights_a = BayesianCalculator._binomial_nodes(n, p_a, BayesianCalculator.GAUSS_LEGENDRE_DATA_NODES)
+        counts_b, weights_b = BayesianCalculator._binomial_nodes(n, p_b, BayesianCalculator.GAUSS_LEGENDRE_DATA_NODES)
+        alpha_a = prior_alpha + counts_a
+        beta_a = prior_beta + n - counts_a
+        alpha_b = prior_alpha + counts_b
+        beta_b = prior_beta + n - counts_b
+        
+        # Intervalle d'intégration couvrant la masse du mélange de B
+        means_b = alpha_b / (alpha_b + beta_b)
+        variances_b = alpha_b * beta_b / ((alpha_b + beta_b) ** 2 * (alpha_b + beta_b + 1))
+        mean_b = np.dot(weights_b, means_b)
+        sd_b = math.sqrt(np.dot(weights_b, variances_b + means_b ** 2) - mean_b ** 2)
+        lower = max(0.0, mean_b - 12 * sd_b)
+        upper = min(1.0, mean_b + 12 * sd_b)
+        
+        # Noeuds de Gauss-Legendre composites sur [lower, upper]
+        nodes, node_weights = np.polynomial.legendre.leggauss(BayesianCalculator.GAUSS_LEGENDRE_NODES)
+        edges = np.linspace(lower, upper, BayesianCalculator.GAUSS_LEGENDRE_PANELS + 1)
+        half_widths = np.diff(edges)[:, None] / 2
+        t = (edges[:-1, None] + half_widths * (nodes + 1)).ravel()
+        dt = (half_widths * node_weights).ravel()
+        
+        log_pdf_b = (
+            special.xlogy(alpha_b[:, None] - 1, t) + special.xlog1py(beta_b[:, None] - 1, -t)
+            - special.betaln(alpha_b, beta_b)[:, None]
+        )
+        density_b = weights_b @ np.exp(log_pdf_b)
+        cdf_a = weights_a @ special.betainc(alpha_a[:, None], beta_a[:, None], t)
+        
+        return float(np.clip(np.sum(dt * density_b * cdf_a), 0.0, 1.0))
+    
+    @staticmethod
+    def _quadrature_probability(
+        p_a: float,
+        p_b: float,
+        n: int,
+        prior_alpha: float,
+        prior_beta: float
+    ) -> float:
+        """
+        P(B>A) as a quadrature over the joint binomial distribution of the data, each
+        pair of Beta posteriors being compared through its Gaussian approximation.
+        """
+        counts_a, weights_a = BayesianCalculator._binomial_nodes(n, p_a, BayesianCalculator.QUADRATURE_DATA_NODES)
+        counts_b, weights_b = BayesianCalculator._binomial_nodes(n, p_b, BayesianCalculator.QUADRATURE_DATA_NODES)
+        
+        def posterior_moments(counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            alpha = prior_alpha + counts
+            beta = prior_beta + n - counts
+            total = alpha + beta
+            return alpha / total, alpha * beta / (total ** 2 * (total + 1))
+        
+        mean_a, var_a = posterior_moments(counts_a)
+        mean_b, var_b = posterior_moments(counts_b)
+        z = (mean_b[None, :] - mean_a[:, None]) / np.sqrt(var_a[:, None] + var_b[None, :])
+        
+        return float(weights_a @ special.ndtr(z) @ weights_b)
+    
+    @staticmethod
+    def _simulate_grid(
+        p_a: float,
+        p_b: float,
+        sizes: np.ndarray,
+        prior_alpha: float,
+        prior_beta: float,
+        simulation_count: int,
+        rng: np.random.Generator
+    ) -> np.ndarray:
+        """
+        Simulate a Bayesian A/B test at every sample size of a grid in one pass
+        
+        The grid shares its random streams: each simulated experiment is a single
+        sequence of visitors, so the conversions at a larger sample size extend the
+        ones drawn for the smaller sizes. The comparison of the two Beta posteriors
+        of a simulated experiment is done analytically (Gaussian approximation)
+        instead of with one posterior draw per arm, which removes most of the noise.
+        
+        Args:
+            p_a: The true conversion rate of variation A
+            p_b: The true conversion rate of variation B
+            sizes: Increasing sample sizes per variation
+            prior_alpha: Alpha parameter for Beta prior
+            prior_beta: Beta parameter for Beta prior
+            simulation_count: Number of Monte Carlo simulations
+            rng: Random generator of the request
+            
+        Returns:
+            np.ndarray: The probability that B is better than A at each sample size
+        """
+        sizes = np.asarray(sizes, dtype=np.int64)
+        increments = np.diff(sizes, prepend=0)[:, None]
+        n = sizes[:, None].astype(float)
+        
+        # Conversions cumulées: une même expérience simulée pour toute la grille
+        conversions_a = np.cumsum(rng.binomial(increments, p_a, (len(sizes), simulation_count)), axis=0)
+        conversions_b = np.cumsum(rng.binomial(increments, p_b, (len(sizes), simulation_count)), axis=0)
+        
+        def posterior_moments(conversions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            alpha = prior_alpha + conversions
+            beta = prior_beta + n - conversions
+            total = alpha + beta
+            return alpha / total, alpha * beta / (total ** 2 * (total + 1))
+        
+        mean_a, var_a = posterior_moments(conversions_a)
+        mean_b, var_b = posterior_moments(conversions_b)
+        return special.ndtr((mean_b - mean_a) / np.sqrt(var_a + var_b)).mean(axis=1)
+    
+    @staticmethod
+    def detectable_lift_curve(
+        baseline_rate: float,
+        sizes: np.ndarray,
+        confidence: float,
+        prior_alpha: float,
+        prior_beta: float,
+        simulation_count: int = CURVE_SIMULATIONS,
+        rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """
+        Smallest absolute lift detectable at each horizon of an increasing sequence
+        of sample sizes
+        
+        The simulated experiments are carried from one horizon to the next: the
+        cumulative conversion counts of each arm only receive the visitors added
+        since the previous horizon, and the posterior of the control arm is computed
+        once per horizon whatever the lift being tried. The counts follow the diffusion
+        approximation of the binomial (n*p + sqrt(p*(1-p)) * W(n) with a shared
+        Brownian path W), so the same simulated experiments serve every candidate lift
+        and the decision probability is a smooth, increasing function of the lift.
+        Each horizon is then inverted with Brent's method, starting from the bracket
+        implied by the previous horizon (the lift scales as 1/sqrt(n)).
+        
+        Args:
+            baseline_rate: The baseline conversion rate
+            sizes: Non-decreasing sample sizes per variation
+            confidence: Required probability threshold
+            prior_alpha: Alpha parameter for Beta prior
+            prior_beta: Beta parameter for Beta prior
+            simulation_count: Number of simulated experiments
+            rng: Random generator (a fresh unseeded one if not given)
+            
+        Returns:
+            np.ndarray: The detectable absolute lift at each horizon (inf if none)
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        p_a = baseline_rate
+        max_lift = (1 - p_a) * (1 - 1e-9)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        lifts = np.full(len(sizes), np.inf)
+        if confidence <= 0.5:
+            # Sans effet, P(B>A) vaut déjà 0.5
+            lifts[sizes > 0] = 0.0
+            return lifts
+        
+        path_a = np.zeros(simulation_count)
+        path_b = np.zeros(simulation_count)
+        previous_size = 0
+        previous_lift = previous_solved = None
+        
+        def posterior_moments(conversions: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+            alpha = prior_alpha + conversions
+            beta = prior_beta + n - conversions
+            total = alpha + beta
+            return alpha / total, alpha * beta / (total ** 2 * (total + 1))
+        
+        for k, n in enumerate(sizes.tolist()):
+            if n <= 0:
+                continue
+            
+            # Prolonge les expériences simulées avec les visiteurs de la période
+            step = math.sqrt(n - previous_size)
+            path_a += step * rng.standard_normal(simulation_count)
+            path_b += step * rng.standard_normal(simulation_count)
+            previous_size = n
+            
+            conversions_a = np.clip(n * p_a + math.sqrt(p_a * (1 - p_a)) * path_a, 0, n)
+            mean_a, var_a = posterior_moments(conversions_a, n)
+            
+            def margin(lift: float) -> float:
+                p_b = p_a + lift
+                conversions_b = np.clip(n * p_b + math.sqrt(p_b * (1 - p_b)) * path_b, 0, n)
+                mean_b, var_b = posterior_moments(conversions_b, n)
+                return float(special.ndtr((mean_b - mean_a) / np.sqrt(var_a + var_b)).mean()) - confidence
+            
+            if previous_lift is not None:
+                guess = previous_lift * math.sqrt(previous_solved / n)
+            else:
+                # d = 2z * sqrt(p(1-p)/n), inverse de l'approximation normale
+                guess = 2 * stats.norm.ppf(confidence) * math.sqrt(p_a * (1 - p_a) / n)
+            lower, upper = min(guess * 0.9, max_lift / 2), min(guess * 1.1, max_lift)
+            while margin(lower) > 0 and lower > BayesianCalculator.CURVE_MIN_LIFT:
+                lower /= 2
+            if lower <= BayesianCalculator.CURVE_MIN_LIFT:
+                # Décision acquise sans effet (bruit de simulation): le prochain horizon repart de l'estimation normale
+                lifts[k] = 0.0
+                continue
+            detectable = True
+            while margin(upper) < 0:
+                if upper >= max_lift:
+                    detectable = False
+                    break
+                lower, upper = upper, min(upper * 2, max_lift)
+            if not detectable:
+                continue
+            
+            lifts[k] = previous_lift = optimize.brentq(margin, lower, upper, rtol=1e-4)
+            previous_solved = n
+        
+        return lifts
     
     @staticmethod
     def _simulate_test(
@@ -126,38 +860,148 @@ class BayesianCalculator:
         n: int, 
         prior_alpha: float, 
         prior_beta: float,
-        simulation_count: int
-    ) -> float:
+        simulation_count: int,
+        rng: np.random.Generator,
+        parallel: bool = False,
+        decision: Optional[Tuple[float, str]] = None
+    ) -> Tuple[float, int]:
         """
         Simulate a Bayesian A/B test and return the probability that B is better than A
         
+        The simulations are split across SIMULATION_STREAMS child generators spawned
+        from rng, so the result is the same whether the streams run sequentially or
+        in worker threads. With a decision rule, the streams are drawn in waves of
+        1, 1, 2, 4... and the simulation stops as soon as the decision is settled at
+        EARLY_STOP_ERROR_RATE given the standard error of the estimate; the checkpoints
+        do not depend on the number of threads either.
+        
         Args:
             p_a: The true conversion rate of variation A
             p_b: The true conversion rate of variation B
             n: The sample size per variation
             prior_alpha: Alpha parameter for Beta prior
             prior_beta: Beta parameter for Beta prior
-            simulation_count: Number of Monte Carlo simulations
+            simulation_count: Maximum number of Monte Carlo simulations
+            rng: Random generator of the request
+            parallel: Run the streams in worker threads (NumPy releases the GIL while drawing)
+            decision: (confidence, test_type) enabling early stopping, or None to
+                always run simulation_count simulations
             
         Returns:
-            float: The probability that B is better than A
+            Tuple[float, int]: The probability that B is better than A and the number
+            of simulations actually drawn
         """
-        # Simulate conversions based on true rates
-        conversions_a = np.random.binomial(n, p_a, simulation_count)
-        conversions_b = np.random.binomial(n, p_b, simulation_count)
+        def count_b_wins(stream: np.random.Generator, count: int) -> int:
+            # Simulate conversions based on true rates
+            conversions_a = stream.binomial(n, p_a, count)
+            conversions_b = stream.binomial(n, p_b, count)
+            
+            # Calculate posterior parameters
+            post_alpha_a = prior_alpha + conversions_a
+            post_beta_a = prior_beta + (n - conversions_a)
+            post_alpha_b = prior_alpha + conversions_b
+            post_beta_b = prior_beta + (n - conversions_b)
+            
+            # Sample from posterior distributions
+            samples_a = stream.beta(post_alpha_a, post_beta_a)
+            samples_b = stream.beta(post_alpha_b, post_beta_b)
+            return int(np.count_nonzero(samples_b > samples_a))
         
-        # Calculate posterior parameters
-        post_alpha_a = prior_alpha + conversions_a
-        post_beta_a = prior_beta + (n - conversions_a)
-        post_alpha_b = prior_alpha + conversions_b
-        post_beta_b = prior_beta + (n - conversions_b)
+        streams = rng.spawn(BayesianCalculator.SIMULATION_STREAMS)
+        base_count, remainder = divmod(simulation_count, len(streams))
+        counts = [base_count + (i < remainder) for i in range(len(streams))]
+        threaded = parallel and simulation_count >= BayesianCalculator.PARALLEL_MIN_SIMULATIONS
+        z_error = stats.norm.ppf(1 - BayesianCalculator.EARLY_STOP_ERROR_RATE)
         
-        # Sample from posterior distributions
-        samples_a = np.random.beta(post_alpha_a, post_beta_a)
-        samples_b = np.random.beta(post_alpha_b, post_beta_b)
+        wins = drawn = done = 0
+        while done < len(streams):
+            # Vagues 1, 1, 2, 4...: la simulation double à chaque point de contrôle
+            wave = len(streams) if decision is None else max(1, done)
+            wave_streams, wave_counts = streams[done:done + wave], counts[done:done + wave]
+            if threaded and len(wave_streams) > 1:
+                wins += sum(_get_simulation_threads().map(count_b_wins, wave_streams, wave_counts))
+            else:
+                wins += sum(map(count_b_wins, wave_streams, wave_counts))
+            drawn += sum(wave_counts)
+            done += len(wave_streams)
+            
+            if decision is not None and done < len(streams):
+                confidence, test_type = decision
+                prob = wins / drawn
+                statistic = max(prob, 1 - prob) if test_type == "two-sided" else prob
+                standard_error = math.sqrt(max(prob * (1 - prob), 1 / drawn) / drawn)
+                if abs(statistic - confidence) > z_error * standard_error:
+                    break
         
         # Calculate probability that B > A
-        return np.mean(samples_b > samples_a)
+        return wins / drawn, drawn
+
+
+async def bayesian_sample_size(
+    baseline_rate: float,
+    expected_improvement: float,
+    confidence: float,
+    prior_alpha: float,
+    prior_beta: float,
+    test_type: str,
+    engine: str = DEFAULT_BAYESIAN_ENGINE,
+    search: str = "bisection",
+    seed: Optional[int] = None
+) -> Tuple[int, Optional[int]]:
+    """
+    Bayesian sample size per variation, from the precomputed tables when possible,
+    in the calculation pool for the expensive engines, inline otherwise
+    
+    Args:
+        baseline_rate: The baseline conversion rate
+        expected_improvement: Expected relative improvement (e.g., 0.05 for 5%)
+        confidence: Required probability threshold
+        prior_alpha: Alpha parameter for Beta prior
+        prior_beta: Beta parameter for Beta prior
+        test_type: Either "one-sided" or "two-sided"
+        engine: "gauss_legendre", "quadrature" or "montecarlo"
+        search: (montecarlo engine only) "bisection" or "grid"
+        seed: (montecarlo engine only) Seed for reproducible simulations
+        
+    Returns:
+        Tuple[int, Optional[int]]: The required sample size per variation and, for
+        the montecarlo engine, the number of simulated experiments drawn
+    """
+    engine = BAYESIAN_ENGINE_ALIASES.get(engine, engine)
+    if engine == "quadrature":
+        # Surface précalculée avec le même moteur: réponse en temps constant
+        table_sample_size = sample_size_tables.bayesian_sample_size(
+            baseline_rate, expected_improvement, confidence, prior_alpha, prior_beta
+        )
+        if table_sample_size is not None:
+            return table_sample_size, None
+    
+    calculation_params = {
+        "baseline_rate": baseline_rate,
+        "mde": baseline_rate * expected_improvement,
+        "confidence": confidence,
+        "prior_alpha": prior_alpha,
+        "prior_beta": prior_beta,
+        "test_type": test_type,
+        "engine": engine,
+        "search": search
+    }
+    if engine == "montecarlo":
+        calculation_params["seed"] = seed
+        calculation_params["parallel"] = settings.MONTECARLO_THREADS > 1
+    if engine in POOLED_ENGINES:
+        # Calcul lourd: exécuté dans le pool de processus
+        sample_size, draws = await calculation_pool.run(
+            BayesianCalculator.calculate_sample_size_with_draws,
+            **calculation_params
+        )
+    else:
+        sample_size, draws = BayesianCalculator.calculate_sample_size_with_draws(**calculation_params)
+    
+    if engine == "montecarlo":
+        logger.info(f"Monte Carlo estimate used {draws} simulated experiments")
+        return sample_size, draws
+    return sample_size, None
 
 
 async def estimate_test_duration(params: Dict[Any, Any]) -> Dict[str, int]:
@@ -177,9 +1021,13 @@ async def estimate_test_duration(params: Dict[Any, Any]) -> Dict[str, int]:
             power: (frequentist only) Statistical power (e.g., 0.8)
             prior_alpha: (bayesian only) Alpha parameter for Beta prior
             prior_beta: (bayesian only) Beta parameter for Beta prior
+            engine: (bayesian only) "gauss_legendre", "quadrature" or "montecarlo"
+            search: (bayesian montecarlo only) "bisection" or "grid"
+            seed: (bayesian montecarlo only) Seed for reproducible simulations
             
     Returns:
         Dictionary with sample_size_per_variation, total_sample, and estimated_days
+        (plus simulation_draws for the montecarlo engine)
     """
     # Extract parameters
     daily_visits = params["daily_visits"]
@@ -204,26 +1052,30 @@ async def estimate_test_duration(params: Dict[Any, Any]) -> Dict[str, int]:
     logger.info(f"Absolute MDE: {mde_absolute:.6f}")
     
     # Calculate sample size per variation based on method
+    simulation_draws = None
     if statistical_method == "frequentist":
         power = params["power"]
         alpha = 1 - confidence
-        sample_size_per_variation = FrequentistCalculator.calculate_sample_size(
+        z_sum = FrequentistCalculator.z_score_sum(alpha, power, test_type)
+        sample_size_per_variation = FrequentistCalculator.sample_size_from_z_sum(
             baseline_rate=baseline_rate,
             mde=mde_absolute,
-            alpha=alpha,
-            power=power,
-            test_type=test_type
+            z_sum=z_sum
         )
     else:  # bayesian
-        prior_alpha = params["prior_alpha"]
-        prior_beta = params["prior_beta"]
-        sample_size_per_variation = BayesianCalculator.calculate_sample_size(
+        engine = params.get("engine") or DEFAULT_BAYESIAN_ENGINE
+        search = params.get("search") or "bisection"
+        logger.info(f"Bayesian engine: {engine}" + (f" ({search} search)" if engine == "montecarlo" else ""))
+        sample_size_per_variation, simulation_draws = await bayesian_sample_size(
             baseline_rate=baseline_rate,
-            mde=mde_absolute,
+            expected_improvement=expected_improvement,
             confidence=confidence,
-            prior_alpha=prior_alpha,
-            prior_beta=prior_beta,
-            test_type=test_type
+            prior_alpha=params["prior_alpha"],
+            prior_beta=params["prior_beta"],
+            test_type=test_type,
+            engine=engine,
+            search=search,
+            seed=params.get("seed")
         )
     
     # Calculate total sample size
@@ -239,8 +1091,131 @@ async def estimate_test_duration(params: Dict[Any, Any]) -> Dict[str, int]:
     logger.info(f"Estimated days: {estimated_days} for {total_sample} total sample")
     
     # Return results
-    return {
+    result = {
         "sample_size_per_variation": sample_size_per_variation,
         "total_sample": total_sample,
         "estimated_days": estimated_days
-    } 
\ No newline at end of file
+    }
+    if simulation_draws is not None:
+        result["simulation_draws"] = simulation_draws
+    return result 
+
+
+def _batch_row(params: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """Identifies a batch scenario in its result line"""
+    return {
+        "index": index,
+        "traffic_allocation": params["traffic_allocation"],
+        "expected_improvement": params["expected_improvement"],
+        "variations": params["variations"]
+    }
+
+
+def _frequentist_batch(scenarios: List[Dict[str, Any]], indices: List[int]) -> Dict[int, Dict[str, int]]:
+    """
+    Evaluate frequentist scenarios as NumPy array expressions.
+    
+    z_alpha + z_beta is computed once per distinct (confidence, power, test_type).
+    """
+    if not indices:
+        return {}
+    
+    def column(name: str, dtype) -> np.ndarray:
+        return np.fromiter((scenarios[i][name] for i in indices), dtype=dtype, count=len(indices))
+    
+    z_sums_by_key: Dict[Tuple[float, float, str], float] = {}
+    for i in indices:
+        key = (scenarios[i]["confidence"], scenarios[i]["power"], scenarios[i]["test_type"])
+        if key not in z_sums_by_key:
+            confidence, power, test_type = key
+            z_sums_by_key[key] = FrequentistCalculator.z_score_sum(1 - confidence, power, test_type)
+    z_sums = np.fromiter(
+        (z_sums_by_key[(scenarios[i]["confidence"], scenarios[i]["power"], scenarios[i]["test_type"])] for i in indices),
+        dtype=np.float64,
+        count=len(indices)
+    )
+    
+    daily_visits = column("daily_visits", np.float64)
+    baseline_rates = column("daily_conversions", np.float64) / daily_visits
+    mdes = baseline_rates * column("expected_improvement", np.float64)
+    sample_sizes = FrequentistCalculator.sample_sizes_from_z_sums(baseline_rates, mdes, z_sums)
+    total_samples = sample_sizes * column("variations", np.int64)
+    estimated_days = np.ceil(total_samples / (daily_visits * column("traffic_allocation", np.float64))).astype(np.int64)
+    
+    return {
+        index: {
+            "sample_size_per_variation": n,
+            "total_sample": total,
+            "estimated_days": days
+        }
+        for index, n, total, days in zip(indices, sample_sizes.tolist(), total_samples.tolist(), estimated_days.tolist())
+    }
+
+
+async def estimate_test_duration_batch(scenarios: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Evaluate many estimate scenarios, yielding one result per scenario in input order
+    
+    Frequentist scenarios are evaluated together with NumPy. Bayesian sample sizes
+    only depend on the baseline rate, the effect, the confidence, the prior and the
+    engine: identical sub-problems are computed once and reused, whatever their
+    traffic allocation or number of variations.
+    
+    Args:
+        scenarios: List of parameter dictionaries (same keys as estimate_test_duration)
+        
+    Yields:
+        Dictionary with index, the swept parameters and either the estimate or an error
+    """
+    feasible = []
+    for index, params in enumerate(scenarios):
+        baseline_rate = params["daily_conversions"] / params["daily_visits"]
+        mde_absolute = baseline_rate * params["expected_improvement"]
+        feasible.append(0 < mde_absolute < 1 - baseline_rate)
+    
+    frequentist_results = _frequentist_batch(
+        scenarios,
+        [i for i, params in enumerate(scenarios) if feasible[i] and params["statistical_method"] == "frequentist"]
+    )
+    logger.info(f"Batch estimate: {len(scenarios)} scenarios, {len(frequentist_results)} frequentist")
+    
+    bayesian_sample_sizes: Dict[Tuple, int] = {}
+    for index, params in enumerate(scenarios):
+        row = _batch_row(params, index)
+        if not feasible[index]:
+            row["error"] = "L'amélioration attendue doit être positive et rester sous la limite possible (< 1)"
+            yield row
+            continue
+        
+        if index in frequentist_results:
+            row.update(frequentist_results[index])
+            yield row
+            continue
+        
+        baseline_rate = params["daily_conversions"] / params["daily_visits"]
+        engine = params.get("engine") or DEFAULT_BAYESIAN_ENGINE
+        search = params.get("search") or "bisection"
+        key = (
+            baseline_rate, params["expected_improvement"], params["confidence"],
+            params["prior_alpha"], params["prior_beta"], params["test_type"], engine, search,
+            params.get("seed")
+        )
+        try:
+            if key not in bayesian_sample_sizes:
+                bayesian_sample_sizes[key], _ = await bayesian_sample_size(*key)
+        except Exception as e:
+            logger.error(f"Error in batch scenario {index}: {str(e)}")
+            row["error"] = str(e)
+            yield row
+            continue
+        
+        sample_size_per_variation = bayesian_sample_sizes[key]
+        total_sample = sample_size_per_variation * params["variations"]
+        row.update({
+            "sample_size_per_variation": sample_size_per_variation,
+            "total_sample": total_sample,
+            "estimated_days": math.ceil(total_sample / (params["daily_visits"] * params["traffic_allocation"]))
+        })
+        yield row
+    
+    logger.info(f"Batch estimate done: {len(bayesian_sample_sizes)} distinct Bayesian sub-problems")
@@ -0,0 +1,165 @@
+"""
+Pool de processus pour les calculs statistiques lourds.
+Exécute les simulations hors de la boucle d'événements pour ne pas bloquer les autres requêtes.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+class PoolSaturatedError(Exception):
+    """Levée quand le pool et sa file d'attente sont pleins"""
+
+
+class PoolTimeoutError(Exception):
+    """Levée quand un calcul dépasse le délai maximal autorisé"""
+
+
+class CalculationPool:
+    """
+    Pool de processus borné pour les calculs CPU.
+
+    Le nombre de calculs acceptés (en cours + en attente) est limité à
+    max_workers + max_queue ; au-delà les appels sont rejetés immédiatement.
+    Un calcul qui dépasse son délai continue d'occuper sa place jusqu'à sa fin
+    réelle, afin que la contre-pression reflète la charge effective des workers.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, job_timeout: float):
+        """
+        Args:
+            max_workers (int): Nombre de processus (0 pour exécuter dans la boucle)
+            max_queue (int): Nombre de calculs pouvant attendre un worker libre
+            job_timeout (float): Délai maximal d'attente d'un calcul en secondes
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "peak_in_flight": 0,
+            "compute_time": 0.0  # en secondes
+        }
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.max_workers) + self.max_queue
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # "spawn" évite de dupliquer l'état de la boucle et des threads du serveur
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Calculation pool started with {self.max_workers} workers")
+        return self._executor
+
+    def _release(self, started_at: float, future: Future):
+        self._in_flight -= 1
+        if future.cancelled():
+            return
+        self.stats["compute_time"] += time.perf_counter() - started_at
+        if future.exception() is not None:
+            self.stats["failed"] += 1
+        else:
+            self.stats["completed"] += 1
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop, started_at: float, future: Future):
+        # Appelé depuis le thread de gestion du pool
+        try:
+            loop.call_soon_threadsafe(self._release, started_at, future)
+        except RuntimeError:
+            # Boucle déjà fermée (calcul abandonné après un timeout)
+            self._release(started_at, future)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Exécute fn(*args, **kwargs) dans le pool et attend son résultat.
+
+        Raises:
+            PoolSaturatedError: si la capacité du pool est atteinte
+            PoolTimeoutError: si le calcul dépasse job_timeout
+        """
+        if self._in_flight >= self.capacity:
+            self.stats["rejected"] += 1
+            raise PoolSaturatedError(f"Calculation pool saturated ({self._in_flight} jobs in flight)")
+
+        self.stats["submitted"] += 1
+
+        if self.max_workers <= 0:
+            # Pool désactivé: calcul direct dans la boucle d'événements
+            started_at = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                self.stats["completed"] += 1
+                return result
+            except Exception:
+                self.stats["failed"] += 1
+                raise
+            finally:
+                self.stats["compute_time"] += time.perf_counter() - started_at
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # Un worker est mort: on recrée le pool pour les prochains appels
+            logger.error("Calculation pool broken, restarting it")
+            self._executor = None
+            future = self._get_executor().submit(partial(fn, *args, **kwargs))
+
+        self._in_flight += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self._in_flight)
+        started_at = time.perf_counter()
+        future.add_done_callback(partial(self._on_done, loop, started_at))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise PoolTimeoutError(f"Calculation exceeded {self.job_timeout}s")
+
+    def shutdown(self):
+        """Arrête les workers sans attendre les calculs en attente"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Calculation pool stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retourne les statistiques d'utilisation du pool"""
+        finished = self.stats["completed"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "compute_time": round(self.stats["compute_time"], 4),
+            "average_compute_time": round(self.stats["compute_time"] / finished, 4) if finished else 0,
+            "in_flight": self._in_flight,
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "capacity": self.capacity,
+            "job_timeout": self.job_timeout,
+            "running": self._executor is not None
+        }
+
+
+calculation_pool = CalculationPool(
+    max_workers=settings.ESTIMATE_POOL_WORKERS,
+    max_queue=settings.ESTIMATE_POOL_MAX_QUEUE,
+    job_timeout=settings.ESTIMATE_JOB_TIMEOUT
+)
@@ -0,0 +1,248 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.services.abtasty_mirror import ABTastyMirror, FetchResult
+
+
+def make_mirror(tmp_path) -> ABTastyMirror:
+    return ABTastyMirror(str(tmp_path / "mirror.sqlite3"), ttl=60, max_stale=3600)
+
+
+def expire(mirror: ABTastyMirror, age: float):
+    with mirror._db_lock:
+        mirror._db.execute("UPDATE responses SET fetched_at = ?", (time.time() - age,))
+
+
+def test_abtasty_mirror_evicts_revoked_entries(tmp_path):
+    """A 401/403/404 during revalidation deletes the stored response instead of serving it"""
+    mirror = make_mirror(tmp_path)
+    
+    async def ok(etag, last_modified):
+        return FetchResult(200, {"id": 1}, '"v1"')
+    
+    async def not_found(etag, last_modified):
+        raise HTTPException(status_code=404, detail="deleted")
+    
+    async def scenario():
+        await mirror.get("test:1", ok)
+        expire(mirror, 120)
+        with pytest.raises(HTTPException):
+            await mirror.get("test:1", not_found, background=False)
+    
+    asyncio.run(scenario())
+    assert mirror.read("test:1") is None
+    assert mirror.get_stats()["evictions"] == 1
+    mirror.close()
+
+
+def test_abtasty_mirror_serves_stale_only_for_transient_errors(tmp_path):
+    """5xx and network errors serve the stored response within max_stale, other errors are raised"""
+    mirror = make_mirror(tmp_path)
+    
+    async def ok(etag, last_modified):
+        return FetchResult(200, {"id": 1})
+    
+    async def unavailable(etag, last_modified):
+        raise HTTPException(status_code=503, detail="down")
+    
+    async def bad_request(etag, last_modified):
+        raise HTTPException(status_code=400, detail="bad")
+    
+    async def scenario():
+        await mirror.get("test:1", ok)
+        expire(mirror, 120)
+        stale = await mirror.get("test:1", unavailable, background=False)
+        with pytest.raises(HTTPException):
+            await mirror.get("test:1", bad_request, background=False)
+        # Au-delà de ttl + max_stale, la réponse stockée n'est plus servie
+        expire(mirror, 60 + 3600 + 1)
+        with pytest.raises(HTTPException):
+            await mirror.get("test:1", unavailable)
+        return stale
+    
+    assert asyncio.run(scenario()) == {"id": 1}
+    assert mirror.read("test:1") is not None
+    mirror.close()
+
+
+def test_token_cache_without_redis_never_publishes_tokens(monkeypatch):
+    """With OAUTH_TOKEN_REDIS off, the refresh single-flight stays local even when Redis is configured"""
+    from app.core import single_flight
+    from app.core.token_cache import TokenCache
+    
+    class RecordingRedis:
+        calls = []
+        
+        def __getattr__(self, name):
+            RecordingRedis.calls.append(name)
+            raise AssertionError(f"Redis {name} called")
+    
+    monkeypatch.setattr(single_flight, "redis_async", RecordingRedis())
+    cache = TokenCache("abtasty-local-test", use_redis=False)
+    
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "secret-token", 3600
+    
+    async def scenario():
+        return await asyncio.gather(*(cache.get("id", "secret", fetch) for _ in range(3)))
+    
+    assert asyncio.run(scenario()) == ["secret-token"] * 3
+    assert RecordingRedis.calls == []
+    assert cache.stats["refreshes"] == 1
+
+
+def test_token_cache_keeps_tokens_obtained_by_another_worker(monkeypatch):
+    """A token received from another worker's refresh is cached in memory for the next calls"""
+    from app.core.token_cache import TokenCache
+    
+    cache = TokenCache("abtasty-remote-test", use_redis=False)
+    
+    async def remote_flight(key, fn, **kwargs):
+        # Résultat publié par le worker qui détient le verrou: fn() n'est pas exécutée ici
+        return ["remote-token", time.time() + 3600]
+    
+    async def fetch():
+        raise AssertionError("the token should come from the other worker, then from memory")
+    
+    monkeypatch.setattr(cache._flight, "do", remote_flight)
+    
+    async def scenario():
+        return [await cache.get("id", "secret", fetch) for _ in range(2)]
+    
+    assert asyncio.run(scenario()) == ["remote-token", "remote-token"]
+    assert cache.stats["hits"] == 1
+    assert cache.get_stats()["cached_tokens"] == 1
+
+
+def test_abtasty_token_cache_single_flight_and_retry(monkeypatch):
+    """Concurrent AB Tasty calls share one OAuth request; a rejected cached token is renewed once"""
+    from app.api import abtasty
+    from app.core.http_clients import http_clients
+    from app.core.token_cache import TokenCache
+    
+    issued = []
+    
+    async def handler(request):
+        if request.url.path == "/oauth/v2/token":
+            await asyncio.sleep(0.01)
+            issued.append(f"token-{len(issued)}")
+            return httpx.Response(200, json={"access_token": issued[-1], "expires_in": 3600})
+        # Le premier token est révoqué côté AB Tasty
+        if request.headers["Authorization"] == "Bearer token-0":
+            return httpx.Response(401, json={"error": "invalid_token"})
+        return httpx.Response(200, json={"_embedded": {"items": [{"id": 1}]}})
+    
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda provider: mock_client)
+    monkeypatch.setattr(abtasty, "token_cache", TokenCache("abtasty-test", use_redis=False))
+    
+    async def scenario():
+        tokens = await asyncio.gather(*(abtasty.get_auth_token("id", "secret") for _ in range(5)))
+        data = await abtasty.list_tests("id", "secret", "42")
+        again = await abtasty.get_auth_token("id", "secret")
+        return tokens, data, again
+    
+    tokens, data, again = asyncio.run(scenario())
+    assert tokens == ["token-0"] * 5
+    assert data["_embedded"]["items"] == [{"id": 1}]
+    assert again == "token-1" and issued == ["token-0", "token-1"]
+    stats = abtasty.token_cache.get_stats()
+    assert stats["refreshes"] == 2 and stats["invalidations"] == 1
+    assert stats["single_flight"]["coalesced"] == 4
+
+
+def test_abtasty_snapshot_paginates_and_fans_out(monkeypatch):
+    """The snapshot follows pagination and fetches details and variations concurrently under the semaphore"""
+    from app.api import abtasty
+    from app.core.config import settings
+    from app.core.http_clients import http_clients
+    from app.core.token_cache import TokenCache
+    
+    active, peak, requests_seen = 0, 0, []
+    
+    async def handler(request):
+        nonlocal active, peak
+        path = request.url.path
+        requests_seen.append(path)
+        if path == "/oauth/v2/token":
+            return httpx.Response(200, json={"access_token": "token", "expires_in": 3600})
+        if path.endswith("/tests"):
+            page = int(request.url.params["_page"])
+            ids = [1, 2] if page == 1 else [3]
+            return httpx.Response(200, json={"_embedded": {"items": [{"id": i} for i in ids]}})
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if path.endswith("/tests/3"):
+            return httpx.Response(404, text="not found")
+        return httpx.Response(200, json={"path": path})
+    
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda provider: mock_client)
+    monkeypatch.setattr(abtasty, "token_cache", TokenCache("abtasty-snapshot-test", use_redis=False))
+    monkeypatch.setattr(settings, "ABTASTY_SNAPSHOT_CONCURRENCY", 3)
+    
+    snapshot = asyncio.run(abtasty.tests_snapshot("id", "secret", "42", per_page=2))
+    
+    assert [test["id"] for test in snapshot["tests"]] == [1, 2, 3]
+    assert snapshot["tests"][0]["variations"] == {"path": "/api/core/accounts/42/tests/1/variations"}
+    assert snapshot["errors"] == 1 and snapshot["tests"][2]["errors"]["details"].startswith("404")
+    assert snapshot["tests"][2]["variations"] is not None
+    assert requests_seen.count("/oauth/v2/token") == 1
+    assert 1 < peak <= 3
+
+
+def test_abtasty_mirror_serves_locally_and_revalidates(monkeypatch, tmp_path):
+    """Mirrored responses are served locally, revalidated with If-None-Match, and skipped while the test version is unchanged"""
+    from app.api import abtasty
+    from app.core.config import settings
+    from app.core.http_clients import http_clients
+    from app.core.token_cache import TokenCache
+    from app.services.abtasty_mirror import ABTastyMirror
+    
+    conditional = []
+    
+    async def handler(request):
+        if request.url.path == "/oauth/v2/token":
+            return httpx.Response(200, json={"access_token": "token", "expires_in": 3600})
+        conditional.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"path": request.url.path}, headers={"ETag": '"v1"'})
+    
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda provider: mock_client)
+    monkeypatch.setattr(abtasty, "token_cache", TokenCache("abtasty-mirror-test", use_redis=False))
+    mirror = ABTastyMirror(str(tmp_path / "mirror.sqlite3"), ttl=60, max_stale=3600)
+    monkeypatch.setattr(abtasty, "abtasty_mirror", mirror)
+    monkeypatch.setattr(settings, "ABTASTY_MIRROR_ENABLED", True)
+    
+    async def scenario():
+        first = await abtasty.test_details("7", "id", "secret", "42")
+        second = await abtasty.test_details("7", "id", "secret", "42")
+        # Entrée expirée: servie immédiatement, revalidée en arrière-plan (304)
+        mirror._db.execute("UPDATE responses SET fetched_at = ?", (time.time() - 120,))
+        stale = await abtasty.test_details("7", "id", "secret", "42")
+        await asyncio.sleep(0.05)
+        # Version inchangée: aucune requête même si l'entrée est expirée
+        url = abtasty.test_details_url.format(account_id="42", test_id="8")
+        await abtasty.fetch_json(url, {}, "id", "secret", version="2024-01-01")
+        mirror._db.execute("UPDATE responses SET fetched_at = ?", (time.time() - 120,))
+        unchanged = await abtasty.fetch_json(url, {}, "id", "secret", version="2024-01-01")
+        return first, second, stale, unchanged
+    
+    first, second, stale, unchanged = asyncio.run(scenario())
+    
+    assert first == second == stale == {"path": "/api/v1/accounts/42/tests/7"}
+    assert unchanged == {"path": "/api/v1/accounts/42/tests/8"}
+    assert conditional == [None, '"v1"', None]
+    stats = mirror.get_stats()
+    assert stats["hits"] == 1 and stats["stale_hits"] == 1 and stats["unchanged"] == 1
+    assert stats["not_modified"] == 1 and stats["size"] == 2
+    mirror.close()
@@ -1,7 +1,12 @@
 import pytest
+import json
+import asyncio
+import time
+import numpy as np
 from fastapi.testclient import TestClient
 from app.main import app
-from app.services.statistics import FrequentistCalculator, BayesianCalculator
+from app.services.statistics import FrequentistCalculator, BayesianCalculator, ENGINE_RELATIVE_TOLERANCE
+from app.services.worker_pool import CalculationPool, PoolSaturatedError, PoolTimeoutError
 
 client = TestClient(app)
 
@@ -156,17 +161,341 @@ def test_bayesian_simulation():
     prior_beta = 0.5
     simulation_count = 1000
     
-    prob = BayesianCalculator._simulate_test(
+    prob, draws = BayesianCalculator._simulate_test(
         p_a=p_a,
         p_b=p_b,
         n=n,
         prior_alpha=prior_alpha,
         prior_beta=prior_beta,
-        simulation_count=simulation_count
+        simulation_count=simulation_count,
+        rng=np.random.default_rng(0)
     )
     
     # Probability should be between 0 and 1
     assert 0 <= prob <= 1
     
     # With a 2% lift and 1000 samples, probability should be reasonably high
-    assert prob > 0.5 
\ No newline at end of file
+    assert prob > 0.5 
+    assert draws == simulation_count
+
+
+def test_bayesian_simulation_stops_early_far_from_the_boundary():
+    """A settled decision stops the simulation early; an undecided one uses every draw"""
+    decision = (0.95, "two-sided")
+    _, settled = BayesianCalculator._simulate_test(0.1, 0.2, 5000, 0.5, 0.5, 40000, np.random.default_rng(1), decision=decision)
+    _, full = BayesianCalculator._simulate_test(0.1, 0.2, 5000, 0.5, 0.5, 40000, np.random.default_rng(1))
+    assert settled < 40000 // 4
+    assert full == 40000
+    
+    # La bissection entière tire moins d'expériences pour la même taille
+    adaptive = BayesianCalculator.calculate_sample_size_with_draws(0.1, 0.02, 0.95, 0.5, 0.5, "two-sided", engine="montecarlo", seed=3)
+    exhaustive = BayesianCalculator.calculate_sample_size_with_draws(
+        0.1, 0.02, 0.95, 0.5, 0.5, "two-sided", engine="montecarlo", seed=3, adaptive=False
+    )
+    assert adaptive[1] < exhaustive[1]
+    assert abs(adaptive[0] - exhaustive[0]) / exhaustive[0] <= ENGINE_RELATIVE_TOLERANCE
+
+
+def test_estimate_reports_simulation_draws_for_montecarlo(bayesian_request):
+    """/estimate returns simulation_draws for the montecarlo engine only"""
+    request = {**bayesian_request, "expected_improvement": 0.2, "engine": "montecarlo", "seed": 5}
+    response = client.post("/estimate", json=request)
+    assert response.status_code == 200
+    assert 0 < response.json()["simulation_draws"]
+    
+    assert "simulation_draws" not in client.post("/estimate", json={**request, "engine": "gauss_legendre"}).json()
+
+@pytest.mark.parametrize("baseline_rate,mde,confidence,test_type", [
+    (0.1, 0.01, 0.95, "two-sided"),
+    (0.05, 0.01, 0.9, "one-sided"),
+    (0.01, 0.01, 0.95, "one-sided"),
+])
+def test_bayesian_engines_tolerance(baseline_rate, mde, confidence, test_type):
+    """Deterministic engines must match the Monte Carlo reference within the tolerance contract"""
+    reference = BayesianCalculator.calculate_sample_size(
+        baseline_rate, mde, confidence, 0.5, 0.5, test_type, engine="montecarlo", seed=42
+    )
+    
+    for engine in ["gauss_legendre", "quadrature"]:
+        sample_size = BayesianCalculator.calculate_sample_size(
+            baseline_rate, mde, confidence, 0.5, 0.5, test_type, engine=engine
+        )
+        assert abs(sample_size - reference) / reference <= ENGINE_RELATIVE_TOLERANCE
+
+
+def test_montecarlo_seed_is_reproducible():
+    """A seeded Monte Carlo run is reproducible, sequentially or in worker threads"""
+    def simulate(seed, parallel):
+        return BayesianCalculator._simulate_test(0.1, 0.11, 5000, 0.5, 0.5, 40000, np.random.default_rng(seed), parallel)[0]
+    
+    assert simulate(3, False) == simulate(3, True) == simulate(3, False)
+    assert simulate(3, False) != simulate(4, False)
+    
+    sizes = [
+        BayesianCalculator.calculate_sample_size(0.1, 0.02, 0.95, 0.5, 0.5, "two-sided", engine="montecarlo", seed=11)
+        for _ in range(2)
+    ]
+    assert sizes[0] == sizes[1]
+
+
+def test_bayesian_deterministic_engine_is_stable(bayesian_request):
+    """The default engine returns the same answer on every call"""
+    first = client.post("/estimate", json=bayesian_request).json()
+    second = client.post("/estimate", json=bayesian_request).json()
+    assert first == second
+    
+    reference = client.post("/estimate", json={**bayesian_request, "engine": "gauss_legendre"}).json()
+    assert abs(reference["sample_size_per_variation"] - first["sample_size_per_variation"]) <= 0.01 * reference["sample_size_per_variation"]
+    # Ancien nom du moteur, toujours accepté
+    assert client.post("/estimate", json={**bayesian_request, "engine": "exact"}).json() == reference
+
+
+def test_bayesian_grid_search():
+    """The vectorized grid search agrees with the deterministic engines"""
+    grid_size = BayesianCalculator.calculate_sample_size(
+        0.1, 0.01, 0.95, 0.5, 0.5, "two-sided", engine="montecarlo", search="grid", seed=7
+    )
+    reference = BayesianCalculator.calculate_sample_size(0.1, 0.01, 0.95, 0.5, 0.5, "two-sided", engine="gauss_legendre")
+    assert abs(grid_size - reference) / reference <= ENGINE_RELATIVE_TOLERANCE
+    
+    # Les tailles d'une même grille partagent leurs tirages: la courbe croît avec n
+    sizes = np.array([1000, 2000, 4000, 8000, 16000])
+    probs = BayesianCalculator._simulate_grid(0.1, 0.11, sizes, 0.5, 0.5, 20000, np.random.default_rng(7))
+    assert np.all(np.diff(probs) > 0)
+
+
+def test_bayesian_grid_search_survives_noisy_lower_extension(monkeypatch):
+    """A re-evaluated lower grid that no longer reaches the threshold keeps the previous crossing"""
+    grids = []
+    
+    def noisy_grid(p_a, p_b, sizes, prior_alpha, prior_beta, simulation_count, rng):
+        grids.append(sizes)
+        # Première passe entièrement confiante, seconde passe entièrement sous le seuil
+        return np.full(len(sizes), 0.99 if len(grids) == 1 else 0.9)
+    
+    monkeypatch.setattr(BayesianCalculator, "_simulate_grid", staticmethod(noisy_grid))
+    sample_size, draws = BayesianCalculator.calculate_sample_size_with_draws(
+        0.1, 0.01, 0.95, 0.5, 0.5, "two-sided", engine="montecarlo", search="grid", seed=1
+    )
+    assert len(grids) == 2
+    assert sample_size == grids[0][0] == grids[1][-1]
+    assert draws == 2 * 50000
+
+def test_calculation_pool_backpressure():
+    """Jobs beyond capacity are rejected and slow jobs time out"""
+    pool = CalculationPool(max_workers=1, max_queue=0, job_timeout=0.5)
+    
+    async def scenario():
+        results = await asyncio.gather(
+            pool.run(time.sleep, 1),
+            pool.run(time.sleep, 1),
+            return_exceptions=True
+        )
+        return results
+    
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    
+    assert any(isinstance(result, PoolSaturatedError) for result in results)
+    assert any(isinstance(result, PoolTimeoutError) for result in results)
+    stats = pool.get_stats()
+    assert stats["rejected"] == 1
+    assert stats["timed_out"] == 1
+
+
+def test_pool_stats_endpoint():
+    response = client.get("/hypothesis/pool-stats")
+    assert response.status_code == 200
+    assert "in_flight" in response.json()
+
+
+def test_estimate_cache_reuse(frequentist_request):
+    """Identical requests reuse the cached estimate"""
+    request = {**frequentist_request, "daily_visits": 1234, "traffic_allocation": 0.3}
+    before = client.get("/estimate/cache-stats").json()
+    
+    first = client.post("/estimate", json=request)
+    # Même requête à une imprécision flottante près
+    second = client.post("/estimate", json={**request, "traffic_allocation": 0.1 * 3})
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    
+    after = client.get("/estimate/cache-stats").json()
+    assert after["misses"] - before["misses"] == 1
+    assert after["total_hits"] - before["total_hits"] == 1
+
+
+def test_estimate_cache_degrades_to_memory_when_redis_fails(frequentist_request, monkeypatch):
+    """A failing Redis opens the circuit instead of blocking every estimate"""
+    from app.core import estimate_cache
+    from app.core.circuit_breaker import CircuitBreaker
+    
+    class FailingRedis:
+        calls = 0
+        
+        async def get(self, key):
+            FailingRedis.calls += 1
+            raise TimeoutError("Timeout reading from socket")
+        
+        async def setex(self, key, ttl, value):
+            FailingRedis.calls += 1
+            raise TimeoutError("Timeout writing to socket")
+    
+    monkeypatch.setattr(estimate_cache, "redis_async", FailingRedis())
+    monkeypatch.setattr(estimate_cache, "redis_breaker", CircuitBreaker("redis", failure_threshold=2, reset_timeout=60))
+    request = {**frequentist_request, "daily_visits": 4321}
+    
+    first = client.post("/estimate", json=request)
+    second = client.post("/estimate", json=request)
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert FailingRedis.calls == 2
+    assert estimate_cache.redis_breaker.get_stats()["state"] == "open"
+
+
+def test_evolution_closed_form(frequentist_request, bayesian_request):
+    """Evolution curves need no full estimate and support any horizon and daily periods"""
+    before = client.get("/estimate/cache-stats").json()
+    weekly = client.post("/estimate/weekly-evolution", json=frequentist_request).json()
+    daily = client.post("/estimate/evolution?granularity=day&horizon=30", json=frequentist_request).json()
+    bayesian = client.post("/estimate/evolution?horizon=26", json=bayesian_request).json()
+    after = client.get("/estimate/cache-stats").json()
+    assert after["total_requests"] == before["total_requests"]
+    
+    estimated_days = client.post("/estimate", json=frequentist_request).json()["estimated_days"]
+    assert len(weekly) == max(8, 2 * -(-estimated_days // 7))
+    assert [point["day"] for point in daily] == list(range(1, 31))
+    assert len(bayesian) == 26
+    assert daily[6]["mde_relative"] == weekly[0]["mde_relative"]
+    assert all(a["mde_relative"] > b["mde_relative"] for a, b in zip(daily, daily[1:]))
+
+
+def test_evolution_default_horizon_is_capped(frequentist_request):
+    """A test lasting millions of days does not produce millions of default periods"""
+    from app.services.evolution import MAX_EVOLUTION_PERIODS
+    
+    request = {**frequentist_request, "daily_visits": 100, "daily_conversions": 10, "expected_improvement": 0.001}
+    assert client.post("/estimate", json=request).json()["estimated_days"] > MAX_EVOLUTION_PERIODS
+    daily = client.post("/estimate/evolution?granularity=day", json=request).json()
+    assert len(daily) == MAX_EVOLUTION_PERIODS
+
+
+def test_bayesian_evolution_runs_in_the_pool(bayesian_request, monkeypatch):
+    """The incremental Bayesian curve is computed in the calculation pool and rejected with 503 when it is full"""
+    pool = CalculationPool(max_workers=1, max_queue=0, job_timeout=30)
+    pool._in_flight = pool.capacity
+    monkeypatch.setattr("app.routers.estimate.calculation_pool", pool)
+    
+    response = client.post("/estimate/evolution?horizon=4", json=bayesian_request)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    approximate = client.post("/estimate/evolution?horizon=4&bayesian_mode=approximate", json=bayesian_request)
+    assert approximate.status_code == 200
+    assert pool.get_stats()["rejected"] == 1
+
+
+def test_bayesian_evolution_is_deterministic_without_seed(bayesian_request):
+    """An unseeded Bayesian curve only depends on the request parameters"""
+    from app.services.evolution import calculate_mde_evolution
+    
+    first = calculate_mde_evolution(bayesian_request, horizon=6)
+    assert calculate_mde_evolution(dict(bayesian_request), horizon=6) == first
+    # Même requête à une imprécision flottante près
+    assert calculate_mde_evolution({**bayesian_request, "confidence": 0.95 + 1e-12}, horizon=6) == first
+    seeded = calculate_mde_evolution({**bayesian_request, "seed": 1}, horizon=6)
+    assert calculate_mde_evolution({**bayesian_request, "seed": 1}, horizon=6) == seeded
+
+
+def test_bayesian_lift_curve_matches_estimates():
+    """Each horizon of the incremental curve is the sample size needed for its lift"""
+    sizes = np.array([2000, 5000, 20000, 80000])
+    lifts = BayesianCalculator.detectable_lift_curve(0.1, sizes, 0.95, 0.5, 0.5, rng=np.random.default_rng(7))
+    assert np.all(np.diff(lifts) < 0)
+    for size, lift in zip(sizes, lifts):
+        n = BayesianCalculator.calculate_sample_size(0.1, lift, 0.95, 0.5, 0.5, "two-sided")
+        assert abs(n / size - 1) <= ENGINE_RELATIVE_TOLERANCE
+
+
+def test_bayesian_lift_curve_terminates_near_half_confidence():
+    """Simulation noise just above confidence=0.5 yields a zero lift instead of halving forever"""
+    sizes = np.array([100, 1000, 10000])
+    for confidence in (0.5005, 0.501, 0.505):
+        lifts = BayesianCalculator.detectable_lift_curve(
+            0.05, sizes, confidence, 0.5, 0.5, simulation_count=200, rng=np.random.default_rng(3)
+        )
+        assert np.all(np.isfinite(lifts)) and np.all(lifts >= 0)
+
+
+def test_estimate_rejects_confidence_outside_half_open_interval():
+    """Bayesian confidence must lie in ]0.5, 1["""
+    for confidence in (0.5, 1.0):
+        request = {
+            "daily_visits": 1000, "daily_conversions": 100, "traffic_allocation": 0.5,
+            "expected_improvement": 0.05, "variations": 2, "confidence": confidence,
+            "statistical_method": "bayesian", "test_type": "two-sided", "prior_alpha": 0.5, "prior_beta": 0.5
+        }
+        assert client.post("/estimate/evolution", json=request).status_code == 422
+
+
+def test_frequentist_confidence_is_not_restricted_to_bayesian_interval(frequentist_request):
+    """The ]0.5, 1[ Bayesian bound does not apply to frequentist requests"""
+    response = client.post("/estimate", json={**frequentist_request, "confidence": 0.5})
+    assert response.status_code == 200
+    assert response.json()["sample_size_per_variation"] > 0
+
+
+def test_lookup_tables_interpolation(tmp_path):
+    """Interpolated sample sizes stay within the table error bound of live computation"""
+    from app.services.lookup_tables import SampleSizeTables, build_tables, LOOKUP_MAX_RELATIVE_ERROR
+    build_tables(
+        str(tmp_path),
+        baselines=np.geomspace(0.05, 0.2, 8),
+        improvements=np.geomspace(0.05, 0.2, 8),
+        confidences=[0.95],
+        priors=[(0.5, 0.5)]
+    )
+    tables = SampleSizeTables(str(tmp_path))
+    assert tables.load()
+    
+    expected = BayesianCalculator.calculate_sample_size(0.1, 0.1 * 0.1, 0.95, 0.5, 0.5, "two-sided")
+    interpolated = tables.bayesian_sample_size(0.1, 0.1, 0.95, 0.5, 0.5)
+    assert interpolated is not None
+    assert abs(interpolated / expected - 1) <= 2 * LOOKUP_MAX_RELATIVE_ERROR
+    
+    # Hors de la grille: l'appelant retombe sur le calcul direct
+    assert tables.bayesian_sample_size(0.01, 0.1, 0.95, 0.5, 0.5) is None
+    assert tables.bayesian_sample_size(0.1, 0.1, 0.95, 2.0, 2.0) is None
+
+
+def test_estimate_batch(frequentist_request, bayesian_request):
+    """Batch results match /estimate, line by line and in order"""
+    grid = {
+        "base": frequentist_request,
+        "traffic_allocations": [0.25, 1.0],
+        "expected_improvements": [0.02, 0.1],
+        "variations": [2, 3]
+    }
+    response = client.post("/estimate/batch", json={"grid": grid})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["index"] for line in lines] == list(range(8))
+    
+    for line in lines:
+        single = client.post("/estimate", json={
+            **frequentist_request,
+            "traffic_allocation": line["traffic_allocation"],
+            "expected_improvement": line["expected_improvement"],
+            "variations": line["variations"]
+        }).json()
+        assert {key: line[key] for key in single} == single
+    
+    requests = [bayesian_request, {**bayesian_request, "variations": 3}, {**frequentist_request, "expected_improvement": 0}]
+    lines = [json.loads(line) for line in client.post("/estimate/batch", json={"requests": requests}).text.splitlines()]
+    assert lines[0]["sample_size_per_variation"] == lines[1]["sample_size_per_variation"]
+    assert lines[1]["total_sample"] == 3 * lines[1]["sample_size_per_variation"]
+    assert "error" in lines[2]
+    
+    assert client.post("/estimate/batch", json={}).status_code == 422
@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.main import app
+from app.services.base_external_service import ExternalService
+
+client = TestClient(app)
+
+
+def mock_upstream(monkeypatch, handler):
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda provider: mock_client)
+    monkeypatch.setattr(settings, "EXTERNAL_RETRY_BASE_DELAY", 0.001)
+
+
+def test_post_read_timeout_is_not_replayed(monkeypatch):
+    """A billed generation that timed out while reading is never sent again"""
+    calls = []
+    
+    def handler(request):
+        calls.append(request.method)
+        raise httpx.ReadTimeout("stalled", request=request)
+    
+    mock_upstream(monkeypatch, handler)
+    service = ExternalService("post-timeout-test", retries=2)
+    
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(service.request("POST", "https://llm.test/generate", json={}))
+    assert calls == ["POST"]
+
+
+def test_post_is_replayed_only_when_refused(monkeypatch):
+    """Connection failures, 429 and 503 are retried for POST; 500 is not"""
+    attempts = {}
+    
+    def handler(request):
+        path = request.url.path
+        attempts[path] = attempts.get(path, 0) + 1
+        if attempts[path] == 1:
+            if path == "/connect":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response({"/busy": 503, "/limited": 429, "/failed": 500}[path])
+        return httpx.Response(200)
+    
+    mock_upstream(monkeypatch, handler)
+    service = ExternalService("post-refused-test", retries=2)
+    
+    async def scenario():
+        return [
+            (await service.request("POST", f"https://llm.test{path}", json={})).status_code
+            for path in ("/connect", "/busy", "/limited", "/failed")
+        ]
+    
+    assert asyncio.run(scenario()) == [200, 200, 200, 500]
+    assert attempts == {"/connect": 2, "/busy": 2, "/limited": 2, "/failed": 1}
+
+
+def test_http_clients_reuse_connections():
+    """Successive calls through the shared client reuse one keep-alive connection"""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from app.core.http_clients import HTTPClientRegistry
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    registry = HTTPClientRegistry()
+    
+    async def scenario():
+        assert registry.get("deepseek") is registry.get("deepseek")
+        for _ in range(5):
+            response = await registry.get("deepseek").post(f"http://127.0.0.1:{server.server_port}/", json={})
+            assert response.status_code == 200
+        await registry.aclose()
+    
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.shutdown()
+    
+    stats = registry.get_stats()["providers"]["deepseek"]
+    assert stats["requests"] == 5
+    assert stats["new_connections"] == 1
+    assert stats["handshakes_saved"] == 4
+    assert stats["open"] is False
+    
+    response = client.get("/hypothesis/http-stats")
+    assert response.status_code == 200
+    assert "providers" in response.json()
+
+
+def test_external_service_retries_hedges_and_breaks(monkeypatch):
+    """Idempotent calls are retried on 503, slow calls are hedged, and repeated failures open the circuit"""
+    from app.core.circuit_breaker import CircuitOpenError
+    
+    calls = []
+    
+    async def handler(request):
+        path = request.url.path
+        calls.append(path)
+        if path == "/flaky" and calls.count(path) == 1:
+            return httpx.Response(503)
+        if path == "/slow" and calls.count(path) == 1:
+            await asyncio.sleep(0.5)
+        if path == "/down":
+            return httpx.Response(502)
+        return httpx.Response(200, json={"attempt": calls.count(path)})
+    
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda provider: mock_client)
+    monkeypatch.setattr(settings, "EXTERNAL_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(settings, "EXTERNAL_BREAKER_FAILURES", 3)
+    service = ExternalService("external-test", retries=2, hedge_delay=0.05)
+    
+    async def scenario():
+        flaky = await service.request("GET", "https://upstream.test/flaky")
+        slow = await service.request("GET", "https://upstream.test/slow")
+        post = await service.request("POST", "https://upstream.test/down")
+        down = await service.request("GET", "https://upstream.test/down")
+        with pytest.raises(CircuitOpenError):
+            await service.request("GET", "https://upstream.test/flaky")
+        return flaky, slow, post, down
+    
+    flaky, slow, post, down = asyncio.run(scenario())
+    
+    assert flaky.json() == {"attempt": 2}
+    assert slow.json() == {"attempt": 2}
+    # POST non idempotent: pas de nouvelle tentative; le GET épuise le seuil du disjoncteur
+    assert post.status_code == 502 and down.status_code == 502
+    assert calls.count("/down") == 3
+    assert service.get_stats()["circuit"]["state"] == "open"
+
+
+def test_half_open_probe_is_released_on_local_errors(monkeypatch):
+    """A probe that fails without reaching the upstream does not keep the circuit half-open forever"""
+    fail = {"value": True}
+    
+    def handler(request):
+        if fail["value"]:
+            raise ValueError("event hook failure")
+        return httpx.Response(200)
+    
+    mock_upstream(monkeypatch, handler)
+    service = ExternalService("half-open-test", retries=0)
+    
+    async def probe(streamed):
+        service.breaker.state = "open"
+        service.breaker.opened_at = time.monotonic() - service.breaker.reset_timeout - 1
+        fail["value"] = True
+        with pytest.raises(ValueError):
+            if streamed:
+                async with service.stream("GET", "https://upstream.test/stream"):
+                    pass
+            else:
+                await service.request("GET", "https://upstream.test/probe")
+        assert service.breaker.get_stats()["state"] == "half_open"
+        fail["value"] = False
+        return (await service.request("GET", "https://upstream.test/probe")).status_code
+    
+    for streamed in (False, True):
+        assert asyncio.run(probe(streamed)) == 200
+        assert service.breaker.get_stats()["state"] == "closed"
@@ -0,0 +1,392 @@
+import asyncio
+import importlib
+import json
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.rate_limiter import RateLimiter
+
+client = TestClient(app)
+hypothesis_router = importlib.import_module("app.routers.hypothesis.router")
+
+
+def test_coalesced_generate_keeps_each_conversation_id(monkeypatch):
+    """Requests sharing one provider call each get their own conversation_id"""
+    calls = []
+    
+    async def fake_generation(model, messages, conversation_id, detected_language, hf_api_key, deepseek_api_key, settings):
+        calls.append(conversation_id)
+        await asyncio.sleep(0.1)
+        return hypothesis_router.build_hypothesis_response("Quelle page ?", conversation_id, detected_language)
+    
+    monkeypatch.setattr(hypothesis_router, "call_generation_api", fake_generation)
+    monkeypatch.setattr(hypothesis_router, "rate_limiter", RateLimiter(100, 60, name="test"))
+    message = f"Coalescing test {time.time()}"
+    
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.post("/hypothesis/generate", json={
+                    "message": message, "model": "deepseek", "conversation_id": f"conv-{i}",
+                    "api_keys": {"deepseek": "test-key"}
+                })
+                for i in range(3)
+            ))
+    
+    responses = asyncio.run(scenario())
+    
+    assert len(calls) == 1
+    assert [response.json()["conversation_id"] for response in responses] == ["conv-0", "conv-1", "conv-2"]
+
+
+def test_semantic_cache_hashing_matches_variants_not_paraphrases(tmp_path):
+    """Hashing embeddings catch rewritten spellings of a question, not paraphrases nor neighbouring questions"""
+    from app.core.semantic_cache import SemanticCache
+    
+    cache = SemanticCache(str(tmp_path), max_entries=10)
+    cache.add("How can I increase checkout conversion?", "deepseek", "en", {"message": "Which step?"})
+    
+    assert cache.lookup("how can i increase CHECKOUT conversions", "deepseek", "en")["message"] == "Which step?"
+    assert cache.lookup("How do I improve the checkout conversion rate?", "deepseek", "en") is None
+    assert cache.lookup("How can I increase homepage conversion?", "deepseek", "en") is None
+    cache.close()
+
+
+def test_semantic_cache_model_embedder_and_index_reset(tmp_path):
+    """A pluggable embedder is used for lookups, and switching embedders rebuilds the index"""
+    import numpy as np
+    from app.core.semantic_cache import HashingEmbedder, SemanticCache
+    
+    class TopicEmbedder:
+        """Embedder standing in for a paraphrase model: one direction per topic"""
+        name = "model:topics"
+        dim = 2
+        
+        def encode(self, text):
+            return np.array([1.0, 0.0] if "checkout" in text else [0.0, 1.0], dtype=np.float32)
+    
+    cache = SemanticCache(str(tmp_path), max_entries=10, embedder=TopicEmbedder())
+    cache.add("How can I increase checkout conversion?", "deepseek", "en", {"message": "Which step?"})
+    assert cache.lookup("Ways to get more people through checkout", "deepseek", "en")["message"] == "Which step?"
+    assert cache.get_stats()["embedder"] == "model:topics"
+    cache.close()
+    
+    cache = SemanticCache(str(tmp_path), max_entries=10, embedder=HashingEmbedder())
+    cache.load()
+    assert cache.size == 0
+    assert cache.lookup("How can I increase checkout conversion?", "deepseek", "en") is None
+    cache.close()
+
+
+def test_first_message_ranking_expires(monkeypatch):
+    """Raw first messages are ranked in a Redis ZSET whose expiry is refreshed on every write"""
+    from app.core.config import settings
+    from app.routers.hypothesis import cache_warmer as warmer_module
+    
+    commands = []
+    
+    class RecordingPipeline:
+        async def __aenter__(self):
+            return self
+        
+        async def __aexit__(self, *exc):
+            return False
+        
+        def __getattr__(self, name):
+            return lambda *args: commands.append((name, *args))
+        
+        async def execute(self):
+            return [None] * len(commands)
+    
+    class RecordingRedis:
+        def pipeline(self, transaction=True):
+            return RecordingPipeline()
+    
+    monkeypatch.setattr(warmer_module, "redis_async", RecordingRedis())
+    monkeypatch.setattr(settings, "CACHE_WARM_PROMPTS_TTL", 3600)
+    key = warmer_module.POPULAR_PROMPTS_KEY.format(model="deepseek", language="en")
+    
+    asyncio.run(warmer_module.CacheWarmer()._record(key, "How can I raise my conversion rate?"))
+    
+    assert commands[0] == ("zincrby", key, 1, "How can I raise my conversion rate?")
+    assert ("expire", key, 3600) in commands
+
+
+def test_generate_stream_forwards_deltas_and_caches(monkeypatch):
+    """Streamed chunks are forwarded as they arrive and the assembled answer is cached"""
+    calls = []
+    
+    async def fake_stream(messages, api_key, api_url, model_type="deepseek-chat"):
+        calls.append(model_type)
+        for delta in ["Quelle page ", "pose ", "problème ?"]:
+            yield delta
+    
+    monkeypatch.setattr(hypothesis_router, "stream_deepseek_content", fake_stream)
+    payload = {"message": f"Streaming test {time.time()}", "model": "deepseek", "api_keys": {"deepseek": "test-key"}}
+    
+    response = client.post("/hypothesis/generate/stream?format=ndjson", json=payload)
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["content"] for event in events[:-1]] == ["Quelle page ", "pose ", "problème ?"]
+    assert events[-1]["type"] == "final"
+    assert events[-1]["response"]["message"] == "Quelle page pose problème ?"
+    
+    # Deuxième appel: servi depuis le cache, sans nouvel appel au modèle
+    response = client.post("/hypothesis/generate/stream", json=payload)
+    lines = response.text.split("\n\n")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert json.loads(lines[0][len("data: "):])["content"] == "Quelle page pose problème ?"
+    assert lines[-2] == "data: [DONE]"
+    assert calls == ["deepseek-chat"]
+
+
+def test_reasoning_delta_protocol():
+    """Coalesced reasoning deltas rebuild the full text, checked by length and CRC32"""
+    import zlib
+    from app.routers.hypothesis.streaming import ReasoningEncoder
+    
+    deltas = [f"étape {i}, " for i in range(1000)]
+    text = "".join(deltas)
+    
+    encoder = ReasoningEncoder("delta")
+    steps = [step for step in (encoder.add(delta) for delta in deltas) if step]
+    steps.append(encoder.flush(final=True))
+    
+    assert len(steps) < 100
+    assert [step.seq for step in steps] == list(range(1, len(steps) + 1))
+    assert "".join(step.reasoning_delta for step in steps) == text
+    assert all(step.reasoning_content is None for step in steps[:-1])
+    assert steps[-1].reasoning_content == text
+    assert steps[-1].reasoning_length == len(text)
+    assert steps[-1].checksum == f"{zlib.crc32(text.encode('utf-8')):08x}"
+    
+    # Ancien format: texte cumulé à chaque événement
+    encoder = ReasoningEncoder("cumulative")
+    steps = [step for step in [*(encoder.add(delta) for delta in deltas), encoder.flush(final=True)] if step]
+    assert steps[-1].reasoning_content == text
+    assert steps[-1].reasoning_delta is None
+
+
+def test_stream_caches_final_answer(monkeypatch):
+    """The reasoning stream emits the final answer and caches it for /generate"""
+    from app.core.http_clients import http_clients
+    
+    calls = []
+    
+    def handler(request):
+        calls.append(json.loads(request.content))
+        chunks = [{"reasoning_content": "Je dois "}, {"reasoning_content": "réfléchir."}, {"content": "Quelle "}, {"content": "page ?"}]
+        body = "".join(f"data: {json.dumps({'choices': [{'delta': delta}]})}\n\n" for delta in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, content=body.encode())
+    
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda provider: mock_client)
+    message = f"Stream cache test {time.time()}"
+    
+    response = client.get("/hypothesis/stream", params={"message": message, "api_key_deepseek": "test-key"})
+    events = [json.loads(line[len("data: "):]) for line in response.text.split("\n\n") if line.startswith("data: {")]
+    answer = [event for event in events if event["step"] == "answer"]
+    assert len(answer) == 1
+    assert answer[0]["response"]["message"] == "Quelle page ?"
+    assert "".join(event.get("reasoning_delta") or "" for event in events) == "Je dois réfléchir."
+    assert len(calls) == 1 and calls[0]["stream"] is True
+    
+    # L'appel /generate identique est servi par le cache, sans nouvel appel au modèle
+    response = client.post("/hypothesis/generate", json={
+        "message": message, "model": "deepseek-reasoner", "api_keys": {"deepseek": "test-key"}
+    })
+    assert response.status_code == 200
+    assert response.json()["message"] == "Quelle page ?"
+    assert len(calls) == 1
+
+
+def test_single_flight_coalesces_identical_calls():
+    """Concurrent calls with the same key share one execution"""
+    from app.core.single_flight import SingleFlight
+    
+    flight = SingleFlight("test")
+    calls = []
+    
+    async def call_model(answer):
+        calls.append(answer)
+        await asyncio.sleep(0.05)
+        return answer
+    
+    async def scenario():
+        return await asyncio.gather(
+            *[flight.do("same-prompt", lambda: call_model("A")) for _ in range(5)],
+            flight.do("other-prompt", lambda: call_model("B"))
+        )
+    
+    assert asyncio.run(scenario()) == ["A"] * 5 + ["B"]
+    assert sorted(calls) == ["A", "B"]
+    stats = flight.get_stats()
+    assert stats["calls"] == 2
+    assert stats["provider_calls_saved"] == 4
+    assert stats["in_flight"] == 0
+
+
+def test_single_flight_does_not_share_errors():
+    """A caller rejected by the provider (bad API key) does not fail the identical calls waiting on it"""
+    from app.core.single_flight import SingleFlight
+    
+    flight = SingleFlight("test-errors", use_redis=False)
+    calls = []
+    
+    async def call_model(api_key):
+        calls.append(api_key)
+        await asyncio.sleep(0.05)
+        if api_key == "bad-key":
+            raise Exception("Deepseek API error (401): invalid API key")
+        return f"answer for {api_key}"
+    
+    async def scenario():
+        return await asyncio.gather(
+            flight.do("same-prompt", lambda: call_model("bad-key")),
+            flight.do("same-prompt", lambda: call_model("good-key")),
+            flight.do("same-prompt", lambda: call_model("other-key")),
+            return_exceptions=True
+        )
+    
+    leader, *followers = asyncio.run(scenario())
+    assert "401" in str(leader)
+    assert followers == ["answer for good-key", "answer for other-key"]
+    assert sorted(calls) == ["bad-key", "good-key", "other-key"]
+    stats = flight.get_stats()
+    assert stats["own_calls"] == 2
+    assert stats["provider_calls_saved"] == 0
+
+
+def test_semantic_cache_paraphrase_persistence_and_eviction(tmp_path):
+    """Close rewordings hit, other languages and models miss, the index survives a reload"""
+    from app.core.semantic_cache import SemanticCache
+    
+    def answer(text):
+        return {"message": text, "conversation_id": "conv_1", "timestamp": time.time()}
+    
+    cache = SemanticCache(str(tmp_path), max_entries=2)
+    cache.add("Our homepage bounce rate is too high", "deepseek", "en", answer("Which pages?"))
+    
+    assert cache.lookup("our homepage bounce rate is way too high!", "deepseek", "en")["message"] == "Which pages?"
+    assert cache.lookup("Our homepage bounce rate is too high", "deepseek", "fr") is None
+    assert cache.lookup("Our homepage bounce rate is too high", "llama", "en") is None
+    assert cache.lookup("Our pricing page conversion is too low", "deepseek", "en") is None
+    cache.close()
+    
+    # Rechargement depuis le disque, puis éviction de l'entrée la moins récemment utilisée
+    cache = SemanticCache(str(tmp_path), max_entries=2)
+    assert cache.lookup("Our homepage bounce rate is too high", "deepseek", "en")["message"] == "Which pages?"
+    cache.add("Checkout conversion dropped last week", "deepseek", "en", answer("Since when?"))
+    cache.lookup("Checkout conversion dropped last week", "deepseek", "en")
+    cache.add("Mobile users abandon the signup form", "deepseek", "en", answer("At which step?"))
+    
+    assert cache.size == 2
+    assert cache.stats["evictions"] == 1
+    assert cache.lookup("Our homepage bounce rate is too high", "deepseek", "en") is None
+    assert cache.lookup("Checkout conversion dropped last week", "deepseek", "en")["message"] == "Since when?"
+    cache.close()
+
+
+def test_hypothesis_cache_degrades_to_memory_when_redis_fails(monkeypatch):
+    """A failing Redis opens the circuit: later lookups skip it and stay memory-only"""
+    from app.core import cache
+    from app.core.circuit_breaker import CircuitBreaker
+    from app.routers.hypothesis.models import HypothesisResponse
+    
+    class FailingRedis:
+        calls = 0
+        
+        async def get(self, key):
+            FailingRedis.calls += 1
+            raise TimeoutError("Timeout reading from socket")
+    
+    monkeypatch.setattr(cache, "redis_async", FailingRedis())
+    monkeypatch.setattr(cache, "redis_breaker", CircuitBreaker("redis", failure_threshold=2, reset_timeout=60))
+    
+    async def scenario():
+        results = [await cache.get_cached_response(f"missing-{i}") for i in range(5)]
+        response = HypothesisResponse(message="Bonjour", conversation_id="conv_1", timestamp=time.time())
+        cache.memory_cache["present"] = response
+        return results, await cache.get_cached_response("present")
+    
+    results, present = asyncio.run(scenario())
+    assert results == [None] * 5
+    assert present.message == "Bonjour"
+    assert FailingRedis.calls == 2
+    assert cache.redis_breaker.get_stats()["state"] == "open"
+    assert cache.redis_breaker.get_stats()["rejections"] == 3
+    
+    # Codec compact: aller-retour sans perte
+    assert HypothesisResponse(**cache.decode_payload(cache.encode_response(present))) == present
+
+
+def test_cache_warmer_prefetches_file_prompts_once(monkeypatch, tmp_path):
+    """Starter prompts are generated once per language with bounded concurrency, then served from cache"""
+    from app.core import cache
+    from app.core.config import Settings
+    from app.routers.hypothesis import cache_warmer as warmer_module
+    from app.routers.hypothesis.api_calls import build_hypothesis_response
+    
+    prompts_file = tmp_path / "warm_prompts.json"
+    prompts_file.write_text(json.dumps({
+        "en": ["How can I improve my checkout conversion rate?", "How can I improve my checkout conversion rate?"],
+        "fr": ["Comment améliorer le taux de conversion de ma page produit ?"],
+        "it": ["Come posso migliorare il mio sito?"]
+    }))
+    settings = Settings(DEEPSEEK_API_KEY="test-key", HF_API_KEY="")
+    
+    active, peak, calls = 0, 0, []
+    
+    async def fake_call(model, messages, conversation_id, detected_language, hf_api_key, deepseek_api_key, settings):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        calls.append((model, detected_language))
+        return build_hypothesis_response(f"Answer to: {messages[-1]['content']}", conversation_id, detected_language)
+    
+    monkeypatch.setattr(warmer_module, "call_generation_api", fake_call)
+    warmer = warmer_module.CacheWarmer()
+    
+    async def scenario():
+        first = await warmer.warm(models=["deepseek", "llama"], concurrency=1, path=str(prompts_file), settings=settings)
+        first = dict(first, last_run=dict(first["last_run"]))
+        second = await warmer.warm(models=["deepseek"], concurrency=1, path=str(prompts_file), settings=settings)
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    
+    # Doublons et langue non supportée ignorés, llama sans clé API ignoré
+    assert sorted(calls) == [("deepseek", "en"), ("deepseek", "fr")]
+    assert peak == 1
+    assert first["last_run"]["warmed"] == 2 and first["provider_calls"] == 2
+    assert first["estimated_tokens"] > 0
+    assert second["last_run"]["already_cached"] == 2 and second["provider_calls"] == 2
+    
+    messages, _ = warmer_module.build_generation_messages("How can I improve my checkout conversion rate?")
+    assert cache.memory_cache[cache.generate_cache_key(messages, "deepseek")].message.startswith("Answer to: How can I")
+
+
+def test_generate_stream_error_is_reported_and_not_cached(monkeypatch):
+    """An upstream failure mid-stream ends with an error event, and the partial answer is not cached"""
+    calls = []
+    
+    async def failing_stream(messages, api_key, api_url, model_type="deepseek-chat"):
+        calls.append(model_type)
+        yield "Quelle page "
+        raise Exception("Deepseek API error (500): upstream failure")
+    
+    monkeypatch.setattr(hypothesis_router, "stream_deepseek_content", failing_stream)
+    monkeypatch.setattr(hypothesis_router, "rate_limiter", RateLimiter(100, 60, name="test"))
+    payload = {"message": f"Failing stream test {time.time()}", "model": "deepseek", "api_keys": {"deepseek": "test-key"}}
+    
+    for _ in range(2):
+        response = client.post("/hypothesis/generate/stream?format=ndjson", json=payload)
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[0] == {"type": "delta", "content": "Quelle page "}
+        assert events[-1]["type"] == "error" and "500" in events[-1]["detail"]
+    assert len(calls) == 2
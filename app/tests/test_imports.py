@@ -0,0 +1,81 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.csv_import import CSVAggregator, CSVImportError
+
+client = TestClient(app)
+
+
+def test_csv_unbalanced_quote_is_rejected_once_the_record_is_too_long():
+    """An unbalanced quote does not buffer the rest of the upload: the record limit ends the import"""
+    aggregator = CSVAggregator(max_record_size=1000)
+    aggregator.feed(b"test_name,variation,visitors,conversions\nA,Control,10,1\nA,\"B,10,1\n")
+    with pytest.raises(CSVImportError, match="near line 3"):
+        for _ in range(100):
+            aggregator.feed(b"B,Control,10,1\n")
+    assert aggregator.row_count == 1
+
+
+def test_csv_errors_report_physical_line_numbers(monkeypatch):
+    """Line numbers count the physical lines of multi-line quoted fields"""
+    from app.core.config import settings
+    
+    monkeypatch.setattr(settings, "IMPORT_CHUNK_SIZE", 7)
+    csv_content = (
+        b'test_name,variation,visitors,conversions\n'
+        b'A,"multi\nline\nvariation",10,1\n'
+        b'A,Control,ten,1\n'
+    )
+    
+    response = client.post("/api/imports/upload/csv", files={"file": ("export.csv", csv_content, "text/csv")})
+    
+    assert response.status_code == 200
+    assert response.json()["errors"] == [{"line": 5, "error": "visitors and conversions must be integers"}]
+
+
+def test_csv_upload_rejects_unbalanced_quote(monkeypatch):
+    """The endpoint answers 400 instead of accumulating a malformed upload"""
+    from app.core.config import settings
+    
+    monkeypatch.setattr(settings, "IMPORT_MAX_RECORD_SIZE", 64)
+    csv_content = b'test_name,variation,visitors,conversions\nA,"B,1,0\n' + b"A,B,1,0\n" * 50
+    
+    response = client.post("/api/imports/upload/csv", files={"file": ("export.csv", csv_content, "text/csv")})
+    
+    assert response.status_code == 400 and "Malformed CSV near line 2" in response.json()["detail"]
+
+
+def test_csv_import_streams_and_aggregates(monkeypatch):
+    """The CSV is parsed in small chunks (quoted fields across chunks) and only aggregated totals are returned"""
+    from app.core.config import settings
+    
+    monkeypatch.setattr(settings, "IMPORT_CHUNK_SIZE", 16)
+    csv_content = (
+        "\ufefftest_name,variation,visitors,conversions,extra\n"
+        "Homepage,Control,1200,120,x\n"
+        "Homepage,\"Variation, \"\"B\"\"\nsecond line\",1180,130,y\n"
+        "Homepage,Control,800,80,z\n"
+        "Checkout,Control,10,20,bad\n"
+        "Checkout,Control,500,25,w"
+    ).encode("utf-8")
+    
+    response = client.post("/api/imports/upload/csv", files={"file": ("export.csv", csv_content, "text/csv")})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert "data" not in data
+    assert data["row_count"] == 5 and data["invalid_rows"] == 1
+    assert data["errors"] == [{"line": 6, "error": "conversions cannot exceed visitors"}]
+    assert data["totals"] == {"tests": 2, "variations": 3, "visitors": 3680, "conversions": 355}
+    homepage = data["tests"][0]
+    assert homepage["variations"][0] == {
+        "variation": "Control", "rows": 2, "visitors": 2000, "conversions": 200, "conversion_rate": 0.1
+    }
+    assert homepage["variations"][1]["variation"] == 'Variation, "B"\nsecond line'
+    
+    stored = client.get(f"/api/imports/datasets/{data['dataset_id']}")
+    assert stored.status_code == 200 and stored.json()["totals"] == data["totals"]
+    assert client.get("/api/imports/datasets/unknown").status_code == 404
+    
+    missing = client.post("/api/imports/upload/csv", files={"file": ("bad.csv", b"test_name,visitors\nA,1\n", "text/csv")})
+    assert missing.status_code == 400
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.metrics import CACHE_EVENTS, PROVIDER_REQUEST_SECONDS, registry
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_metrics_snapshots_survive_pid_reuse_and_are_folded_when_stale(monkeypatch, tmp_path):
+    """A restarted worker never overwrites a dead worker's totals, and stale snapshots are folded, not lost"""
+    monkeypatch.setattr(settings, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "METRICS_STALE_AFTER", 60)
+    
+    # Instantané d'un worker arrêté qui avait le même PID que ce worker
+    dead = tmp_path / f"worker_{os.getpid()}.json"
+    dead.write_text(json.dumps({"cache_events_total": [[["estimate", "miss"], 7]]}))
+    own = CACHE_EVENTS.value(cache="estimate", event="miss")
+    
+    registry.sync()
+    assert dead.exists()
+    assert CACHE_EVENTS.value(aggregate=True, cache="estimate", event="miss") == own + 7
+    
+    # Sans mise à jour depuis METRICS_STALE_AFTER: regroupé dans retired.json, le total ne recule pas
+    stale = time.time() - 120
+    os.utime(dead, (stale, stale))
+    registry.sync()
+    assert not dead.exists() and (tmp_path / "retired.json").exists()
+    assert [path.name for path in tmp_path.glob("worker_*.json")] == [f"worker_{registry.worker_id}.json"]
+    assert CACHE_EVENTS.value(aggregate=True, cache="estimate", event="miss") == own + 7
+
+
+def test_metrics_aggregate_reads_no_file(monkeypatch, tmp_path):
+    """Stats endpoints use the snapshots read by the last sync(), without touching the directory"""
+    monkeypatch.setattr(settings, "METRICS_DIR", str(tmp_path))
+    other = tmp_path / "worker_other.json"
+    other.write_text(json.dumps({"cache_events_total": [[["estimate", "store"], 3]]}))
+    own = CACHE_EVENTS.value(cache="estimate", event="store")
+    
+    registry.sync()
+    other.unlink()
+    assert CACHE_EVENTS.value(aggregate=True, cache="estimate", event="store") == own + 3
+
+
+def test_metrics_endpoint_aggregates_workers(monkeypatch, tmp_path):
+    """Counters and histograms are rendered for Prometheus and summed across worker snapshots"""
+    own = CACHE_EVENTS.value(cache="hypothesis", event="store")
+    CACHE_EVENTS.inc(cache="hypothesis", event="store")
+    PROVIDER_REQUEST_SECONDS.observe(0.3, provider="deepseek", status="200")
+    assert CACHE_EVENTS.value(cache="hypothesis", event="store") == own + 1
+    
+    # Instantané publié par un autre worker
+    monkeypatch.setattr(settings, "METRICS_DIR", str(tmp_path))
+    (tmp_path / "worker_1.json").write_text(json.dumps({"cache_events_total": [[["hypothesis", "store"], 5]]}))
+    registry.sync()
+    assert (tmp_path / "worker_1.json").exists() and len(list(tmp_path.glob("worker_*.json"))) == 2
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert "# TYPE cache_events_total counter" in body
+    assert f'cache_events_total{{cache="hypothesis",event="store"}} {int(own) + 6}' in body
+    assert 'llm_provider_request_seconds_bucket{provider="deepseek",status="200",le="0.25"}' in body
+    assert 'llm_provider_request_seconds_bucket{provider="deepseek",status="200",le="+Inf"}' in body
+    assert client.get("/hypothesis/cache-stats").json()["stores"] == own + 6
@@ -0,0 +1,86 @@
+import asyncio
+import importlib
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import rate_limiter as rate_limiter_module
+from app.services.rate_limiter import RateLimiter
+
+client = TestClient(app)
+
+
+def test_rate_limiter_gcra_headers_and_eviction(monkeypatch):
+    """GCRA allows the burst then rejects with Retry-After, and forgets idle clients"""
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(rate_limiter_module.settings, "RATE_LIMIT_SHARDS", 1)
+    limiter = RateLimiter(max_requests=3, time_window=60, name="test", backend="memory")
+    
+    async def scenario():
+        decisions = [await limiter.check("1.2.3.4") for _ in range(4)]
+        peek = await limiter.get_remaining("1.2.3.4")
+        other = await limiter.is_allowed("5.6.7.8")
+        clock[0] += 20  # un jeton regagné (une requête toutes les 20 s)
+        recovered = await limiter.check("1.2.3.4")
+        clock[0] += 121  # quota plein pour tous: clients oubliés au prochain passage
+        await limiter.check("9.9.9.9")
+        return decisions, peek, other, recovered
+    
+    decisions, peek, other, recovered = asyncio.run(scenario())
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert limiter.decision_headers(decisions[0]) == {
+        "RateLimit-Limit": "3", "RateLimit-Remaining": "2", "RateLimit-Reset": "20", "RateLimit-Policy": "3;w=60"
+    }
+    assert limiter.decision_headers(decisions[3])["Retry-After"] == "20"
+    assert peek == (0, 60)
+    assert other and recovered.allowed and recovered.remaining == 0
+    assert limiter.memory.size() == 1
+    
+    response = client.get("/hypothesis/rate-limit")
+    assert response.status_code == 200
+    assert response.headers["RateLimit-Limit"] == "10"
+    assert response.json()["backend"] == "memory"
+
+
+def test_rate_limiter_falls_back_to_memory_when_redis_fails(monkeypatch):
+    """With the Redis backend down, each worker keeps limiting in memory instead of allowing everything"""
+    from app.core.circuit_breaker import CircuitBreaker
+    
+    class FailingRedis:
+        async def eval(self, *args):
+            raise ConnectionError("Connection refused")
+    
+    monkeypatch.setattr(rate_limiter_module, "redis_async", FailingRedis())
+    monkeypatch.setattr(rate_limiter_module, "redis_breaker", CircuitBreaker("redis-test", failure_threshold=1, reset_timeout=60))
+    limiter = RateLimiter(max_requests=2, time_window=60, name="test", backend="redis")
+    assert limiter.backend == "redis"
+    
+    async def scenario():
+        return [await limiter.check("1.2.3.4") for _ in range(3)]
+    
+    assert [decision.allowed for decision in asyncio.run(scenario())] == [True, True, False]
+    assert rate_limiter_module.redis_breaker.get_stats()["state"] == "open"
+
+
+def test_generate_rejects_over_limit_with_retry_after(monkeypatch):
+    """Requests beyond the quota get a 429 with Retry-After, without any provider call"""
+    hypothesis_router = importlib.import_module("app.routers.hypothesis.router")
+    calls = []
+    
+    async def fake_generation(model, messages, conversation_id, detected_language, hf_api_key, deepseek_api_key, settings):
+        calls.append(conversation_id)
+        return hypothesis_router.build_hypothesis_response("Quelle page ?", conversation_id, detected_language)
+    
+    monkeypatch.setattr(hypothesis_router, "call_generation_api", fake_generation)
+    monkeypatch.setattr(hypothesis_router, "rate_limiter", RateLimiter(1, 60, name="test-limit", backend="memory"))
+    payload = {"message": f"Rate limit test {time.time()}", "model": "deepseek", "api_keys": {"deepseek": "test-key"}}
+    
+    assert client.post("/hypothesis/generate", json=payload).status_code == 200
+    rejected = client.post("/hypothesis/generate", json={**payload, "message": f"Other question {time.time()}"})
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) > 0
+    assert rejected.headers["RateLimit-Remaining"] == "0"
+    assert len(calls) == 1
@@ -57,4 +57,30 @@ export function getStatusColor(status: string): string {
   };
   
   return statusMap[status.toLowerCase()] || 'bg-gray-100 text-gray-800 border-gray-200';
-}
\ No newline at end of file
+}
+
+const CRC32_TABLE = (() => {
+  const table = new Uint32Array(256);
+  for (let n = 0; n < 256; n++) {
+    let c = n;
+    for (let k = 0; k < 8; k++) {
+      c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+    }
+    table[n] = c >>> 0;
+  }
+  return table;
+})();
+
+/**
+ * CRC32 of the UTF-8 encoding of a text, continuing a previous value (same as zlib.crc32)
+ * @param text Text to add
+ * @param crc CRC32 of the preceding text (0 to start)
+ * @returns Unsigned CRC32
+ */
+export function crc32(text: string, crc: number = 0): number {
+  let c = (crc ^ 0xffffffff) >>> 0;
+  for (const byte of new TextEncoder().encode(text)) {
+    c = CRC32_TABLE[(c ^ byte) & 0xff] ^ (c >>> 8);
+  }
+  return (c ^ 0xffffffff) >>> 0;
+}
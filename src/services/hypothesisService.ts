@@ -1,4 +1,5 @@
 import { Message, HypothesisApiResponse } from '../types/types';
+import { crc32 } from '../lib/utils';
 
 class HypothesisService {
   private apiUrl: string;
@@ -182,6 +183,8 @@ class HypothesisService {
       params.append('conversation_id', conversationId);
     }
     params.append('model', model);
+    // Protocole delta: le serveur n'envoie que les nouveaux fragments de raisonnement
+    params.append('protocol', 'delta');
     
     // Récupérer les clés API depuis localStorage
     const apiKeys = this.getApiKeys();
@@ -211,6 +214,12 @@ class HypothesisService {
     try {
       eventSource = new EventSource(url, eventSourceInitDict);
       
+      // Raisonnement reconstruit à partir des deltas
+      let reasoning = '';
+      let reasoningLength = 0;
+      let reasoningCrc = 0;
+      let lastSeq = 0;
+      
       // Variable pour suivre les reconnexions
       let retryCount = 0;
       const MAX_RETRIES = 3; // Augmenté pour plus de fiabilité
@@ -232,6 +241,38 @@ class HypothesisService {
           
           // Analyse des données JSON et transmission au callback
           const data = JSON.parse(event.data);
+          
+          if (data.reasoning_delta !== undefined) {
+            if (data.seq === 1) {
+              // Premier fragment (y compris après une reconnexion: le serveur recommence le flux)
+              reasoning = '';
+              reasoningLength = 0;
+              reasoningCrc = 0;
+            } else if (data.seq !== lastSeq + 1) {
+              console.warn(`Fragment de raisonnement manquant (seq ${lastSeq + 1} attendu, ${data.seq} reçu)`);
+            }
+            lastSeq = data.seq;
+            reasoning += data.reasoning_delta;
+            reasoningLength += Array.from(data.reasoning_delta as string).length;
+            reasoningCrc = crc32(data.reasoning_delta, reasoningCrc);
+            
+            if (data.reasoning_content !== undefined) {
+              // Instantané complet de fin: resynchronisation
+              reasoning = data.reasoning_content;
+              reasoningLength = data.reasoning_length;
+              reasoningCrc = crc32(reasoning);
+            } else if (
+              (data.reasoning_length !== undefined && data.reasoning_length !== reasoningLength) ||
+              (data.checksum !== undefined && parseInt(data.checksum, 16) !== reasoningCrc)
+            ) {
+              console.warn("Raisonnement incohérent (longueur ou somme de contrôle), attente de l'instantané final");
+            }
+            
+            // Les composants reçoivent toujours le texte cumulé
+            callback({ ...data, reasoning_content: reasoning });
+            return;
+          }
+          
           callback(data);
         } catch (error) {
           console.error("Erreur lors du parsing des données SSE:", error);
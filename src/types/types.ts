@@ -50,4 +50,8 @@ export interface ThinkingEvent {
   status: 'processing' | 'completed' | 'error';
   details?: string;
   reasoning_content?: string;
+  reasoning_delta?: string;
+  seq?: number;
+  reasoning_length?: number;
+  checksum?: string;
 } 
\ No newline at end of file